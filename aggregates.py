@@ -0,0 +1,81 @@
+"""Consistency checks for the trigger-maintained summary tables.
+
+summary_monthly and summary_refs are kept current by triggers on instruments
+and cashflows (see migration 5), maturity_calendar by triggers on instruments
+(migration 9), analytics_cube by triggers on both (migration 13). check() recomputes each from the base tables and reports any
+difference; rebuild() replaces them with the recomputed values.
+"""
+
+TOLERANCE = 1e-6
+
+EXPECTED = {
+    "summary_monthly": (
+        ("bank", "account_type", "saving_invested", "month_ordinal"),
+        ("total", "n"),
+        '''
+        SELECT IFNULL(i.bank, ''), IFNULL(i.account_type, ''), IFNULL(i.saving_invested, ''),
+               c.month_ordinal, TOTAL(c.amount), COUNT(*)
+        FROM cashflows c JOIN instruments i ON i.id = c.instrument_id
+        GROUP BY 1, 2, 3, 4
+        ''',
+    ),
+    "summary_refs": (
+        ("status", "account_type", "bank", "reference_name"),
+        ("n",),
+        '''
+        SELECT IFNULL(status, ''), IFNULL(account_type, ''), IFNULL(bank, ''),
+               IFNULL(reference_name, ''), COUNT(*)
+        FROM instruments
+        GROUP BY 1, 2, 3, 4
+        ''',
+    ),
+    "maturity_calendar": (
+        ("maturity_date", "instrument_id"),
+        ("investment_id", "reference_name", "bank", "account_type"),
+        '''
+        SELECT maturity_date, id, investment_id, reference_name, bank, account_type
+        FROM instruments
+        WHERE status = 'Open' AND maturity_date IS NOT NULL AND maturity_date != ''
+        ''',
+    ),
+    "analytics_cube": (
+        ("bank", "account_type", "saving_invested", "status", "month_ordinal"),
+        ("total", "n"),
+        '''
+        SELECT IFNULL(i.bank, ''), IFNULL(i.account_type, ''), IFNULL(i.saving_invested, ''),
+               IFNULL(i.status, ''), c.month_ordinal, TOTAL(c.amount), COUNT(*)
+        FROM cashflows c JOIN instruments i ON i.id = c.instrument_id
+        GROUP BY 1, 2, 3, 4, 5
+        ''',
+    ),
+}
+
+
+def _load(conn, sql, key_len):
+    return {tuple(row[:key_len]): tuple(row[key_len:]) for row in conn.execute(sql)}
+
+
+def _differs(want, got):
+    if isinstance(want, (int, float)) and isinstance(got, (int, float)):
+        return abs(want - got) > TOLERANCE
+    return want != got
+
+
+def check(conn):
+    """Return a list of (table, key, expected, actual) for every mismatched summary row."""
+    mismatches = []
+    for table, (keys, values, expected_sql) in EXPECTED.items():
+        expected = _load(conn, expected_sql, len(keys))
+        actual = _load(conn, f"SELECT {', '.join(keys + values)} FROM {table}", len(keys))
+        for key in expected.keys() | actual.keys():
+            want, got = expected.get(key), actual.get(key)
+            if want is None or got is None or any(_differs(w, g) for w, g in zip(want, got)):
+                mismatches.append((table, key, want, got))
+    return mismatches
+
+
+def rebuild(conn):
+    with conn:
+        for table, (keys, values, expected_sql) in EXPECTED.items():
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute(f"INSERT INTO {table} ({', '.join(keys + values)}) {expected_sql}")
@@ -0,0 +1,176 @@
+"""Rolling-window, year-over-year and cumulative figures from the analytics cube.
+
+analytics_cube (migration 13) holds cashflow totals per bank, account type,
+saving/invested, status and month, kept current by triggers. load() reads
+it into numpy arrays (a few thousand rows even for a large ledger), which
+current_cube() keeps until the data changes; report() then filters,
+groups and sums them into a dense group x period matrix, and the windows
+are differences of its cumulative sums.
+"""
+from collections import namedtuple
+from datetime import date
+
+import cache
+from db import get_db
+
+DIMENSIONS = ("bank", "account_type", "saving_invested", "status")
+MEASURES = ("total", "rolling", "yoy_delta", "yoy_pct", "cumulative")
+PERIODS = {"month": 1, "quarter": 3, "year": 12}
+DEFAULT_WINDOW = 12
+DEFAULT_MONTHS = 24
+MAX_PERIODS = 600
+
+# labels: {dimension: sorted distinct values}; codes: {dimension: index into labels per row}
+Cube = namedtuple("Cube", "labels codes months totals")
+
+
+def month_arg(value, default):
+    """'YYYY-MM' -> month ordinal (year * 12 + month index); blank -> ``default``."""
+    if not value:
+        return default
+    try:
+        year, month = (int(part) for part in value.split("-"))
+    except ValueError:
+        raise ValueError(f"invalid month: {value!r} (expected YYYY-MM)")
+    if not 1 <= month <= 12:
+        raise ValueError(f"invalid month: {value!r} (expected YYYY-MM)")
+    return year * 12 + month - 1
+
+
+def period_label(ordinal, period):
+    year, index = divmod(ordinal, 12)
+    if period == "year":
+        return str(year)
+    if period == "quarter":
+        return f"{year}-Q{index // 3 + 1}"
+    return f"{year}-{index + 1:02d}"
+
+
+def read_args(args, today=None):
+    """Report parameters from query args; raises ValueError for bad ones.
+
+    ``group_by`` is a subset of DIMENSIONS, comma-separated or repeated
+    (default bank; "none" for just the overall series), ``period`` is
+    month, quarter or year, ``window`` the rolling window in periods,
+    ``from``/``to`` YYYY-MM (default the last DEFAULT_MONTHS months), and
+    any of DIMENSIONS filters.
+    """
+    today = today or date.today()
+    raw = ",".join(args.getlist("group_by")) if hasattr(args, "getlist") else args.get("group_by")
+    group_by = [d.strip() for d in (raw or "bank").split(",") if d.strip() and d.strip() != "none"]
+    unknown = [d for d in group_by if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"unknown group_by: {', '.join(unknown)}")
+    period = args.get("period") or "month"
+    if period not in PERIODS:
+        raise ValueError(f"invalid period: {period!r}")
+    try:
+        window = int(args.get("window") or DEFAULT_WINDOW)
+    except ValueError:
+        raise ValueError(f"invalid window: {args.get('window')!r}")
+    if not 1 <= window <= MAX_PERIODS:
+        raise ValueError(f"invalid window: {window}")
+    end = month_arg(args.get("to"), today.year * 12 + today.month - 1)
+    start = month_arg(args.get("from"), end - DEFAULT_MONTHS + 1)
+    if start > end:
+        raise ValueError("from is after to")
+    filters = {d: args[d] for d in DIMENSIONS if args.get(d)}
+    return {"group_by": group_by, "period": period, "window": window,
+            "start": start, "end": end, "filters": filters}
+
+
+def load(conn):
+    """The whole analytics cube as a Cube of numpy arrays."""
+    import numpy as np
+
+    rows = conn.execute(f"SELECT {', '.join(DIMENSIONS)}, month_ordinal, total FROM analytics_cube").fetchall()
+    columns = list(zip(*rows)) or [()] * (len(DIMENSIONS) + 2)
+    labels, codes = {}, {}
+    for dimension, values in zip(DIMENSIONS, columns):
+        labels[dimension] = sorted(set(values))
+        lookup = {value: code for code, value in enumerate(labels[dimension])}
+        codes[dimension] = np.fromiter(map(lookup.__getitem__, values), dtype=np.int64, count=len(values))
+    return Cube(labels, codes, np.array(columns[-2], dtype=np.int64), np.array(columns[-1], dtype=float))
+
+
+def current_cube():
+    """load() of the current portfolio, memoized until its data changes."""
+    return cache.memoize("analytics_cube", lambda: load(get_db()))
+
+
+def _measures(dense, opening, back, window, lag):
+    """{measure: [[value per period] per row]} for the ``dense`` period totals after ``back`` look-back columns."""
+    import numpy as np
+
+    width = dense.shape[1]
+    sums = np.concatenate([np.zeros((len(dense), 1)), np.cumsum(dense, axis=1)], axis=1)
+    index = np.arange(back, width)
+    current, prior = dense[:, index], dense[:, index - lag]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(prior != 0, np.round((current - prior) / np.abs(prior) * 100, 1), np.nan)
+    figures = {
+        "total": np.round(current, 2),
+        "rolling": np.round(sums[:, index + 1] - sums[:, np.maximum(index + 1 - window, 0)], 2),
+        "yoy_delta": np.round(current - prior, 2),
+        "yoy_pct": pct,
+        "cumulative": np.round(opening[:, None] + sums[:, index + 1], 2),
+    }
+    # NaN (no prior year to compare with) becomes None / null
+    return {name: [[None if v != v else v for v in row] for row in values.tolist()]
+            for name, values in figures.items()}
+
+
+def report(cube, group_by=("bank",), period="month", window=DEFAULT_WINDOW, start=None, end=None, filters=None):
+    """Per-group series of each of MEASURES over the periods from ``start`` to ``end``.
+
+    ``cube`` comes from load(). ``start``/``end`` are month ordinals,
+    widened to whole periods. YoY compares with the same period a year
+    earlier; ``rolling`` sums the last ``window`` periods; ``cumulative`` is
+    the running total since the first cashflow.
+    """
+    import numpy as np
+
+    size = PERIODS[period]
+    start -= start % size
+    end += size - 1 - end % size
+    count = (end - start + 1) // size
+    if count > MAX_PERIODS:
+        raise ValueError(f"range too long: {count} periods (max {MAX_PERIODS})")
+    lag = 12 // size
+    back = max(window - 1, lag)
+    first = start - back * size
+
+    keep = cube.months <= end
+    for dimension, value in (filters or {}).items():
+        labels = cube.labels[dimension]
+        keep &= cube.codes[dimension] == (labels.index(value) if value in labels else -1)
+    months, totals = cube.months[keep], cube.totals[keep]
+    key = np.zeros(len(months), dtype=np.int64)
+    for dimension in group_by:
+        key = key * len(cube.labels[dimension]) + cube.codes[dimension][keep]
+    keys, group = np.unique(key, return_inverse=True)
+
+    dense = np.zeros((len(keys), back + count))
+    opening = np.zeros(len(keys))
+    early = months < first
+    np.add.at(dense, (group[~early], (months[~early] - first) // size), totals[~early])
+    np.add.at(opening, group[early], totals[early])
+
+    def decode(value):
+        parts = {}
+        for dimension in reversed(group_by):
+            value, code = divmod(value, len(cube.labels[dimension]))
+            parts[dimension] = cube.labels[dimension][code]
+        return {dimension: parts[dimension] for dimension in group_by}
+
+    grouped = _measures(dense, opening, back, window, lag)
+    overall = _measures(dense.sum(axis=0, keepdims=True), opening.sum(keepdims=True), back, window, lag)
+    return {
+        "group_by": list(group_by), "period": period, "window": window,
+        "from": period_label(start, period), "to": period_label(end, period),
+        "filters": dict(filters or {}),
+        "periods": [period_label(start + i * size, period) for i in range(count)],
+        "series": [{"key": decode(int(k)), **{name: grouped[name][row] for name in MEASURES}}
+                   for row, k in enumerate(keys)] if group_by else [],
+        "overall": {name: values[0] for name, values in overall.items()},
+    }
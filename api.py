@@ -0,0 +1,173 @@
+"""JSON API under /api/v1 for scripts and charts.
+
+Tables come back columnar, {"count": n, "columns": {name: [values...]}},
+which is smaller than a list of per-row objects and maps straight onto
+chart series. Every table endpoint takes ``fields=a,b,c`` to return only
+those columns. /investments takes the same filters as the records list.
+"""
+from datetime import date, datetime
+
+from flask import Blueprint, current_app, jsonify, request
+
+import analytics
+import cache
+import db
+import ladder
+import ledger
+import portfolios
+import records
+import summaries
+from db import get_db
+
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+INVESTMENT_FIELDS = [c.strip() for c in ledger.INVESTMENT_COLUMNS.split(",")]
+DEFAULT_MATURITY_LIMIT = 100
+
+
+@api.errorhandler(ValueError)
+def bad_request(e):
+    return jsonify(error=str(e)), 400
+
+
+@api.errorhandler(db.UnknownPortfolio)
+def unknown_portfolio(e):
+    return jsonify(error=f"unknown portfolio: {e}"), 404
+
+
+def selected_fields(available):
+    """Columns requested with ?fields=, in request order; all of them by default."""
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return fields or list(available)
+
+
+def columnar(columns, rows, fields=None):
+    fields = columns if fields is None else fields
+    index = [columns.index(f) for f in fields]
+    series = list(zip(*rows)) if rows else [()] * len(columns)
+    return {"count": len(rows), "columns": {columns[i]: list(series[i]) for i in index}}
+
+
+def tables(conn, queries, params=None):
+    """Run each named query; ?fields= keeps just those columns of every table."""
+    params = params or {}
+    results = {name: summaries.run(conn, sql, params.get(name, ())) for name, sql in queries.items()}
+    available = {column for columns, _ in results.values() for column in columns}
+    wanted = set(selected_fields(available)) if request.args.get("fields") else None
+    return {
+        name: columnar(columns, rows, None if wanted is None else [c for c in columns if c in wanted])
+        for name, (columns, rows) in results.items()
+    }
+
+
+@api.route("/investments")
+def investments():
+    """One page of year-rows, filtered like the records list.
+
+    Takes the index() filters plus ``after``, ``page_size`` and ``fields``;
+    monthly totals over the whole filter are included on the first page.
+    """
+    fields = selected_fields(INVESTMENT_FIELDS)
+    filters = records.read_filters(request.args)
+    after = request.args.get("after", "")
+    page_size = records.page_size_arg(request.args.get("page_size"), current_app.config["RECORDS_PAGE_SIZE"])
+    conn = get_db()
+    rows, next_cursor = records.fetch_page(conn, filters, after, page_size)
+    payload = columnar(INVESTMENT_FIELDS, rows, fields)
+    payload["next_cursor"] = next_cursor
+    if not after:
+        payload["monthly_totals"] = dict(zip(ledger.MONTHS, records.monthly_totals(conn, filters)))
+    return jsonify(payload)
+
+
+@api.route("/maturities")
+def maturities():
+    """Instruments maturing from ``start_date`` (default today), soonest first.
+
+    Filters on bank, account_type, saving_invested, status (default Open),
+    start_date/end_date and q like the records list; ``limit`` caps the rows.
+    """
+    filters = records.read_filters(request.args)
+    filters["status"] = filters["status"] or "Open"
+    filters["start_date"] = filters["start_date"] or datetime.now().date().isoformat()
+    limit = records.page_size_arg(request.args.get("limit"), DEFAULT_MATURITY_LIMIT)
+    where, params = records.instrument_conditions(filters)
+    columns, rows = summaries.run(get_db(), f"""
+        SELECT i.investment_id, i.reference_name, i.bank, i.account_type, i.status, i.maturity_date
+        FROM instruments i
+        WHERE {where} AND i.maturity_date IS NOT NULL AND i.maturity_date != ''
+        ORDER BY i.maturity_date, i.reference_name
+        LIMIT ?
+    """, params + [limit])
+    return jsonify(columnar(columns, rows, selected_fields(columns)))
+
+
+@api.route("/ladder")
+def maturity_ladder():
+    """Maturities bucketed by ``bucket`` (week, month, quarter) and bank.
+
+    ``start``/``end`` default to today and a year on; bank and account_type filter.
+    """
+    bucket, start, end, filters = ladder.read_args(request.args)
+    rows = ladder.ladder(get_db(), bucket, start, end, filters)
+    columns = ["bucket", "bank", "count", "principal"]
+    payload = {"bucket": bucket, "start": start.isoformat(), "end": end.isoformat()}
+    payload.update(columnar(columns, rows, selected_fields(columns)))
+    return jsonify(payload)
+
+
+@api.route("/dashboard")
+@cache.cached_page()
+def dashboard():
+    return jsonify(tables(get_db(), summaries.DASHBOARD))
+
+
+@api.route("/bank_summary")
+@cache.cached_page(vary=lambda: request.args.get("month") or datetime.now().month)
+def bank_summary():
+    """Saving/invested totals per bank and year, plus one month's totals.
+
+    ``month`` (1-12) picks the month for the "current" table; default is
+    this month.
+    """
+    try:
+        month = int(request.args.get("month") or datetime.now().month)
+    except ValueError:
+        raise ValueError(f"invalid month: {request.args['month']!r}")
+    if not 1 <= month <= 12:
+        raise ValueError(f"invalid month: {month}")
+    return jsonify(tables(get_db(), summaries.BANK_SUMMARY, {"current": (month - 1,)}))
+
+
+@api.route("/analytics")
+@cache.cached_page(vary=date.today)
+def analytics_report():
+    """Rolling, year-over-year and cumulative totals per group; see analytics.read_args()."""
+    return jsonify(analytics.report(analytics.current_cube(), **analytics.read_args(request.args)))
+
+
+@api.route("/portfolios")
+def portfolio_list():
+    """Every portfolio with its instrument count."""
+    counts = portfolios.fan_out(lambda conn: conn.execute("SELECT COUNT(*) FROM instruments").fetchone()[0])
+    return jsonify(current=db.current_portfolio(), portfolios=[
+        {"name": name, "instruments": count} for name, count in counts.items()
+    ])
+
+
+@api.route("/portfolios/summary")
+def portfolio_summary():
+    """Open counts, yearly totals and valuation per portfolio and combined.
+
+    ``portfolios=a,b`` limits the report to those portfolios; ``as_of``
+    (ISO date, default today) is the valuation date. The portfolios are
+    read in parallel.
+    """
+    names = portfolios.selected(request.args.get("portfolios"))
+    as_of = ladder.date_arg(request.args.get("as_of"), None)
+    per_portfolio, combined = portfolios.combined_summary(names, as_of)
+    return jsonify(portfolios=per_portfolio, combined=combined)
@@ -1,214 +1,352 @@
-from flask import Flask, render_template, request, redirect, send_file
-import sqlite3
-import pandas as pd
-from datetime import datetime
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
+import functools
+import json
+import os
+
+import click
+from flask import (Flask, Response, g, render_template, request, redirect, send_file, jsonify,
+                   stream_with_context, url_for)
+import aggregates
+import analytics
+import api
+import cache
+import db
+import exports
+import history
+import imports
+import jobs
+import ladder
+import ledger
+import maturity
+import metrics
+import migrations
+import query_plans
+import records
+import rendering
+import schedule
+import summaries
+import valuation
+from db import get_db
+from datetime import date, datetime
 
 
-def calculate_rd_monthly_values(start_year, start_month_name, start_value, maturity_date_str, increment):
-    month_names = ['jan','feb','mar','apr','may','jun','jul','aug','sep','oct','nov','dec']
-    monthly_values = {}
-    start_date = datetime(start_year, month_names.index(start_month_name) + 1, 1)
-    end_date = datetime.strptime(maturity_date_str, "%Y-%m-%d")
-    current_value = start_value
+app = Flask(__name__)
+app.json.sort_keys = False   # keep JSON columns in query order
+app.config["RECORDS_PAGE_SIZE"] = int(os.environ.get("RECORDS_PAGE_SIZE", records.DEFAULT_PAGE_SIZE))
+# memory (per worker), file[:<dir>] (shared by all workers) or off
+app.config["RESPONSE_CACHE"] = os.environ.get("RESPONSE_CACHE", "memory")
+app.config["RESPONSE_CACHE_TTL"] = int(os.environ.get("RESPONSE_CACHE_TTL", cache.DEFAULT_TTL))
+# request/SQL/template timings at /metrics; off by default
+app.config["METRICS"] = os.environ.get("METRICS", "off").lower() in ("1", "on", "true")
+app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", metrics.SLOW_QUERY_MS))
+# background exports/reports: worker threads per serving process (0 = run `flask run-jobs` instead)
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", 1))
+app.config["JOB_ARTIFACTS"] = os.environ.get("JOB_ARTIFACTS", jobs.DEFAULT_ARTIFACTS_DIR)
+app.config["JOB_TTL_HOURS"] = float(os.environ.get("JOB_TTL_HOURS", jobs.DEFAULT_TTL_HOURS))
+# production: compiled-template cache, no template reloads, long-lived static files
+app.config["RENDER_MODE"] = os.environ.get("RENDER_MODE", "development" if app.debug else "production")
+app.config["TEMPLATE_CACHE_DIR"] = os.environ.get("TEMPLATE_CACHE_DIR")
+# templates slower than this are logged (0 = off)
+app.config["TEMPLATE_BUDGET_MS"] = float(os.environ.get("TEMPLATE_BUDGET_MS", rendering.DEFAULT_BUDGET_MS))
+app.config["COMPRESS"] = os.environ.get("COMPRESS", "on").lower() in ("1", "on", "true")
+db.init_app(app)
+cache.init_app(app)
+metrics.init_app(app)
+rendering.init_app(app)
+app.register_blueprint(api.api)
 
-    while start_date <= end_date:
-        m = start_date.strftime("%b").lower()
-        y = start_date.year
-        key = f"{y}-{m}"
-        monthly_values[key] = current_value
-        current_value += increment
-        start_date += relativedelta(months=1)
+def init_db():
+    """Bring every portfolio's database up to the current schema."""
+    for portfolio in db.portfolios():
+        conn = db.connect(db.portfolio_path(portfolio))
+        try:
+            migrations.migrate(conn)
+        finally:
+            conn.close()
 
-    # ✅ Debug print — add this before return
-    print("Generated RD values:")
-    for k, v in monthly_values.items():
-        print(f"{k}: {v}")
+init_db()
 
-    return monthly_values
 
+def start_background():
+    """Start the maturity scheduler and job workers in a serving process.
+
+    Matured investments are closed by a background sweep instead of on
+    every page view; set MATURITY_SCHEDULER=off when running `flask
+    sweep-maturities` from cron instead. Called by the gunicorn hook in
+    gunicorn.conf.py and by `python app.py`, never on import, so CLI
+    commands don't claim jobs they won't finish.
+    """
+    if os.environ.get("MATURITY_SCHEDULER", "on").lower() not in ("0", "off", "false"):
+        maturity.start_scheduler()
+    if app.config["JOB_WORKERS"] > 0:
+        jobs.start_workers(app.config["JOB_WORKERS"], app.config["JOB_ARTIFACTS"], app.config["JOB_TTL_HOURS"])
+
+
+@app.cli.command("sweep-maturities")
+@click.option("--force", is_flag=True, help="Sweep even if today's sweep already ran.")
+def sweep_maturities_command(force):
+    """Close investments whose maturity date has passed, in every portfolio, and take
+    any monthly history snapshot that is due."""
+    for portfolio in db.portfolios():
+        conn = db.connect(db.portfolio_path(portfolio))
+        try:
+            state = maturity.sweep(conn, force=force)
+            history.snapshot_if_due(conn)
+        finally:
+            conn.close()
+        if state is None:
+            click.echo(f"{portfolio}: already swept today; use --force to run again.")
+        else:
+            click.echo(f"{portfolio}: closed {state['last_rows']} rows in {state['last_duration_ms']} ms")
 
 
+@app.cli.command("check-aggregates")
+@click.option("--repair", is_flag=True, help="Rebuild the summary tables if they have drifted.")
+@click.option("--portfolio", default=db.DEFAULT_PORTFOLIO, show_default=True)
+def check_aggregates_command(repair, portfolio):
+    """Recompute the dashboard summary tables from scratch and diff them."""
+    conn = db.connect(db.portfolio_path(portfolio))
+    try:
+        mismatches = aggregates.check(conn)
+        for table, key, expected, actual in mismatches:
+            click.echo(f"{table} {key}: expected {expected}, found {actual}")
+        if mismatches and repair:
+            aggregates.rebuild(conn)
+            click.echo("Summary tables rebuilt.")
+    finally:
+        conn.close()
+    if not mismatches:
+        click.echo("Summary tables are consistent.")
+    elif not repair:
+        raise SystemExit(1)
+
+
+@app.cli.command("check-query-plans")
+@click.option("--portfolio", default=db.DEFAULT_PORTFOLIO, show_default=True)
+def check_query_plans_command(portfolio):
+    """Fail if a records-list, filter or other hot-path query plans a full table scan."""
+    conn = db.connect(db.portfolio_path(portfolio))
+    try:
+        problems = query_plans.check(conn)
+    finally:
+        conn.close()
+    for case, sql, step in problems:
+        click.echo(f"{case}: {step}\n    {sql[:200]}")
+    if problems:
+        raise SystemExit(1)
+    click.echo("No full table scans in the checked queries.")
+
+
+@app.cli.command("run-jobs")
+@click.option("--workers", default=1, show_default=True, help="Worker threads.")
+def run_jobs_command(workers):
+    """Run queued export/report jobs in the foreground until interrupted."""
+    threads = jobs.start_workers(workers, app.config["JOB_ARTIFACTS"], app.config["JOB_TTL_HOURS"])
+    click.echo(f"Running {len(threads)} job workers; Ctrl+C to stop.")
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        jobs.stop_workers()
 
-app = Flask(__name__)
-DB = 'data.db'
 
-def init_db():
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS investments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                investment_id INTEGER,
-                reference_name TEXT,
-                bank TEXT,
-                account_type TEXT,
-                saving_invested TEXT,
-                status TEXT,
-                year INTEGER,
-                maturity_date TEXT,
-                jan REAL, feb REAL, mar REAL, apr REAL, may REAL, jun REAL,
-                jul REAL, aug REAL, sep REAL, oct REAL, nov REAL, dec REAL,
-                notepad TEXT
-            )
-        ''')
-        cursor.execute('''
-    CREATE TABLE IF NOT EXISTS options (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        type TEXT,         
-        value TEXT UNIQUE
-    )
-''')
+@app.cli.command("create-portfolio")
+@click.argument("name")
+def create_portfolio_command(name):
+    """Create an empty portfolio database in PORTFOLIO_DIR."""
+    try:
+        path = db.new_portfolio_path(name)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if os.path.exists(path):
+        raise click.ClickException(f"portfolio {name} already exists at {path}")
+    conn = db.connect(path)
+    try:
+        migrations.migrate(conn)
+    finally:
+        conn.close()
+    click.echo(f"Created portfolio {name} at {path}")
+
+
+@app.cli.command("snapshot")
+@click.option("--list", "list_only", is_flag=True, help="List the stored snapshots instead.")
+@click.option("--portfolio", default=None, help="Only this portfolio (default: all).")
+def snapshot_command(list_only, portfolio):
+    """Store a compressed snapshot of the ledger for point-in-time (?as_of=) reads."""
+    for name in [portfolio] if portfolio else db.portfolios():
+        conn = db.connect(db.portfolio_path(name))
+        try:
+            if list_only:
+                for snapshot_id, taken_at, seq, encoding, size, stored in history.snapshots(conn):
+                    click.echo(f"{name}: #{snapshot_id} {taken_at} seq {seq}, {size} bytes, {stored} as {encoding}")
+                continue
+            info = history.snapshot(conn)
+        finally:
+            conn.close()
+        click.echo(f"{name}: snapshot #{info['id']} at seq {info['seq']}, {info['size']} bytes, "
+                   f"{info['stored']} stored, {info['duration_ms']} ms")
+
+
+@app.cli.command("import-statement")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--dry-run", is_flag=True, help="Validate and report without writing.")
+@click.option("--map", "mapping", default="", help="Column mapping, e.g. 'Ref=reference_name,Amt=jan'.")
+@click.option("--add-options", is_flag=True, help="Add unknown banks and account types to the options.")
+@click.option("--portfolio", default=db.DEFAULT_PORTFOLIO, show_default=True)
+def import_statement_command(path, dry_run, mapping, add_options, portfolio):
+    """Import a CSV or XLSX statement into a portfolio."""
+    conn = db.connect(db.portfolio_path(portfolio))
+    try:
+        report = imports.run_file(conn, path, dry_run=dry_run, mapping=imports.parse_mapping(mapping),
+                                  add_options=add_options)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+    click.echo(json.dumps(report, indent=2))
+    if report["invalid_rows"]:
+        raise SystemExit(1)
+
+
+@app.route("/portfolio/<name>")
+def select_portfolio(name):
+    """Make ``name`` the portfolio for this browser's later requests."""
+    try:
+        db.portfolio_path(name)
+    except db.UnknownPortfolio:
+        return f"Unknown portfolio: {name}", 404
+    except ValueError as e:
+        return f"Error: {e}", 400
+    response = redirect("/")
+    response.set_cookie("portfolio", name, max_age=365 * 24 * 3600, samesite="Lax")
+    return response
+
+
+@app.context_processor
+def portfolio_context():
+    return {"portfolio": db.current_portfolio(), "portfolios": db.portfolios()}
+
+
+@app.route("/sweep_status")
+def sweep_status():
+    return jsonify(maturity.read_state(get_db()))
+
+
+@app.route("/cache_stats")
+def cache_stats():
+    return jsonify(cache.stats())
+
+
+def load_options():
+    """(banks, account_types) for the dropdowns, cached until options change."""
+    def query():
+        conn = get_db()
+        banks = [row[0] for row in conn.execute("SELECT value FROM options WHERE type='bank' ORDER BY value")]
+        account_types = [row[0] for row in conn.execute(
+            "SELECT value FROM options WHERE type='account_type' ORDER BY value")]
+        return banks, account_types
+    return cache.memoize("options", query)
+
+def optional_number(val, cast=float):
+    """cast(val), or None for a blank/missing field."""
+    if val is None or str(val).strip() == "":
+        return None
+    return cast(val)
+
+
+def read_entry(data, options):
+    """Turn one submitted investment (the add or update form, or an item of
+    a bulk import) into a ledger.Entry with all of its year-rows built.
+
+    Fields are checked like a statement row (imports.parse_row): bank and
+    account type against ``options`` (see imports.load_options), the
+    enumerations, year, amounts and dates. Raises ValueError.
+    """
+    if not hasattr(data, "get"):
+        raise ValueError("expected an object")
+    row = imports.parse_row([data.get(field) for field in imports.FIELDS],
+                            dict(enumerate(imports.FIELDS)), options)
+    account_type = row["account_type"]
+    start_year = row["year"]
+    maturity_date_str = row["maturity_date"]
+    status = row["status"]
+    if account_type.lower() == "savings":
+        status = "Open"
+
+    month_values = row["months"]
+    fields = {
+        "reference_name": row["reference_name"], "bank": row["bank"],
+        "account_type": account_type, "saving_invested": row["saving_invested"],
+        "status": status, "maturity_date": maturity_date_str,
+        "notepad": row["notepad"], "start_year": start_year,
+        "interest_rate": row["interest_rate"], "compounding": row["compounding"],
+    }
 
-init_db()
+    # --- RD / FD / NSC multi-year schedule ---
+    if account_type in schedule.SCHEDULED_TYPES:
+        increment = (optional_number(data.get("rd_increment")) or 0.0) if account_type == "RD" else 0.0
+        year_rows = schedule.build(account_type, start_year, month_values, maturity_date_str, increment)
+        if year_rows == []:
+            raise ValueError("maturity date is before the first deposit")
+        if year_rows:
+            # FD/NSC entries replace any earlier entry under the same reference
+            return ledger.Entry(None, fields, year_rows, replaces_reference=account_type != "RD")
 
-def safe_float(val):
-    try:
-        return float(val)
-    except (ValueError, TypeError):
-        return 0.0
+    # --- Single-record entry for other account types ---
+    return ledger.Entry(None, fields, [(start_year, month_values)])
 
-def update_expired_statuses():
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE investments
-            SET status = 'Closed'
-            WHERE maturity_date IS NOT NULL
-              AND maturity_date != ''
-              AND maturity_date < DATE('now')
-              AND status != 'Closed'
-        ''')
-        conn.commit()
 
-def get_upcoming_maturities(limit=4):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT reference_name, bank, account_type, MIN(maturity_date) AS earliest_date
-            FROM investments
-            WHERE maturity_date IS NOT NULL AND maturity_date != ''
-              AND maturity_date >= DATE('now')
-            GROUP BY reference_name
-            ORDER BY earliest_date ASC
-            LIMIT ?
-        ''', (limit,))
-        rows = cursor.fetchall()
-        formatted = []
-        for r in rows:
-            try:
-                dt = pd.to_datetime(r[3])
-                formatted_date = dt.strftime('%d%b%y')
-            except:
-                formatted_date = r[3]
-            formatted.append((r[0], r[1], r[2], formatted_date))
-        return formatted
-    
-    
+def ledger_at(as_of):
+    """(connection, date) to read the ledger from: the live database, or for an
+    ``as_of`` (see history.parse_as_of) the ledger restored to that moment.
+
+    Restored copies are closed when the request ends. Raises ValueError for
+    a bad ``as_of`` or one from before the history starts.
+    """
+    if not as_of:
+        return get_db(), date.today()
+    bound, day = history.parse_as_of(as_of)
+    conn = history.restore(get_db(), bound)
+    g.setdefault("restored", []).append(conn)
+    return conn, day
+
+
+@app.teardown_appcontext
+def close_restored(exception):
+    for conn in g.pop("restored", []):
+        conn.close()
+
+
+def get_upcoming_maturities(limit=4, conn=None, start=None):
+    formatted = []
+    for r in ladder.upcoming(conn or get_db(), limit, start):
+        try:
+            formatted_date = date.fromisoformat(r[3]).strftime('%d%b%y')
+        except (TypeError, ValueError):
+            formatted_date = r[3]
+        formatted.append((r[0], r[1], r[2], formatted_date))
+    return formatted
+
 
 @app.route("/update/<int:record_id>", methods=["GET", "POST"])
 @app.route("/update/<int:id>", methods=["GET", "POST"])
 def update(id):
     if request.method == "POST":
         try:
-            reference_name = request.form["reference_name"]
-            bank = request.form["bank"]
-            account_type = request.form["account_type"]
-            saving_invested = request.form["saving_invested"]
-            status = request.form["status"]
-            start_year = int(request.form["year"])
-            notepad = request.form["notepad"]
-            maturity_date_str = request.form.get("maturity_date", "")
-
-            month_keys = ["jan", "feb", "mar", "apr", "may", "jun",
-                          "jul", "aug", "sep", "oct", "nov", "dec"]
-            raw_values = [request.form.get(m) for m in month_keys]
-            month_values = [safe_float(v) for v in raw_values]
-
-            with sqlite3.connect(DB) as conn:
-                cursor = conn.cursor()
-
-                if account_type == "RD":
-                    
-                    maturity_date = pd.to_datetime(maturity_date_str)
-                    end_year = maturity_date.year
-
-                    start_month_name = None
-                    start_value = None
-                    for m, v in zip(month_keys, month_values):
-                        if v > 0:
-                            start_month_name = m
-                            start_value = v
-                            break
-
-                    if start_month_name and start_value:
-                        increment = safe_float(request.form.get("rd_increment", "0"))
-                        full_values = calculate_rd_monthly_values(start_year, start_month_name, start_value, maturity_date_str,increment)
-                        with sqlite3.connect(DB) as conn:
-                            cursor = conn.cursor()
-
-                        # Delete old RD rows
-                        cursor.execute("DELETE FROM investments WHERE investment_id=?", (id,))
-
-                        # Insert updated RD rows
-                       
-                        for year in range(start_year, end_year + 1):
-                            year_values = {m: 0 for m in month_keys}
-                            has_data = False
-                            
-                            for m in month_keys:
-                                key = f"{year}-{m}"
-                                
-                                
-                                if key in full_values:
-                                
-                                    year_values[m] = full_values[key]
-                                    has_data = True
-                            if has_data:
-                                data = (
-                                    id, reference_name, bank, account_type, saving_invested, status,
-                                    year, maturity_date_str,
-                                    *[year_values[m] for m in month_keys], notepad
-                            )
-                            cursor.execute('''
-                                INSERT INTO investments (
-                                    investment_id, reference_name, bank, account_type, saving_invested, status,
-                                    year, maturity_date,
-                                    jan, feb, mar, apr, may, jun,
-                                    jul, aug, sep, oct, nov, dec,
-                                    notepad
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', data)
-                else:
-                    # Update single row for non-RD
-                    cursor.execute('''
-                        UPDATE investments SET
-                            reference_name=?, bank=?, account_type=?, saving_invested=?, status=?, year=?, maturity_date=?,
-                            jan=?, feb=?, mar=?, apr=?, may=?, jun=?,
-                            jul=?, aug=?, sep=?, oct=?, nov=?, dec=?, notepad=?
-                        WHERE investment_id=?
-                    ''', (
-                        reference_name, bank, account_type, saving_invested, status, start_year, maturity_date_str,
-                        *month_values, notepad, id
-                    ))
-
-                conn.commit()
+            # the same parsing and schedule engine as a new entry, so an
+            # RD/FD/NSC keeps every year up to maturity
+            entry = read_entry(request.form, imports.load_options(get_db()))
+            ledger.write_batch(get_db(), [entry._replace(investment_id=id, replaces_reference=False)])
             return redirect("/")
-        except Exception as e:
+        except ValueError as e:
             return f"Update Error: {e}", 400
 
     # GET method: load all rows for this investment_id
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM investments WHERE investment_id=?", (id,))
-        records = cursor.fetchall()
+    with get_db() as conn:
+        records, terms = ledger.read_investment(conn, id)
 
-        # also fetch dynamic options
-        cursor.execute("SELECT value FROM options WHERE type='bank' ORDER BY value")
-        banks = [row[0] for row in cursor.fetchall()]
-        cursor.execute("SELECT value FROM options WHERE type='account_type' ORDER BY value")
-        account_types = [row[0] for row in cursor.fetchall()]
+    # also fetch dynamic options
+    banks, account_types = load_options()
 
     record = records[0] if records else None
 
@@ -216,6 +354,9 @@ def update(id):
         "update.html",
         record=record,
         records=records,
+        interest_rate=terms[0],
+        compounding=terms[1],
+        compounding_choices=valuation.COMPOUNDING_CHOICES,
         banks=banks,
         account_types=account_types
     )
@@ -223,316 +364,325 @@ def update(id):
 
 @app.route("/delete_by_ref/<reference_name>")
 def delete_by_ref(reference_name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM investments WHERE reference_name = ?", (reference_name,))
-        conn.commit()
+    with get_db() as conn:
+        ledger.delete_by_reference(conn, reference_name)
     return redirect("/")
 
 @app.route("/", methods=["GET", "POST"])
 @app.route("/", methods=["GET", "POST"])
 def index():
-    update_expired_statuses()
-
     if request.method == "POST":
         try:
-            reference_name = request.form.get("reference_name") or f"INV-{int(datetime.now().timestamp())}"
-            bank = request.form["bank"]
-            account_type = request.form["account_type"]
-            saving_invested = request.form["saving_invested"]
-            status = request.form["status"]
-            start_year = int(request.form["year"])
-            notepad = request.form["notepad"]
-            investment_id = int(datetime.now().timestamp())
-            maturity_date_str = request.form.get("maturity_date", "")
-
-            if account_type.lower() == "savings":
-                status = "Open"
-
-            month_keys = ["jan", "feb", "mar", "apr", "may", "jun",
-                          "jul", "aug", "sep", "oct", "nov", "dec"]
-            raw_values = [request.form.get(m) for m in month_keys]
-            month_values = [safe_float(v) for v in raw_values]
-
-            # --- RD multi-year insert logic ---
-            if account_type == "RD":
-                maturity_date = pd.to_datetime(maturity_date_str)
-                end_year = maturity_date.year
-
-                start_month_name = None
-                start_value = None
-                for m, v in zip(month_keys, month_values):
-                    if v > 0:
-                        start_month_name = m
-                        start_value = v
-                        break
-
-                if start_month_name and start_value:
-                    increment = safe_float(request.form.get("rd_increment", "0"))
-                    full_values = calculate_rd_monthly_values(start_year, start_month_name, start_value, maturity_date_str,increment)
-
-                    with sqlite3.connect(DB) as conn:
-                        cursor = conn.cursor()
-                        for year in range(start_year, end_year + 1):
-                            year_values = {m: 0 for m in month_keys}
-                            has_data = False
-                            for m in month_keys:
-                                
-                                key = f"{year}-{m}"
-                                if key in full_values:
-        
-                                    year_values[m] = full_values.get(key,0)
-
-                                    has_data = True
-                                    if has_data:
-                                        data = (
-                                            investment_id, reference_name, bank, account_type, saving_invested, status,
-                                            year, maturity_date_str,
-                                            *[year_values[m] for m in month_keys], notepad
-                                        )
-                            cursor.execute('''
-                                INSERT INTO investments (
-                                    investment_id, reference_name, bank, account_type, saving_invested, status,
-                                    year, maturity_date,
-                                    jan, feb, mar, apr, may, jun,
-                                    jul, aug, sep, oct, nov, dec,
-                                    notepad
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', data)
-                    return redirect("/")
-
-            # --- FD & NSC multi-year insert logic ---
-            elif account_type in ["FD", "NSC"]:
-                maturity_date = pd.to_datetime(maturity_date_str)
-                end_year = maturity_date.year
-                end_month = maturity_date.month
-
-                start_month = None
-                start_value = None
-                for i, v in enumerate(month_values):
-                    if v > 0:
-                        start_month = i + 1
-                        start_value = v
-                        break
-
-                if start_month and start_value is not None:
-                    with sqlite3.connect(DB) as conn:
-                        cursor = conn.cursor()
-                        cursor.execute("DELETE FROM investments WHERE reference_name=?", (reference_name,))
-                        for year in range(start_year, end_year + 1):
-                            year_values = {m: 0 for m in month_keys}
-                            for i, m in enumerate(month_keys):
-                                month_index = i + 1
-                                if (year == start_year and month_index >= start_month) or \
-                                   (year == end_year and month_index <= end_month) or \
-                                   (start_year < year < end_year):
-                                    year_values[m] = start_value
-
-                            data = (
-                                investment_id, reference_name, bank, account_type, saving_invested, status,
-                                year, maturity_date_str,
-                                *[year_values[m] for m in month_keys], notepad
-                            )
-                            cursor.execute('''
-                                INSERT INTO investments (
-                                    investment_id, reference_name, bank, account_type, saving_invested, status,
-                                    year, maturity_date,
-                                    jan, feb, mar, apr, may, jun,
-                                    jul, aug, sep, oct, nov, dec,
-                                    notepad
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            ''', data)
-                    return redirect("/")
-
-            # --- Single-record insert for other account types ---
-            with sqlite3.connect(DB) as conn:
-                cursor = conn.cursor()
-                data = (
-                    investment_id, reference_name, bank, account_type, saving_invested, status,
-                    start_year, maturity_date_str,
-                    *month_values, notepad
-                )
-                cursor.execute('''
-                    INSERT INTO investments (
-                        investment_id, reference_name, bank, account_type, saving_invested, status,
-                        year, maturity_date,
-                        jan, feb, mar, apr, may, jun,
-                        jul, aug, sep, oct, nov, dec,
-                        notepad
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', data)
+            ledger.write_batch(get_db(), [read_entry(request.form, imports.load_options(get_db()))])
             return redirect("/")
-
         except Exception as e:
             return f"Error: {e}", 400
 
         # --- GET method: filter and display records ---
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM options WHERE type='bank' ORDER BY value")
-        banks = [row[0] for row in cursor.fetchall()]
-
-        cursor.execute("SELECT value FROM options WHERE type='account_type' ORDER BY value")
-        account_types = [row[0] for row in cursor.fetchall()]
-
-    filters = {
-        "bank": request.args.get("bank", ""),
-        "account_type": request.args.get("account_type", ""),
-        "saving_invested": request.args.get("saving_invested", ""),
-        "status": request.args.get("status", ""),
-        "year": request.args.get("year", ""),
-        "start_date": request.args.get("start_date", ""),
-        "end_date": request.args.get("end_date", ""),
-        "unique_only": request.args.get("unique_only", "")
-    }
+    banks, account_types = load_options()
+
+    filters = records.read_filters(request.args)
+    after = request.args.get("after", "")
+    as_of = request.args.get("as_of", "")
+    page_size = records.page_size_arg(request.args.get("page_size"), app.config["RECORDS_PAGE_SIZE"])
 
     rows = []   # ✅ default: no data
     monthly_totals = [0] * 12
-    next_maturity = []
+    upcoming_maturities = None
+    maturity_key = None
+    next_cursor = None
 
     # ✅ only run query if at least one filter is set
     if any(filters.values()):
-        base_query = "SELECT * FROM investments WHERE 1=1"
-        params = []
-
-        for field, value in filters.items():
-            if field in ["bank", "account_type", "saving_invested", "status", "year"] and value:
-                base_query += f" AND {field} LIKE ?"
-                params.append(f"%{value}%")
-        if filters["start_date"]:
-            base_query += " AND maturity_date >= ?"
-            params.append(filters["start_date"])
-        if filters["end_date"]:
-            base_query += " AND maturity_date <= ?"
-            params.append(filters["end_date"])
-
-        if filters["unique_only"]:
-            query = f"""
-                SELECT * FROM (
-                    {base_query}
-                )
-                WHERE id IN (
-                    SELECT MIN(id)
-                    FROM investments
-                    GROUP BY reference_name
-                )
-                ORDER BY reference_name, year
-            """
-        else:
-            query = base_query + " ORDER BY reference_name, year"
+        try:
+            conn, day = ledger_at(as_of)
+        except ValueError as e:
+            return f"Error: {e}", 400
+        with conn:
+            try:
+                rows, next_cursor = records.fetch_page(conn, filters, after, page_size)
+            except ValueError as e:
+                return f"Error: {e}", 400
+            monthly_totals = records.monthly_totals(conn, filters)
 
-        with sqlite3.connect(DB) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
+        # only queried if the template's cached fragment for this day is stale
+        upcoming_maturities = functools.partial(get_upcoming_maturities, conn=conn, start=day)
+        maturity_key = (as_of, day.isoformat())
+
+    return render_template("index.html", records=rows, filters=filters,
+                           compounding_choices=valuation.COMPOUNDING_CHOICES,
+                           monthly_totals=monthly_totals, upcoming_maturities=upcoming_maturities,
+                           maturity_key=maturity_key,
+                           banks=banks, account_types=account_types, as_of=as_of,
+                           next_cursor=next_cursor, after=after, page_size=page_size)
+
+
+@app.route("/bulk_import", methods=["POST"])
+def bulk_import():
+    """Add many investments in one request and one transaction.
+
+    Takes a JSON list of investments (or {"investments": [...]}) with the same
+    fields as the add form. Nothing is written unless every item is valid.
+    """
+    payload = request.get_json(silent=True)
+    items = payload.get("investments") if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return jsonify(error="expected a JSON list of investments"), 400
+
+    entries = []
+    options = imports.load_options(get_db())
+    for index, item in enumerate(items):
+        try:
+            entries.append(read_entry(item, options))
+        except Exception as e:
+            return jsonify(error=f"investment {index}: {e}"), 400
+    try:
+        investment_ids = ledger.write_batch(get_db(), entries)
+    except Exception as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(imported=len(investment_ids), investment_ids=investment_ids)
+
+
+@app.route("/import", methods=["POST"])
+def import_statement():
+    """Import an uploaded CSV/XLSX statement and return a JSON report.
+
+    Form fields: ``file``, and optionally ``dry_run``, ``map``
+    ('Statement Column=field,...') and ``add_options``.
+    """
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        return jsonify(error="no file uploaded"), 400
+    try:
+        report = imports.run(get_db(), upload.stream, upload.filename,
+                             dry_run=bool(request.form.get("dry_run")),
+                             mapping=imports.parse_mapping(request.form.get("map")),
+                             add_options=bool(request.form.get("add_options")))
+    except Exception as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(report)
+
+
+@app.route("/records")
+def records_page():
+    """JSON version of the records list page, for infinite scroll.
+
+    Takes the same query args as index() plus ``after``/``page_size``;
+    monthly totals over the whole filter are included on the first page.
+    ``as_of`` reads the ledger as it was at that date or time.
+    """
+    filters = records.read_filters(request.args)
+    after = request.args.get("after", "")
+    page_size = records.page_size_arg(request.args.get("page_size"), app.config["RECORDS_PAGE_SIZE"])
+    try:
+        conn, _ = ledger_at(request.args.get("as_of"))
+        rows, next_cursor = records.fetch_page(conn, filters, after, page_size)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    payload = {
+        "columns": [c.strip() for c in ledger.INVESTMENT_COLUMNS.split(",")],
+        "rows": [list(r) for r in rows],
+        "next_cursor": next_cursor,
+    }
+    if not after:
+        payload["monthly_totals"] = records.monthly_totals(conn, filters)
+    return jsonify(payload)
 
-        monthly_totals = [0] * 12
-        for row in rows:
-            for i in range(9, 21):
-                monthly_totals[i - 9] += safe_float(row[i])
 
-        next_maturity = get_upcoming_maturities()
 
-    return render_template("index.html", records=rows, filters=filters,
-                           monthly_totals=monthly_totals, next_maturity=next_maturity,
-                           banks=banks, account_types=account_types)
 
+def value_book(as_of):
+    """valuation.value_book() for ``as_of``, cached until the data changes."""
+    return cache.memoize("valuation", lambda: valuation.value_book(get_db(), as_of), as_of.isoformat())
 
 
+@app.route("/valuation")
+def valuation_report():
+    """Accrued and projected maturity value of every open RD/FD/NSC as JSON.
+
+    ``as_of`` (YYYY-MM-DD) defaults to today; ``investment_id`` narrows the
+    rows to one investment.
+    """
+    try:
+        as_of = date.fromisoformat(request.args["as_of"]) if request.args.get("as_of") else date.today()
+        investment_id = optional_number(request.args.get("investment_id"), int)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    columns, rows = value_book(as_of)
+    if investment_id is not None:
+        rows = [row for row in rows if row[0] == investment_id]
+    payload = {"as_of": as_of.isoformat(), "totals": valuation.totals_by(rows)}
+    payload.update(api.columnar(columns, rows))
+    return jsonify(payload)
+
+
+@app.route("/maturities")
+def maturities():
+    """Maturity ladder: upcoming maturities bucketed by week, month or quarter per bank."""
+    try:
+        bucket, start, end, filters = ladder.read_args(request.args)
+        rows = ladder.ladder(get_db(), bucket, start, end, filters)
+    except ValueError as e:
+        return f"Error: {e}", 400
+    banks, table = ladder.pivot(rows)
+    upcoming = ladder.entries(get_db(), start, end, filters, limit=20).fetchall()
+    options_banks, account_types = load_options()
+    return render_template("maturities.html", banks=banks, table=table, upcoming=upcoming,
+                           bucket=bucket, buckets=list(ladder.BUCKETS), start=start, end=end,
+                           filters=filters, bank_options=options_banks, account_types=account_types)
+
+
+@app.route("/maturities.ics")
+def maturities_ics():
+    """Calendar feed of every open maturity from ``start`` (default today) on."""
+    try:
+        start = ladder.date_arg(request.args.get("start"), date.today())
+        end = ladder.date_arg(request.args.get("end"), date.max)
+    except ValueError as e:
+        return f"Error: {e}", 400
+    filters = {field: request.args.get(field, "") for field in ladder.FILTERS}
+    rows = ladder.entries(get_db(), start, end, filters)
+    return Response(
+        stream_with_context(ladder.ics_lines(rows, request.host)),
+        mimetype="text/calendar",
+        headers={"Content-Disposition": "inline; filename=maturities.ics"},
+    )
+
 
 @app.route("/dashboard")
+@cache.cached_page(vary=date.today)
 def dashboard():
-    with sqlite3.connect(DB) as conn:
-        # Open Unique FD/RD/NSC Count
-        df_open_unique = pd.read_sql_query("""
-            SELECT bank, account_type, COUNT(DISTINCT reference_name) AS open_unique_count
-            FROM investments
-            WHERE account_type IN ('FD', 'RD', 'NSC')
-              AND status = 'Open'
-            GROUP BY bank, account_type
-        """, conn)
-# NEW: totals across all banks
-        df_totals = pd.read_sql_query("""
-            SELECT account_type, COUNT(DISTINCT reference_name) AS total_count
-            FROM investments
-            WHERE status = 'Open'
-            GROUP BY account_type
-        """, conn)
-        # Savings totals by month, aggregated across all banks, grouped by year
-        df_savings_monthly = pd.read_sql_query("""
-            SELECT year,
-                   COALESCE(SUM(jan),0) AS jan,
-                   COALESCE(SUM(feb),0) AS feb,
-                   COALESCE(SUM(mar),0) AS mar,
-                   COALESCE(SUM(apr),0) AS apr,
-                   COALESCE(SUM(may),0) AS may,
-                   COALESCE(SUM(jun),0) AS jun,
-                   COALESCE(SUM(jul),0) AS jul,
-                   COALESCE(SUM(aug),0) AS aug,
-                   COALESCE(SUM(sep),0) AS sep,
-                   COALESCE(SUM(oct),0) AS oct,
-                   COALESCE(SUM(nov),0) AS nov,
-                   COALESCE(SUM(dec),0) AS dec
-            FROM investments
-            WHERE account_type = 'Savings'
-            GROUP BY year
-            ORDER BY year
-        """, conn)
-
-        # Invested totals by month, aggregated across all banks, grouped by year
-        df_invested_monthly = pd.read_sql_query("""
-            SELECT year,
-                   COALESCE(SUM(jan),0) AS jan,
-                   COALESCE(SUM(feb),0) AS feb,
-                   COALESCE(SUM(mar),0) AS mar,
-                   COALESCE(SUM(apr),0) AS apr,
-                   COALESCE(SUM(may),0) AS may,
-                   COALESCE(SUM(jun),0) AS jun,
-                   COALESCE(SUM(jul),0) AS jul,
-                   COALESCE(SUM(aug),0) AS aug,
-                   COALESCE(SUM(sep),0) AS sep,
-                   COALESCE(SUM(oct),0) AS oct,
-                   COALESCE(SUM(nov),0) AS nov,
-                   COALESCE(SUM(dec),0) AS dec
-            FROM investments
-            WHERE saving_invested = 'Invested'
-            GROUP BY year
-            ORDER BY year
-        """, conn)
+    as_of = request.args.get("as_of")
+    try:
+        conn, day = ledger_at(as_of)
+    except ValueError as e:
+        return f"Error: {e}", 400
+    with conn:
+        tables = {name: summaries.dict_rows(conn, sql) for name, sql in summaries.DASHBOARD.items()}
+
+    _, book = valuation.value_book(conn, day) if as_of else value_book(day)
+    # the DASHBOARD keys are the template's variable names
+    return render_template("dashboard.html", valuation=valuation.totals_by(book), as_of=as_of, **tables)
+
+
+@app.route("/analytics")
+@cache.cached_page(vary=date.today)
+def analytics_page():
+    """Rolling, year-over-year and cumulative totals from the analytics cube.
+
+    Takes analytics.read_args() parameters and ``as_of``; the same report
+    is at /api/v1/analytics as JSON.
+    """
+    as_of = request.args.get("as_of")
+    try:
+        params = analytics.read_args(request.args)
+        conn, _ = ledger_at(as_of)
+        report = analytics.report(analytics.load(conn) if as_of else analytics.current_cube(), **params)
+    except ValueError as e:
+        return f"Error: {e}", 400
+    banks, account_types = load_options()
+    return render_template("analytics.html", report=report, args=request.args, as_of=as_of,
+                           banks=banks, account_types=account_types,
+                           dimensions=analytics.DIMENSIONS, measures=analytics.MEASURES,
+                           json_url=url_for("api.analytics_report", **request.args.to_dict(flat=False)))
+
 
-    return render_template(
-        "dashboard.html",
-        open_unique=df_open_unique.to_dict(orient="records"),
-        savings_monthly=df_savings_monthly.fillna(0).to_dict(orient="records"),
-        invested_monthly=df_invested_monthly.fillna(0).to_dict(orient="records"),
-        totals=df_totals.to_dict(orient="records")
-        
-    )
 @app.route("/export/<fmt>")
 def export(fmt):
-    with sqlite3.connect(DB) as conn:
-        df = pd.read_sql_query("SELECT * FROM investments", conn)
-        if fmt == "csv":
-            df.to_csv("investments.csv", index=False)
-            return send_file("investments.csv", as_attachment=True)
-        elif fmt == "excel":
-            df.to_excel("investments.xlsx", index=False)
-            return send_file("investments.xlsx", as_attachment=True)
-        
-        
+    """Stream the records (optionally filtered like index()) as CSV or Excel.
+
+    With ?background=1 the export is queued as a job instead; see /jobs.
+    """
+    if fmt not in ("csv", "excel"):
+        return f"Unknown export format: {fmt}", 400
+
+    filters = records.read_filters(request.args)
+    if request.args.get("background", "") not in ("", "0"):
+        return enqueue_job("export", {"fmt": fmt, "filters": filters, "gzip": request.args.get("gzip")})
+    try:
+        header, query, params = records.export_query(filters)
+    except ValueError as e:
+        return f"Error: {e}", 400
+    rows = get_db().execute(query, params)
+
+    if fmt == "csv":
+        compress = request.args.get("gzip", "") not in ("", "0")
+        filename = "investments.csv.gz" if compress else "investments.csv"
+        return Response(
+            stream_with_context(exports.csv_chunks(header, rows, compress)),
+            mimetype="application/gzip" if compress else "text/csv",
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+
+    output = exports.write_xlsx(header, rows)
+    return send_file(
+        output,
+        as_attachment=True,
+        download_name="investments.xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+# --- background jobs ---
+
+def job_json(job):
+    job = dict(job, status_url=f"/jobs/{job['id']}")
+    if job["status"] == "done":
+        job["download_url"] = f"/jobs/{job['id']}/download"
+    return job
+
+
+def enqueue_job(kind, params):
+    try:
+        job = jobs.enqueue(get_db(), kind, params)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(job_json(job)), 202, {"Location": f"/jobs/{job['id']}"}
+
+
+@app.route("/jobs", methods=["GET", "POST"])
+def jobs_list():
+    """GET: recent jobs. POST {"kind": "export"|"report", "params": {...}}: queue one."""
+    if request.method == "POST":
+        data = request.get_json(silent=True) or request.form
+        params = data.get("params") or {}
+        if not isinstance(params, dict):
+            return jsonify(error="params must be an object"), 400
+        return enqueue_job(data.get("kind", ""), params)
+    return jsonify(jobs=[job_json(job) for job in jobs.recent(get_db())])
+
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    job = jobs.get(get_db(), job_id)
+    if job is None:
+        return jsonify(error="no such job"), 404
+    return jsonify(job_json(job))
+
+
+@app.route("/jobs/<int:job_id>/download")
+def job_download(job_id):
+    found = jobs.artifact(get_db(), job_id)
+    if found is None:
+        return jsonify(error="job is not finished, failed or has expired"), 404
+    path, filename, mimetype = found
+    return send_file(path, as_attachment=True, download_name=filename, mimetype=mimetype)
+
+
 @app.route("/manage_options", methods=["GET", "POST"])
+@cache.cached_page()
 def manage_options():
     if request.method == "POST":
         new_type = request.form["type"]
         new_value = request.form["value"].strip()
         if new_type and new_value:
-            with sqlite3.connect(DB) as conn:
+            with get_db() as conn:
                 cursor = conn.cursor()
                 cursor.execute("INSERT OR IGNORE INTO options (type, value) VALUES (?, ?)", (new_type, new_value))
                 conn.commit()
         return redirect("/manage_options")
 
-    with sqlite3.connect(DB) as conn:
+    with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT type, value FROM options ORDER BY type, value")
         options = cursor.fetchall()
@@ -543,7 +693,7 @@ def manage_options():
     
 @app.route("/debug_options")
 def debug_options():
-    with sqlite3.connect(DB) as conn:
+    with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT type, value FROM options ORDER BY type, value")
         rows = cursor.fetchall()
@@ -551,49 +701,36 @@ def debug_options():
 
 @app.route("/delete_option/<option_type>/<option_value>")
 def delete_option(option_type, option_value):
-    with sqlite3.connect(DB) as conn:
+    with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM options WHERE type=? AND value=?", (option_type, option_value))
         conn.commit()
     return redirect("/manage_options")
 
 @app.route("/bank_summary")
+@cache.cached_page(vary=lambda: datetime.now().month)
 def bank_summary():
-    with sqlite3.connect(DB) as conn:
-        # Total Saving by Bank, Year, and Month
-        df_saving = pd.read_sql_query("""
-            SELECT bank, year,
-                   SUM(jan + feb + mar + apr + may + jun + jul + aug + sep + oct + nov + dec) AS total_saving
-            FROM investments
-            WHERE saving_invested = 'Saving'
-            GROUP BY bank, year
-        """, conn)
-
-        # Total Investment by Bank, Year, and Month
-        df_invested = pd.read_sql_query("""
-            SELECT bank, year,
-                   SUM(jan + feb + mar + apr + may + jun + jul + aug + sep + oct + nov + dec) AS total_investment
-            FROM investments
-            WHERE saving_invested = 'Invested'
-            GROUP BY bank, year
-        """, conn)
-
-        # Current month totals
-        current_month = datetime.now().strftime("%b").lower()
-        df_current = pd.read_sql_query(f"""
-            SELECT bank, year,
-                   SUM({current_month}) AS current_month_total
-            FROM investments
-            GROUP BY bank, year
-        """, conn)
+    as_of = request.args.get("as_of")
+    try:
+        conn, day = ledger_at(as_of)
+    except ValueError as e:
+        return f"Error: {e}", 400
+    with conn:
+        current_month = day.month - 1
+        saving_data = summaries.dict_rows(conn, summaries.BANK_SUMMARY["saving"])
+        invested_data = summaries.dict_rows(conn, summaries.BANK_SUMMARY["invested"])
+        current_data = summaries.dict_rows(conn, summaries.BANK_SUMMARY["current"], (current_month,))
 
     return render_template(
         "bank_summary.html",
-        saving_data=df_saving.to_dict(orient="records"),
-        invested_data=df_invested.to_dict(orient="records"),
-        current_data=df_current.to_dict(orient="records")
+        as_of=as_of,
+        saving_data=saving_data,
+        invested_data=invested_data,
+        current_data=current_data
     )
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # local use only; production runs under gunicorn (see Procfile)
+    start_background()
+    app.run(host=os.environ.get("HOST", "127.0.0.1"), port=int(os.environ.get("PORT", 5000)))
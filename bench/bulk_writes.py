@@ -0,0 +1,81 @@
+"""Multi-year writes: one transaction per investment vs one ledger.write_batch().
+
+Writes --count 20-year RDs into a fresh database, first committing each one
+separately (what a loop over the add form costs) and then as a single batch,
+and checks that a batch failing on its last entry leaves nothing behind.
+
+    python bench/bulk_writes.py --count 500
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import ledger  # noqa: E402
+import migrations  # noqa: E402
+import schedule  # noqa: E402
+
+
+def rd_entry(n):
+    fields = {
+        "reference_name": f"RD-bench-{n}", "bank": "Axis", "account_type": "RD",
+        "saving_invested": "Invested", "status": "Open", "maturity_date": "2045-03-31",
+        "notepad": "", "start_year": 2025,
+    }
+    month_values = [0.0] * 3 + [1000.0] + [0.0] * 8
+    return ledger.Entry(None, fields, schedule.build("RD", 2025, month_values, "2045-03-31", 10.0))
+
+
+def fresh(path):
+    conn = db.connect(path)
+    migrations.migrate(conn)
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        entries = [rd_entry(n) for n in range(args.count)]
+        months = sum(1 for _, row in entries[0].year_rows for amount in row if amount)
+
+        conn = fresh(os.path.join(tmp, "single.db"))
+        t0 = time.perf_counter()
+        for entry in entries:
+            ledger.write_batch(conn, [entry])
+        single = time.perf_counter() - t0
+        conn.close()
+
+        conn = fresh(os.path.join(tmp, "batch.db"))
+        t0 = time.perf_counter()
+        ledger.write_batch(conn, entries)
+        batch = time.perf_counter() - t0
+
+        print(f"{args.count} RDs x {months} monthly cashflows")
+        print(f"  one transaction each: {single * 1000:8.1f} ms")
+        print(f"  single write_batch:   {batch * 1000:8.1f} ms")
+
+        before = conn.execute("SELECT COUNT(*) FROM cashflows").fetchone()[0]
+        broken = ledger.Entry(None, entries[0].fields, None)   # fails after the first entry is written
+        try:
+            ledger.write_batch(conn, [rd_entry(-1), broken])
+        except Exception as e:
+            print(f"  failing batch rolled back ({type(e).__name__})")
+        after = conn.execute("SELECT COUNT(*) FROM cashflows").fetchone()[0]
+        print(f"  cashflows before/after failed batch: {before}/{after}")
+        conn.close()
+        sys.exit(0 if before == after else 1)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Records-list filter latency: old LIKE filters vs the indexed query builder.
+
+Builds a synthetic ledger of ~--rows year-rows in the pre-migration wide
+layout, times the old `field LIKE '%value%'` query on it, then migrates a copy
+to the current schema and times records.filtered_query() / fetch_page() with
+the same filters.
+
+    python bench/filter_latency.py --rows 100000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+import records  # noqa: E402
+
+BANKS = ["Axis", "HDFC", "SBI", "IDFC", "PostOffice", "Central Bank", "ICICI", "Kotak"]
+TYPES = ["FD", "RD", "NSC", "Savings", "PPF", "Mutual Fund"]
+FILTERS = [
+    {"bank": "Axis"},
+    {"bank": "HDFC", "status": "Open"},
+    {"account_type": "RD"},
+    {"year": "2027"},
+    {"saving_invested": "Saving", "year": "2030"},
+    {"bank": "SBI", "account_type": "FD", "status": "Closed"},
+    {"q": "ladder"},
+]
+
+
+def build_legacy(path, rows, seed=7):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    migrations._create_base_tables(cursor)
+    migrations._add_investment_indexes(cursor)
+    data, investment_id = [], 0
+    while len(data) < rows:
+        investment_id += 1
+        account_type = rng.choice(TYPES)
+        bank = rng.choice(BANKS)
+        start = rng.randint(2018, 2032)
+        years = 1 if account_type == "Savings" else rng.randint(1, 8)
+        status = "Closed" if start + years < 2026 else "Open"
+        note = rng.choice(["", "ladder", "tax saver", "joint", "renewal"])
+        amount = rng.choice([1000.0, 5000.0, 25000.0, 100000.0])
+        for year in range(start, start + years):
+            data.append((investment_id, f"{account_type}-{bank}-{investment_id}", bank, account_type,
+                         "Saving" if account_type == "Savings" else "Invested", status, year,
+                         f"{start + years}-03-31", *([amount] * 12), note))
+    cursor.executemany(
+        "INSERT INTO investments (investment_id, reference_name, bank, account_type, saving_invested, "
+        "status, year, maturity_date, jan, feb, mar, apr, may, jun, jul, aug, sep, oct, nov, dec, notepad) "
+        "VALUES (" + ", ".join("?" * 21) + ")", data[:rows])
+    conn.commit()
+    conn.close()
+
+
+def legacy_query(filters):
+    query, params = "SELECT * FROM investments WHERE 1=1", []
+    for field in ["bank", "account_type", "saving_invested", "status", "year"]:
+        if filters.get(field):
+            query += f" AND {field} LIKE ?"
+            params.append(f"%{filters[field]}%")
+    return query + " ORDER BY reference_name, year", params
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        current_path = os.path.join(tmp, "current.db")
+        build_legacy(legacy_path, args.rows)
+        shutil.copy(legacy_path, current_path)
+
+        legacy = sqlite3.connect(legacy_path)
+        current = db.connect(current_path)
+        t0 = time.perf_counter()
+        migrations.migrate(current)
+        print(f"migrated {args.rows} rows in {time.perf_counter() - t0:.2f} s\n")
+
+        print(f"{'filter':48} {'LIKE all':>10} {'new all':>10} {'new page':>10} {'rows':>7}")
+        for filters in FILTERS:
+            label = ", ".join(f"{k}={v}" for k, v in filters.items())
+            if "q" in filters:
+                old_ms = None
+            else:
+                sql, params = legacy_query(filters)
+                old_ms, _ = timed(lambda: legacy.execute(sql, params).fetchall(), args.repeat)
+            sql, params = records.filtered_query(filters)
+            new_ms, rows = timed(lambda: current.execute(sql, params).fetchall(), args.repeat)
+            page_ms, _ = timed(lambda: records.fetch_page(current, filters), args.repeat)
+            old = f"{old_ms:10.1f}" if old_ms is not None else f"{'n/a':>10}"
+            print(f"{label:48} {old} {new_ms:10.1f} {page_ms:10.1f} {len(rows):7d}")
+        legacy.close()
+        current.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
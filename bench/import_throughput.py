@@ -0,0 +1,88 @@
+"""Statement import throughput: rows per minute into a fresh portfolio.
+
+Generates a synthetic ledger with bench/synthetic.py, exports it as a CSV
+(and with --xlsx an XLSX) statement, then imports the statement through
+imports.run() into an empty, migrated database three times: a dry run, the
+real import, and a re-import that should find every row a duplicate. The
+statement's banks and account types are added to the options as they come.
+Peak RSS is reported so a run over a large file shows whether memory stayed
+flat.
+
+    python bench/import_throughput.py --rows 100000
+    python bench/import_throughput.py --rows 20000 --xlsx
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+
+
+def write_statement(conn, path, xlsx=False):
+    import exports
+    import records
+
+    header, query, params = records.export_query({})
+    rows = conn.execute(query, params)
+    if xlsx:
+        exports.write_xlsx(header, rows, output=path)
+        return
+    with open(path, "wb") as f:
+        for chunk in exports.csv_chunks(header, rows, False):
+            f.write(chunk)
+
+
+def timed_import(path, target, **kwargs):
+    import db
+    import imports
+
+    conn = db.connect(target)
+    try:
+        t0 = time.perf_counter()
+        report = imports.run_file(conn, path, add_options=True, **kwargs)
+        elapsed = time.perf_counter() - t0
+    finally:
+        conn.close()
+    return elapsed, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="year-rows in the statement")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--xlsx", action="store_true", help="import an XLSX statement instead of CSV")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="import-bench-")
+    source = synthetic.open_app_db(os.path.join(work, "source.db"))
+    synthetic.generate(source, args.rows, args.seed)
+    statement = os.path.join(work, "statement.xlsx" if args.xlsx else "statement.csv")
+    write_statement(source, statement, args.xlsx)
+    source.close()
+
+    import db
+    import migrations
+
+    target = os.path.join(work, "target.db")
+    conn = db.connect(target)
+    migrations.migrate(conn)
+    conn.close()
+
+    print(f"statement: {statement} ({os.path.getsize(statement) / 1e6:.1f} MB)")
+    for label, kwargs in (("dry run", {"dry_run": True}), ("import", {}), ("re-import", {})):
+        elapsed, report = timed_import(statement, target, **kwargs)
+        rate = report["rows"] / elapsed * 60 if elapsed else 0
+        print(f"{label:9} {report['rows']:>8} rows in {elapsed:6.1f} s = {rate:>9,.0f} rows/min  "
+              f"(imported {report['imported_rows']}, duplicates {report['duplicate_rows']}, "
+              f"invalid {report['invalid_rows']})")
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Every page and API route against a synthetic ledger, as a diffable JSON report.
+
+Generates a ledger with bench/synthetic.py (or uses --db), then drives each
+route through the Flask test client: --repeat timed requests for p50/p99
+latency, statements per request from the Server-Timing header (metrics.py
+is switched on for the run), and the peak Python allocation of one more
+request under tracemalloc. The response cache is off unless --cache is
+given, so the numbers are render cost, not cache hits. A route stops
+sampling after --budget seconds (at least 3 samples), so the exports stay
+affordable on a 1M-row ledger.
+
+    python bench/routes.py --rows 100000 --json before.json
+    python bench/routes.py --rows 100000 --json after.json --baseline before.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+
+# (name, path); {id} is replaced by an investment_id from the ledger
+ROUTES = [
+    ("index", "/"),
+    ("index_filtered", "/?bank=Axis&account_type=RD&status=Open"),
+    ("index_year", "/?year=2020"),
+    ("records", "/records?status=Open"),
+    ("update_form", "/update/{id}"),
+    ("dashboard", "/dashboard"),
+    ("bank_summary", "/bank_summary"),
+    ("analytics", "/analytics"),
+    ("maturities", "/maturities"),
+    ("maturities_ics", "/maturities.ics"),
+    ("valuation", "/valuation"),
+    ("manage_options", "/manage_options"),
+    ("export_csv", "/export/csv"),
+    ("export_excel", "/export/excel"),
+    ("api_investments", "/api/v1/investments?status=Open"),
+    ("api_maturities", "/api/v1/maturities"),
+    ("api_ladder", "/api/v1/ladder"),
+    ("api_dashboard", "/api/v1/dashboard"),
+    ("api_bank_summary", "/api/v1/bank_summary"),
+    ("api_analytics", "/api/v1/analytics"),
+]
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def measure(client, path, repeat, budget):
+    response = client.get(path)    # warm-up; also checks the route works
+    size = len(response.data)
+    timings = []
+    deadline = time.perf_counter() + budget
+    for n in range(repeat):
+        t0 = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        timings.append((time.perf_counter() - t0) * 1000)
+        if n >= 2 and time.perf_counter() > deadline:
+            break
+    match = QUERIES.search(response.headers.get("Server-Timing", ""))
+
+    tracemalloc.start()
+    client.get(path).get_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "path": path, "status": response.status_code, "bytes": size,
+        "p50_ms": round(percentile(timings, 50), 3), "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "samples": len(timings), "queries": int(match.group(1)) if match else None,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    print(f"\n{'route':20} {'p50 before':>11} {'p50 after':>10} {'change':>8} {'queries':>9}")
+    for name, now in report["routes"].items():
+        before = baseline["routes"].get(name)
+        if not before:
+            continue
+        change = (now["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100 if before["p50_ms"] else 0.0
+        queries = f"{before['queries']}->{now['queries']}"
+        print(f"{name:20} {before['p50_ms']:11.2f} {now['p50_ms']:10.2f} {change:+7.1f}% {queries:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="year-rows to generate")
+    parser.add_argument("--db", help="use a copy of this database instead of generating one")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--budget", type=float, default=10.0, help="seconds of sampling per route")
+    parser.add_argument("--only", help="comma-separated route names")
+    parser.add_argument("--cache", action="store_true", help="leave the response cache on")
+    parser.add_argument("--json", help="write the report here")
+    parser.add_argument("--baseline", help="earlier report to compare p50s against")
+    args = parser.parse_args()
+
+    os.environ["METRICS"] = "on"
+    os.environ["RESPONSE_CACHE"] = "memory" if args.cache else "off"
+    # query counts only; the slow-query log would EXPLAIN (and print) half the run
+    os.environ.setdefault("SLOW_QUERY_MS", "1e9")
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "bench.db")
+        if args.db:
+            shutil.copy(args.db, path)
+        conn = synthetic.open_app_db(path)
+        t0 = time.perf_counter()
+        if not args.db:
+            synthetic.generate(conn, args.rows, args.seed)
+        generate_s = time.perf_counter() - t0
+        instruments = conn.execute("SELECT COUNT(*) FROM instruments").fetchone()[0]
+        year_rows = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM cashflows GROUP BY instrument_id, month_ordinal / 12)").fetchone()[0]
+        some_id = conn.execute("SELECT investment_id FROM instruments ORDER BY id LIMIT 1").fetchone()
+        conn.close()
+
+        import app
+        client = app.app.test_client()
+        only = set(args.only.split(",")) if args.only else None
+        routes = {}
+        for name, route in ROUTES:
+            if only and name not in only:
+                continue
+            routes[name] = result = measure(client, route.format(id=some_id[0] if some_id else 0),
+                                            args.repeat, args.budget)
+            print(f"{name:20} {result['status']:4} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms"
+                  f"  {result['queries'] if result['queries'] is not None else '-':>4} queries"
+                  f"  peak {result['peak_kb']:10.1f} KiB")
+
+        report = {
+            "meta": {
+                "commit": git_commit(), "python": platform.python_version(),
+                "rows": year_rows, "instruments": instruments, "seed": args.seed,
+                "source": args.db or "synthetic", "generate_s": round(generate_s, 2),
+                "db_bytes": os.path.getsize(path), "repeat": args.repeat, "budget_s": args.budget,
+                "response_cache": args.cache,
+                "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            },
+            "routes": routes,
+        }
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+        if args.baseline:
+            with open(args.baseline) as f:
+                compare(report, json.load(f))
+        sys.exit(0 if all(r["status"] < 400 for r in routes.values()) else 1)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Schedule engine: equivalence check against the old loops, plus a micro-benchmark.
+
+The legacy_* functions are the month-by-month relativedelta walk and the
+per-year fan-out loops that index()/update() used before schedule.py. --check
+runs randomized cases through both and fails on any difference; the benchmark
+times both for 10-30 year tenures.
+
+    pip install -r bench/requirements.txt    # python-dateutil, for the legacy loops
+    python bench/schedule_engine.py --check 2000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+from datetime import date, datetime
+
+from dateutil.relativedelta import relativedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schedule  # noqa: E402
+
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+          'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+def legacy_rd_values(start_year, start_month_name, start_value, maturity_date_str, increment):
+    monthly_values = {}
+    start_date = datetime(start_year, MONTHS.index(start_month_name) + 1, 1)
+    end_date = datetime.strptime(maturity_date_str, "%Y-%m-%d")
+    current_value = start_value
+    while start_date <= end_date:
+        monthly_values[f"{start_date.year}-{start_date.strftime('%b').lower()}"] = current_value
+        current_value += increment
+        start_date += relativedelta(months=1)
+    return monthly_values
+
+
+def legacy_rows(account_type, start_year, month_values, maturity_date_str, increment):
+    maturity_date = date.fromisoformat(maturity_date_str)
+    end_year, end_month = maturity_date.year, maturity_date.month
+    deposit = schedule.first_deposit(month_values)
+    if deposit is None:
+        return None
+    start_index, start_value = deposit
+    rows = []
+    if account_type == "RD":
+        full_values = legacy_rd_values(start_year, MONTHS[start_index], start_value, maturity_date_str, increment)
+        for year in range(start_year, end_year + 1):
+            if any(f"{year}-{m}" in full_values for m in MONTHS):
+                rows.append((year, [full_values.get(f"{year}-{m}", 0) for m in MONTHS]))
+    else:
+        start_month = start_index + 1
+        for year in range(start_year, end_year + 1):
+            year_values = [0] * 12
+            for i in range(12):
+                month_index = i + 1
+                if (year == start_year and month_index >= start_month) or \
+                   (year == end_year and month_index <= end_month) or \
+                   (start_year < year < end_year):
+                    year_values[i] = start_value
+            rows.append((year, year_values))
+    return rows
+
+
+def random_case(rng, min_years=0, max_years=30):
+    account_type = rng.choice(schedule.SCHEDULED_TYPES)
+    start_year = rng.randint(2000, 2040)
+    month_values = [0.0] * 12
+    month_values[rng.randrange(12)] = float(rng.choice([500, 1000, 2500, 100000]))
+    tenure_months = rng.randint(max(min_years * 12, 1), max_years * 12)
+    start = start_year * 12 + schedule.first_deposit(month_values)[0]
+    end = start + tenure_months
+    maturity = date(end // 12, end % 12 + 1, rng.randint(1, 28)).isoformat()
+    increment = float(rng.choice([0, 10, 100])) if account_type == "RD" else 0.0
+    return account_type, start_year, month_values, maturity, increment
+
+
+def check(cases, seed=11):
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(cases):
+        case = random_case(rng)
+        expected = legacy_rows(*case)
+        actual = schedule.build(*case)
+        if case[0] != "RD" and expected and expected[0][0] == expected[-1][0]:
+            # the old FD/NSC loop filled the whole year when deposit and
+            # maturity fell in the same year; the engine stops at maturity
+            continue
+        if [(y, [float(v) for v in r]) for y, r in expected] != actual:
+            failures += 1
+            print("MISMATCH", case)
+    print(f"{cases} random cases checked, {failures} mismatches")
+    return failures == 0
+
+
+def benchmark(number=200):
+    print(f"{'tenure':>8} {'type':>4} {'old (us)':>10} {'new (us)':>10}")
+    for years in (10, 20, 30):
+        for account_type in ("RD", "FD"):
+            maturity = date(2025 + years, 3, 15).isoformat()
+            case = (account_type, 2025, [0, 0, 0, 1000.0] + [0] * 8, maturity, 10.0)
+            old = timeit.timeit(lambda: legacy_rows(*case), number=number) / number * 1e6
+            new = timeit.timeit(lambda: schedule.build(*case), number=number) / number * 1e6
+            print(f"{years:>7}y {account_type:>4} {old:10.1f} {new:10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", type=int, default=1000, metavar="CASES")
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    ok = check(args.check)
+    benchmark(args.number)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Worker startup cost: time to import app and the resulting peak RSS.
+
+Each run is a fresh interpreter importing app against a copy of data.db,
+as a gunicorn worker does without --preload. ``--with`` imports extra
+modules first (e.g. ``--with pandas``) to show what a dependency would add.
+
+    python bench/startup.py --runs 10
+    python bench/startup.py --runs 10 --with pandas
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+for name in {preload!r}:
+    __import__(name)
+import app
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [m for m in ("pandas", "numpy", "xlsxwriter", "dateutil") if m in sys.modules],
+}}))
+"""
+
+
+def probe(workdir, preload):
+    env = dict(os.environ, MATURITY_SCHEDULER="off")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(root=ROOT, preload=list(preload))],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--with", dest="preload", action="append", default=[], metavar="MODULE")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        shutil.copy(os.path.join(ROOT, "data.db"), workdir)
+        probe(workdir, args.preload)   # warm the page cache and run any migrations
+        results = [probe(workdir, args.preload) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir)
+
+    summary = {
+        "runs": args.runs,
+        "preload": args.preload,
+        "import_ms_median": round(statistics.median(r["import_ms"] for r in results), 1),
+        "import_ms_min": round(min(r["import_ms"] for r in results), 1),
+        "max_rss_mb_median": round(statistics.median(r["max_rss_mb"] for r in results), 1),
+        "heavy_modules": results[-1]["heavy_modules"],
+    }
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        for key, value in summary.items():
+            print(f"{key:18} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Synthetic multi-year ledgers written through the app's own insert path.
+
+Each generated investment is a form-shaped dict, turned into a ledger.Entry
+by app.read_entry() (the same code the add form and /bulk_import use) and
+written with ledger.write_batch(), so schedules, aggregates, the maturity
+calendar and the data-version triggers all end up as they would in use.
+``--rows`` counts year-rows (what the records page lists), not investments.
+
+    python bench/synthetic.py --rows 100000 --out /tmp/ledger.db
+    python bench/synthetic.py --rows 1000000 --banks Axis,SBI --tenure RD=1-10,FD=1-5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ledger  # noqa: E402
+
+BANKS = ["Axis", "HDFC", "SBI", "IDFC", "PostOffice", "Central Bank", "ICICI", "Kotak"]
+TYPES = ["RD", "FD", "NSC", "Savings", "PPF", "Mutual Fund"]
+# tenure in whole years, inclusive range
+TENURES = {"RD": (1, 5), "FD": (1, 5), "NSC": (5, 5)}
+AMOUNTS = [500.0, 1000.0, 5000.0, 25000.0, 100000.0]
+NOTES = ["", "", "ladder", "tax saver", "joint", "renewal"]
+BATCH = 1000
+
+
+def parse_tenures(spec):
+    """'RD=1-10,FD=1-5' -> {"RD": (1, 10), "FD": (1, 5)} on top of TENURES."""
+    tenures = dict(TENURES)
+    for part in filter(None, (spec or "").split(",")):
+        account_type, _, span = part.partition("=")
+        low, _, high = span.partition("-")
+        tenures[account_type.strip()] = (int(low), int(high or low))
+    return tenures
+
+
+def forms(rng, banks, types, first_year, last_year, tenures, today_year):
+    """Endless stream of add-form dicts."""
+    months = ledger.MONTHS
+    n = 0
+    while True:
+        n += 1
+        account_type = rng.choice(types)
+        bank = rng.choice(banks)
+        year = rng.randint(first_year, last_year)
+        form = {
+            "reference_name": f"{account_type}-{bank}-{n}", "bank": bank, "account_type": account_type,
+            "saving_invested": "Saving" if account_type == "Savings" else "Invested",
+            "year": str(year), "notepad": rng.choice(NOTES), "maturity_date": "",
+        }
+        if account_type in tenures:
+            low, high = tenures[account_type]
+            start_month = rng.randrange(12)
+            end_year = year + rng.randint(low, high)
+            form[months[start_month]] = str(rng.choice(AMOUNTS))
+            form["maturity_date"] = f"{end_year}-{start_month + 1:02d}-{rng.randint(1, 28):02d}"
+            form["status"] = "Open" if end_year >= today_year else "Closed"
+            form["interest_rate"] = str(rng.choice([5.5, 6.5, 6.8, 7.1, 7.5]))
+            form["compounding"] = str(rng.choice([1, 4, 12]))
+            if account_type == "RD":
+                form["rd_increment"] = str(rng.choice([0, 0, 5, 10]))
+        else:
+            for month in months:
+                if rng.random() < 0.6:
+                    form[month] = str(rng.choice(AMOUNTS[:3]))
+            form["status"] = rng.choice(["Open", "Open", "Closed"])
+        yield form
+
+
+def generate(conn, rows, seed=1, banks=BANKS, types=TYPES, years=(2015, 2026), tenures=TENURES):
+    """Write about ``rows`` year-rows of synthetic investments to ``conn``.
+
+    Needs the app importable (read_entry lives in app.py). Returns
+    (investments, year_rows) actually written.
+    """
+    import app
+
+    rng = random.Random(seed)
+    stream = forms(rng, list(banks), list(types), years[0], years[1], tenures, years[1])
+    options = {"bank": set(banks), "account_type": set(types)}
+    investments = written = 0
+    batch = []
+    while written < rows:
+        entry = app.read_entry(next(stream), options)
+        batch.append(entry)
+        investments += 1
+        written += len(entry.year_rows)
+        if len(batch) >= BATCH:
+            ledger.write_batch(conn, batch)
+            batch = []
+    if batch:
+        ledger.write_batch(conn, batch)
+    return investments, written
+
+
+def open_app_db(path):
+    """Point the app at a fresh database at ``path`` and import it.
+
+    The scheduler is turned off; the caller chooses the other app settings
+    through the environment before calling this.
+    """
+    import db
+
+    os.environ.setdefault("MATURITY_SCHEDULER", "off")
+    db.DB_PATH = path
+    import app  # noqa: F401  (runs the migrations against path)
+    return db.connect(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--out", required=True, help="database file to create")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--banks", default=",".join(BANKS))
+    parser.add_argument("--types", default=",".join(TYPES))
+    parser.add_argument("--years", default="2015-2026", help="range of start years")
+    parser.add_argument("--tenure", default="", help="e.g. RD=1-10,FD=1-5,NSC=5-5")
+    args = parser.parse_args()
+
+    if os.path.exists(args.out):
+        parser.error(f"{args.out} already exists")
+    first, _, last = args.years.partition("-")
+    conn = open_app_db(os.path.abspath(args.out))
+    t0 = time.perf_counter()
+    investments, rows = generate(conn, args.rows, args.seed, args.banks.split(","), args.types.split(","),
+                                 (int(first), int(last or first)), parse_tenures(args.tenure))
+    conn.close()
+    print(f"wrote {investments} investments ({rows} year-rows) to {args.out} "
+          f"in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
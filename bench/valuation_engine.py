@@ -0,0 +1,121 @@
+"""Valuation engine over a synthetic book: NumPy pass vs a per-instrument loop.
+
+Generates --instruments open RD/FD/NSC investments with random rates,
+compounding and 1-5 year tenures, then times the two valuation queries and
+valuation.value_deposits() against a straightforward Python loop over the
+same deposits, and checks they agree.
+
+    python bench/valuation_engine.py --instruments 50000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import ledger  # noqa: E402
+import migrations  # noqa: E402
+import schedule  # noqa: E402
+import valuation  # noqa: E402
+
+
+def build(conn, count, seed=5):
+    rng = random.Random(seed)
+    entries = []
+    for n in range(count):
+        account_type = rng.choice(schedule.SCHEDULED_TYPES)
+        start_year = rng.randint(2021, 2026)
+        month_values = [0.0] * 12
+        month_values[rng.randrange(12)] = float(rng.choice([1000, 5000, 25000, 100000]))
+        maturity = date(start_year + rng.randint(1, 5), rng.randint(1, 12), rng.randint(1, 28))
+        fields = {
+            "reference_name": f"{account_type}-{n}", "bank": rng.choice(["Axis", "SBI", "HDFC"]),
+            "account_type": account_type, "saving_invested": "Invested", "status": "Open",
+            "maturity_date": maturity.isoformat(), "notepad": "", "start_year": start_year,
+            "interest_rate": rng.choice([None, 5.5, 6.8, 7.1, 7.5]),
+            "compounding": rng.choice([None, 0, 1, 4, 12]),
+        }
+        year_rows = schedule.build(account_type, start_year, month_values, maturity, 0.0)
+        if year_rows:
+            entries.append(ledger.Entry(None, fields, year_rows))
+    ledger.write_batch(conn, entries)
+
+
+def reference(instruments, deposits, as_of):
+    """Per-deposit loop with the same rules as valuation.value_deposits()."""
+    terms = {row[0]: row for row in instruments}
+    book = {row[1]: [0.0, 0.0, 0.0] for row in instruments}
+    for instrument_id, ordinal, amount in deposits:
+        _, investment_id, _, _, account_type, rate, compounding, maturity_date = terms[instrument_id]
+        n = compounding if compounding is not None else valuation.DEFAULT_COMPOUNDING[account_type]
+        deposited = date(ordinal // 12, ordinal % 12 + 1, 1)
+        maturity = date.fromisoformat(maturity_date)
+
+        def grow(until):
+            years = max((until - deposited).days, 0) / valuation.DAYS_PER_YEAR
+            r = rate / 100
+            return amount * ((1 + r / n) ** (n * years) if n else 1 + r * years)
+
+        entry = book[investment_id]
+        if deposited <= as_of:
+            entry[0] += amount
+            entry[1] += grow(min(as_of, maturity))
+        entry[2] += grow(maturity)
+    return book
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instruments", type=int, default=50000)
+    parser.add_argument("--as-of", default=date.today().isoformat())
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    as_of = date.fromisoformat(args.as_of)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        conn = db.connect(os.path.join(tmp, "book.db"))
+        migrations.migrate(conn)
+        t0 = time.perf_counter()
+        build(conn, args.instruments)
+        deposit_count = len(conn.execute(valuation.DEPOSITS_QUERY).fetchall())
+        print(f"built {args.instruments} instruments ({deposit_count} deposits) in {time.perf_counter() - t0:.1f} s")
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            instruments = conn.execute(valuation.INSTRUMENTS_QUERY).fetchall()
+            deposits = conn.execute(valuation.DEPOSITS_QUERY).fetchall()
+        query_ms = (time.perf_counter() - t0) / args.repeat * 1000
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            _, rows = valuation.value_deposits(instruments, deposits, as_of)
+        engine_ms = (time.perf_counter() - t0) / args.repeat * 1000
+
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            book = reference(instruments, deposits, as_of)
+        loop_ms = (time.perf_counter() - t0) / args.repeat * 1000
+
+        # value_book() rounds to paise
+        worst = max(abs(actual - wanted)
+                    for row in rows
+                    for actual, wanted in zip((row[7], row[8], row[10]), book[row[0]]))
+        print(f"queries:           {query_ms:8.1f} ms")
+        print(f"value_deposits():  {engine_ms:8.1f} ms")
+        print(f"python loop:       {loop_ms:8.1f} ms")
+        print(f"max difference:    {worst:.4f}")
+        conn.close()
+        sys.exit(0 if worst <= 0.0051 else 1)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
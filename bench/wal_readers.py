@@ -0,0 +1,118 @@
+"""Load test: do readers stall while another worker holds a write transaction?
+
+Runs the same workload twice against a throwaway database, once in the old
+rollback-journal mode and once through db.connect() (WAL). A writer thread
+rewrites every row with a tiny page cache, so the rollback journal has to take
+the exclusive lock mid-transaction, then holds the transaction open for
+--hold seconds. Reader threads keep running a bank totals query and we
+report their latency.
+
+    python bench/wal_readers.py --rows 20000 --readers 4 --hold 1.0
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import ledger  # noqa: E402
+import migrations  # noqa: E402
+
+BANKS = ["Axis", "HDFC", "SBI", "IDFC", "PostOffice"]
+
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    fields = {"account_type": "FD", "saving_invested": "Invested", "status": "Open",
+              "maturity_date": "2030-01-01", "notepad": ""}
+    for i in range(rows):
+        fields.update(reference_name=f"INV-{i}", bank=BANKS[i % len(BANKS)])
+        ledger.write_instrument(conn, i, fields, [(2020 + i % 10, [1.0] * 12)])
+    conn.commit()
+    conn.close()
+
+
+def open_conn(path, mode):
+    if mode == "wal":
+        return db.connect(path)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    return conn
+
+
+def run(mode, rows, readers, hold):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        seed(path, rows)
+        started = threading.Event()
+        done = threading.Event()
+        latencies = []
+        lock = threading.Lock()
+
+        def writer():
+            conn = open_conn(path, mode)
+            conn.execute("PRAGMA cache_size=10")
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE instruments SET notepad = hex(randomblob(64))")
+            started.set()
+            time.sleep(hold)
+            conn.commit()
+            conn.close()
+            done.set()
+
+        def reader(n):
+            conn = open_conn(path, mode)
+            started.wait()
+            while not done.is_set():
+                t0 = time.perf_counter()
+                conn.execute(
+                    "SELECT COUNT(*), SUM(c.amount) FROM instruments i "
+                    "JOIN cashflows c ON c.instrument_id = i.id WHERE i.bank = ?",
+                    (BANKS[n % len(BANKS)],)
+                ).fetchone()
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+            conn.close()
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "reads": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--hold", type=float, default=1.0, help="seconds the writer keeps its transaction open")
+    args = parser.parse_args()
+    for mode in ("rollback", "wal"):
+        result = run(mode, args.rows, args.readers, args.hold)
+        print("{mode:>8}: {reads:6d} reads  p50 {p50_ms} ms  p99 {p99_ms} ms  max {max_ms} ms".format(**result))
+
+
+if __name__ == "__main__":
+    main()
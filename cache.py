@@ -0,0 +1,264 @@
+import functools
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+
+import compression
+from db import current_portfolio, get_db
+
+
+DEFAULT_TTL = 300                  # seconds an entry may be served for
+DEFAULT_MAX_ENTRIES = 512
+
+
+def data_version(conn):
+    """Counter bumped by triggers on every write to instruments or options."""
+    row = conn.execute("SELECT value FROM app_state WHERE key = 'data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+class MemoryCache:
+    """Per-process LRU with a TTL on each entry."""
+
+    name = "memory"
+    not_modified = 0
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCache:
+    """Entries pickled into a directory, so every gunicorn worker shares them.
+
+    Point it at a tmpfs such as /dev/shm to keep it in shared memory. Expiry
+    uses wall-clock time since workers don't share a monotonic clock; the
+    least recently written files are pruned past ``max_entries``. Hit/miss
+    counters are per process.
+    """
+
+    name = "file"
+    not_modified = 0
+
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        _private_directory(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                expires, stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        if stored_key != key or expires < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((time.time() + self.ttl, key, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(key))
+        self._prune()
+
+    def _prune(self):
+        names = [n for n in os.listdir(self.directory) if not n.startswith(".tmp-")]
+        if len(names) <= self.max_entries:
+            return
+        paths = [os.path.join(self.directory, n) for n in names]
+        paths.sort(key=lambda p: os.stat(p).st_mtime if os.path.exists(p) else 0)
+        for path in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def __len__(self):
+        return sum(1 for n in os.listdir(self.directory) if not n.startswith(".tmp-"))
+
+
+def _private_directory(directory):
+    """Create ``directory`` 0700, and refuse one another user owns or can write.
+
+    Entries are unpickled, so whoever can write a file there can run code
+    in every worker.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+        raise ValueError(f"response cache directory {directory} is not a directory")
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise ValueError(f"response cache directory {directory} must be owned by uid "
+                         f"{os.getuid()} with mode 0700, not uid {st.st_uid} mode "
+                         f"{stat.S_IMODE(st.st_mode):o}")
+
+
+class NullCache:
+    name = "off"
+    hits = misses = not_modified = 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+def from_config(spec, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+    """'memory' (default), 'file' / 'file:<dir>', or 'off'."""
+    kind, _, location = (spec or "memory").partition(":")
+    if kind == "off":
+        return NullCache()
+    if kind == "file":
+        if not location:
+            shm = "/dev/shm"
+            location = os.path.join(shm if os.path.isdir(shm) else tempfile.gettempdir(),
+                                    f"investment-tracker-cache-{os.getuid()}")
+        return FileCache(location, max_entries, ttl)
+    if kind == "memory":
+        return MemoryCache(max_entries, ttl)
+    raise ValueError(f"unknown RESPONSE_CACHE backend: {spec!r}")
+
+
+def init_app(app):
+    app.extensions["response_cache"] = from_config(
+        app.config.get("RESPONSE_CACHE"),
+        app.config.get("RESPONSE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+        app.config.get("RESPONSE_CACHE_TTL", DEFAULT_TTL),
+    )
+
+
+def backend():
+    return current_app.extensions["response_cache"]
+
+
+def memoize(name, loader, *parts):
+    """Return ``loader()`` cached under ``name`` for the current portfolio and data version."""
+    key = (name, current_portfolio(), data_version(get_db())) + parts
+    value = backend().get(key)
+    if value is None:
+        value = loader()
+        backend().set(key, value)
+    return value
+
+
+def cached_page(vary=None):
+    """Cache a GET view's 200 responses by path, query args, portfolio and data version.
+
+    ``vary`` returns anything else the page depends on (e.g. the current
+    month). Responses carry an ETag derived from the same key, so a browser
+    revalidating an unchanged page gets a 304 without the page being rendered
+    or even read from the cache. With COMPRESS on, the page is also cached
+    compressed in the encoding the client accepts.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), current_portfolio(),
+                   data_version(get_db()), vary() if vary else None)
+            etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+            cache = backend()
+            if request.if_none_match.contains_weak(etag):
+                cache.not_modified += 1
+                return Response(status=304, headers={"ETag": f'"{etag}"'})
+
+            # each encoding is cached separately, so a hit is never compressed again
+            encoding = (compression.choose_encoding(request.accept_encodings)
+                        if current_app.config.get("COMPRESS") else None)
+            entry = cache.get(key + (encoding,))
+            if entry is None:
+                plain = cache.get(key + (None,)) if encoding else None
+                if plain is None:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    plain = (None, response.get_data(), response.mimetype)
+                    cache.set(key + (None,), plain)
+                _, body, mimetype = plain
+                entry = (*compression.encode(body, encoding), mimetype)
+                if encoding:
+                    cache.set(key + (encoding,), entry)
+            encoding, body, mimetype = entry
+            response = Response(body, mimetype=mimetype)
+            response.vary.add("Accept-Encoding")
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            # compressed bytes are only weakly equal to the page
+            response.set_etag(etag, weak=bool(encoding))
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
+def stats():
+    cache = backend()
+    return {
+        "backend": cache.name,
+        "entries": len(cache),
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "not_modified": cache.not_modified,
+        "data_version": data_version(get_db()),
+    }
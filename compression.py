@@ -0,0 +1,67 @@
+"""Response body compression negotiated from Accept-Encoding.
+
+Brotli is used when the optional ``brotli`` package is installed and the
+client accepts it; gzip otherwise.
+"""
+import gzip
+
+MIN_SIZE = 1024            # smaller bodies aren't worth the CPU
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5         # brotli's sweet spot for dynamic responses
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def encode(body, encoding):
+    """(encoding, body compressed with it), or (None, body) if there is none or it's too small to bother."""
+    if encoding is None or len(body) < MIN_SIZE:
+        return None, body
+    if encoding == "br":
+        return "br", brotli.compress(body, quality=BROTLI_QUALITY)
+    return "gzip", gzip.compress(body, GZIP_LEVEL)
+
+
+def compress_response(response, accept_encodings):
+    """Compress ``response`` in place if the client and the body allow it."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding, body = encode(response.get_data(), choose_encoding(accept_encodings))
+    if encoding is None:
+        return response
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    etag, _ = response.get_etag()
+    if etag:
+        # same content, different bytes: only weakly equal to the original
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_bytes(data):
+    """(encoding, compressed) for a blob to store: brotli if installed, gzip otherwise."""
+    if brotli is not None:
+        return "br", brotli.compress(data, quality=BROTLI_QUALITY)
+    return "gzip", gzip.compress(data, GZIP_LEVEL)
+
+
+def decompress_bytes(encoding, data):
+    if encoding == "br":
+        if brotli is None:
+            raise RuntimeError("brotli is needed to read this data: pip install brotli")
+        return brotli.decompress(data)
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"unknown encoding: {encoding!r}")
@@ -0,0 +1,181 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from flask import g, request
+
+
+# The default portfolio's database; other portfolios are <name>.db files in
+# PORTFOLIO_DIR, one database (and one write lock) each.
+DB_PATH = os.environ.get("DATABASE", "data.db")
+PORTFOLIO_DIR = os.environ.get("PORTFOLIO_DIR", "")
+DEFAULT_PORTFOLIO = "default"
+PORTFOLIO_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+# endpoints that work whatever portfolio the request names (e.g. switching away from a deleted one)
+PORTFOLIO_FREE_ENDPOINTS = {"select_portfolio", "static"}
+
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16 * 1024          # per-connection page cache
+MMAP_SIZE = 64 * 1024 * 1024       # memory-mapped reads
+STATEMENT_CACHE_SIZE = 256         # prepared statements kept per connection
+POOL_SIZE = 8                      # idle connections kept per portfolio per worker process
+MAX_POOLED_PORTFOLIOS = 16         # portfolios with idle connections kept, least recently used dropped
+
+_pools = OrderedDict()             # database path -> LifoQueue of idle connections
+_pools_lock = threading.Lock()
+_pool_pid = os.getpid()
+_factory = sqlite3.Connection
+
+
+class UnknownPortfolio(LookupError):
+    pass
+
+
+def portfolio_path(name=None):
+    """Database path for portfolio ``name`` (the default portfolio if empty).
+
+    Raises ValueError for a malformed name or when portfolios are not
+    configured, UnknownPortfolio if the database does not exist.
+    """
+    if not name or name == DEFAULT_PORTFOLIO:
+        return DB_PATH
+    if not PORTFOLIO_NAME.match(name):
+        raise ValueError(f"invalid portfolio name: {name!r}")
+    if not PORTFOLIO_DIR:
+        raise ValueError("portfolios are not enabled; set PORTFOLIO_DIR")
+    path = os.path.join(PORTFOLIO_DIR, f"{name}.db")
+    if not os.path.exists(path):
+        raise UnknownPortfolio(name)
+    return path
+
+
+def new_portfolio_path(name):
+    """Path for a portfolio that is about to be created."""
+    if name == DEFAULT_PORTFOLIO or not PORTFOLIO_NAME.match(name or ""):
+        raise ValueError(f"invalid portfolio name: {name!r}")
+    if not PORTFOLIO_DIR:
+        raise ValueError("portfolios are not enabled; set PORTFOLIO_DIR")
+    os.makedirs(PORTFOLIO_DIR, exist_ok=True)
+    return os.path.join(PORTFOLIO_DIR, f"{name}.db")
+
+
+def portfolios():
+    """Names of all portfolios, the default first."""
+    names = []
+    if PORTFOLIO_DIR and os.path.isdir(PORTFOLIO_DIR):
+        names = sorted(entry[:-3] for entry in os.listdir(PORTFOLIO_DIR)
+                       if entry.endswith(".db") and PORTFOLIO_NAME.match(entry[:-3])
+                       and entry[:-3] != DEFAULT_PORTFOLIO)
+    return [DEFAULT_PORTFOLIO] + names
+
+
+def set_connection_factory(factory):
+    """Use ``factory`` (a sqlite3.Connection subclass) for connections opened from now on."""
+    global _factory
+    _factory = factory
+
+
+def connect(path=None):
+    """Open a connection with the pragmas every worker should run with.
+
+    WAL lets readers keep going while another worker writes, and
+    synchronous=NORMAL is durable across application crashes in WAL mode
+    while skipping the fsync on every commit.
+    """
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=_factory,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _reset_pool_after_fork():
+    # gunicorn forks workers after import; sqlite connections must not be
+    # shared with the parent, so each process starts with empty pools.
+    global _pools, _pool_pid
+    if _pool_pid != os.getpid():
+        _pools = OrderedDict()
+        _pool_pid = os.getpid()
+
+
+def _pool(path):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = queue.LifoQueue(maxsize=POOL_SIZE)
+            while len(_pools) > MAX_POOLED_PORTFOLIOS:
+                _, dropped = _pools.popitem(last=False)
+                while not dropped.empty():
+                    dropped.get_nowait().close()
+        else:
+            _pools.move_to_end(path)
+        return pool
+
+
+def acquire(path=None):
+    _reset_pool_after_fork()
+    path = path or DB_PATH
+    try:
+        return _pool(path).get_nowait()
+    except queue.Empty:
+        return connect(path)
+
+
+def release(conn, path=None):
+    _reset_pool_after_fork()
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool(path or DB_PATH).put_nowait(conn)
+    except (queue.Full, sqlite3.Error):
+        conn.close()
+
+
+def current_portfolio():
+    """Portfolio selected by the current request: ?portfolio=, X-Portfolio or the portfolio cookie."""
+    if "portfolio" not in g:
+        g.portfolio = (request.args.get("portfolio") or request.headers.get("X-Portfolio")
+                       or request.cookies.get("portfolio") or DEFAULT_PORTFOLIO)
+    return g.portfolio
+
+
+def get_db():
+    """Return the connection bound to the current request, taking one from its portfolio's pool."""
+    if "db" not in g:
+        g.db_path = portfolio_path(current_portfolio())
+        g.db = acquire(g.db_path)
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop("db", None)
+    if conn is not None:
+        release(conn, g.pop("db_path", None))
+
+
+def _check_portfolio():
+    if request.endpoint in PORTFOLIO_FREE_ENDPOINTS:
+        return None
+    try:
+        portfolio_path(current_portfolio())
+    except UnknownPortfolio as e:
+        return f"Unknown portfolio: {e}", 404
+    except ValueError as e:
+        return f"Error: {e}", 400
+
+
+def init_app(app):
+    app.before_request(_check_portfolio)
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,68 @@
+import csv
+import io
+import tempfile
+import zlib
+
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024   # xlsx output stays in memory up to this size
+
+
+def csv_chunks(header, rows, compress=False):
+    """Yield the CSV for ``rows`` in ~CHUNK_SIZE pieces, gzip-compressed if asked.
+
+    ``rows`` is consumed lazily (e.g. straight from a sqlite3 cursor) so memory
+    use does not depend on the number of rows exported.
+    """
+    gzip = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return gzip.compress(data) if gzip else data
+
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            chunk = flush()
+            if chunk:
+                yield chunk
+    chunk = flush()
+    if gzip:
+        chunk += gzip.flush()
+    if chunk:
+        yield chunk
+
+
+def write_xlsx(header, rows, sheet_name="investments", output=None):
+    """Write ``rows`` to an .xlsx and return the output rewound.
+
+    ``output`` defaults to a spooled temp file. XlsxWriter's constant_memory
+    mode flushes each row as it is written, so only the finished file (in
+    memory up to SPOOL_MAX_SIZE, on disk beyond) is held, never the whole
+    table. Pass a path to write the workbook there instead.
+    """
+    return write_xlsx_sheets([(sheet_name, header, rows)], output)
+
+
+def write_xlsx_sheets(sheets, output=None):
+    """write_xlsx() for several (sheet_name, header, rows) sheets, written in order."""
+    import xlsxwriter
+
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    bold = workbook.add_format({"bold": True})
+    for sheet_name, header, rows in sheets:
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, header, bold)
+        for row_number, row in enumerate(rows, start=1):
+            worksheet.write_row(row_number, 0, row)
+    workbook.close()
+    if not isinstance(output, str):
+        output.seek(0)
+    return output
@@ -0,0 +1,7 @@
+"""gunicorn settings, read from the working directory by `gunicorn app:app`."""
+
+
+def post_worker_init(worker):
+    # background threads belong to serving processes only, one set per worker
+    import app
+    app.start_background()
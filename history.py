@@ -0,0 +1,194 @@
+"""Change log, monthly snapshots and point-in-time reads of the ledger.
+
+Triggers (migration 12) append every change to instruments and cashflows
+to change_log. snapshot() stores a compressed copy of the ledger tables,
+with the summary tables and maturity calendar the triggers keep, tagged
+with the last change_log row it includes; the maturity scheduler takes one
+a month. restore() rebuilds the ledger as of a past moment in an in-memory
+database: it loads the newest snapshot before that moment and replays only
+the log rows after it, and the usual read queries then run against the
+copy unchanged.
+
+Times are UTC, as datetime('now') records them. History starts with the
+first snapshot, which the maturity scheduler (or `flask sweep-maturities`
+from cron) takes on its first pass over a database that has none.
+"""
+import json
+import logging
+import sqlite3
+import time
+from datetime import datetime
+
+import compression
+import db
+import migrations
+
+
+log = logging.getLogger(__name__)
+
+LOG_TRIGGERS = [f"trg_{table}_log_{event}"
+                for table in ("instruments", "cashflows") for event in ("insert", "update", "delete")]
+
+_COLUMNS = ", ".join(migrations.CHANGE_LOG_COLUMNS)
+_UPSERT_INSTRUMENT = (
+    f"INSERT INTO instruments ({_COLUMNS}) VALUES ({', '.join('?' * len(migrations.CHANGE_LOG_COLUMNS))}) "
+    f"ON CONFLICT (id) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in migrations.CHANGE_LOG_COLUMNS[1:])
+)
+SNAPSHOT_MONTH_KEY = "history.snapshot_month"   # app_state: the month whose snapshot is claimed
+
+_UPSERT_CASHFLOW = """
+    INSERT INTO cashflows (instrument_id, month_ordinal, amount) VALUES (?, ?, ?)
+    ON CONFLICT (instrument_id, month_ordinal) DO UPDATE SET amount = excluded.amount
+"""
+
+
+def parse_as_of(value):
+    """'YYYY-MM-DD' (the end of that day) or 'YYYY-MM-DDTHH:MM[:SS]' -> (change_log bound, date).
+
+    Raises ValueError for anything else.
+    """
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid as_of: {value!r}")
+    if len(value) <= 10:
+        moment = moment.replace(hour=23, minute=59, second=59)
+    return moment.strftime("%Y-%m-%d %H:%M:%S"), moment.date()
+
+
+# --- snapshots ---
+
+def _main_path(conn):
+    path = next(path for _, name, path in conn.execute("PRAGMA database_list") if name == "main")
+    if not path:
+        raise ValueError("snapshots need a database file")
+    return path
+
+
+def build(conn):
+    """(last change_log seq included, serialized database) of the ledger as it is now.
+
+    The copy is a freshly migrated database without the change-log
+    triggers, filled from ``conn``'s file in one read transaction so the
+    rows and the seq agree.
+    """
+    copy = sqlite3.connect(":memory:")
+    try:
+        migrations.migrate(copy)
+        for name in LOG_TRIGGERS:
+            copy.execute(f"DROP TRIGGER {name}")
+        copy.execute("ATTACH DATABASE ? AS src", (_main_path(conn),))
+        with copy:
+            copy.execute("BEGIN")
+            seq = copy.execute("SELECT IFNULL(MAX(seq), 0) FROM src.change_log").fetchone()[0]
+            copy.execute("INSERT INTO options (id, type, value) SELECT id, type, value FROM src.options")
+            copy.execute(f"INSERT INTO instruments ({_COLUMNS}) SELECT {_COLUMNS} FROM src.instruments")
+            copy.execute("""
+                INSERT INTO cashflows (instrument_id, month_ordinal, amount)
+                SELECT instrument_id, month_ordinal, amount FROM src.cashflows
+            """)
+        copy.execute("DETACH DATABASE src")
+        copy.execute("VACUUM")
+        return seq, copy.serialize()
+    finally:
+        copy.close()
+
+
+def snapshot(conn):
+    """Store a compressed snapshot of the ledger now. Returns its details as a dict."""
+    started = time.perf_counter()
+    seq, data = build(conn)
+    encoding, blob = compression.compress_bytes(data)
+    with conn:
+        snapshot_id = conn.execute(
+            "INSERT INTO snapshots (taken_at, seq, encoding, size, data) VALUES (datetime('now'), ?, ?, ?, ?)",
+            (seq, encoding, len(data), blob)
+        ).lastrowid
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    log.info("snapshot %d at seq %d: %d bytes, %d stored, %.0f ms",
+             snapshot_id, seq, len(data), len(blob), duration_ms)
+    return {"id": snapshot_id, "seq": seq, "size": len(data), "stored": len(blob), "duration_ms": duration_ms}
+
+
+def snapshot_if_due(conn):
+    """Take a snapshot if there is none, or none this month and the ledger changed since.
+
+    The month is claimed in app_state inside BEGIN IMMEDIATE before the
+    snapshot is built, so when several schedulers (one per gunicorn
+    worker) check at once only one of them takes it. Returns snapshot()'s
+    dict, or None if none was due.
+    """
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        month = conn.execute("SELECT strftime('%Y-%m', 'now')").fetchone()[0]
+        claimed = conn.execute("SELECT value FROM app_state WHERE key = ?", (SNAPSHOT_MONTH_KEY,)).fetchone()
+        latest = conn.execute("SELECT taken_at, seq FROM snapshots ORDER BY seq DESC LIMIT 1").fetchone()
+        if latest:
+            taken_at, seq = latest
+            if month in (taken_at[:7], claimed and claimed[0]):
+                return None
+            if not conn.execute("SELECT 1 FROM change_log WHERE seq > ? LIMIT 1", (seq,)).fetchone():
+                return None
+        elif claimed and claimed[0] == month:
+            return None
+        conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)", (SNAPSHOT_MONTH_KEY, month))
+    try:
+        return snapshot(conn)
+    except Exception:
+        # give the month back so the next check retries
+        with conn:
+            conn.execute("DELETE FROM app_state WHERE key = ? AND value = ?", (SNAPSHOT_MONTH_KEY, month))
+        raise
+
+
+def snapshots(conn):
+    """[(id, taken_at, seq, encoding, size, stored size)], oldest first."""
+    return conn.execute(
+        "SELECT id, taken_at, seq, encoding, size, LENGTH(data) FROM snapshots ORDER BY seq").fetchall()
+
+
+# --- point-in-time reads ---
+
+def restore(conn, bound):
+    """An in-memory copy of the ledger as it was at ``bound`` (see parse_as_of).
+
+    The caller closes it. Raises ValueError if ``bound`` is before the
+    first snapshot, where history starts.
+    """
+    first = conn.execute("SELECT MIN(taken_at) FROM snapshots").fetchone()[0]
+    if first is None or bound < first:
+        raise ValueError(f"no history before {first}" if first else "no snapshots taken yet")
+    upto = conn.execute("SELECT MAX(seq) FROM change_log WHERE changed_at <= ?", (bound,)).fetchone()[0] or 0
+    row = conn.execute(
+        "SELECT seq, encoding, data FROM snapshots WHERE seq <= ? ORDER BY seq DESC LIMIT 1", (upto,)
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"no history before {first}")
+    seq, encoding, data = row
+
+    copy = db.connect(":memory:")
+    try:
+        copy.deserialize(compression.decompress_bytes(encoding, data))
+        # snapshots taken before later migrations lack their tables
+        migrations.migrate(copy)
+        with copy:
+            for instrument_id, month_ordinal, amount, attrs in conn.execute("""
+                SELECT instrument_id, month_ordinal, amount, attrs FROM change_log
+                WHERE seq > ? AND seq <= ? ORDER BY seq
+            """, (seq, upto)):
+                if month_ordinal is not None:
+                    if amount is None:
+                        copy.execute("DELETE FROM cashflows WHERE instrument_id = ? AND month_ordinal = ?",
+                                     (instrument_id, month_ordinal))
+                    else:
+                        copy.execute(_UPSERT_CASHFLOW, (instrument_id, month_ordinal, amount))
+                elif attrs is None:
+                    copy.execute("DELETE FROM instruments WHERE id = ?", (instrument_id,))
+                else:
+                    attrs = json.loads(attrs)
+                    copy.execute(_UPSERT_INSTRUMENT, [attrs[c] for c in migrations.CHANGE_LOG_COLUMNS])
+    except Exception:
+        copy.close()
+        raise
+    return copy
@@ -0,0 +1,351 @@
+"""Streaming import of CSV/XLSX statements into the ledger.
+
+A statement has one row per investment and year, the shape /export
+produces: reference_name, bank, account_type, saving_invested, status,
+year, maturity_date, jan..dec, notepad and optionally interest_rate and
+compounding. Headers are matched loosely (case, spaces, "January" for
+jan, a few common aliases) and ``mapping`` can name the rest.
+
+Rows are read one at a time (csv.reader, or openpyxl's read-only mode
+for .xlsx), validated against the options table, and consecutive rows of
+the same investment are grouped into one ledger.Entry. Each row's content
+hash is looked up in row_hashes (migration 11) and in the rows already read
+from this file, and duplicates are skipped. Entries are written through
+ledger.write_batch() in batches of about BATCH_ROWS year-rows. With
+``dry_run`` nothing is written and the report says what would have been.
+
+A row that matches no stored row imports as a new investment, even when
+other years of the same investment were already stored.
+"""
+import codecs
+import csv
+import hashlib
+import io
+import re
+from datetime import date, datetime
+
+import ledger
+import records
+import valuation
+
+
+FIELDS = ("reference_name", "bank", "account_type", "saving_invested", "status", "year",
+          "maturity_date", *ledger.MONTHS, "notepad", "interest_rate", "compounding")
+REQUIRED = ("bank", "account_type", "saving_invested", "year")
+# fields that identify a year-row's content; status and notepad change over a row's life
+HASH_FIELDS = ("reference_name", "bank", "account_type", "saving_invested", "year", "maturity_date")
+
+ALIASES = {
+    "reference": "reference_name", "ref": "reference_name", "ref_name": "reference_name", "name": "reference_name",
+    "type": "account_type", "account": "account_type",
+    "saving/invested": "saving_invested", "category": "saving_invested",
+    "maturity": "maturity_date", "matures": "maturity_date", "matures_on": "maturity_date",
+    "note": "notepad", "notes": "notepad", "rate": "interest_rate",
+    **{datetime(2000, i + 1, 1).strftime("%B").lower(): month for i, month in enumerate(ledger.MONTHS)},
+}
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d%b%y", "%d %b %Y", "%d-%b-%Y", "%d-%b-%y")
+BATCH_ROWS = 5000              # year-rows per write_batch() transaction
+LOOKUP_CHUNK = 500             # hashes per row_hashes lookup
+INDEX_CHUNK = 5000             # stored year-rows hashed at a time by index_existing()
+MAX_ERRORS = 100               # row errors listed in the report; all are counted
+
+
+def _normal_header(name):
+    return re.sub(r"[\s\-]+", "_", str(name or "").strip().lower())
+
+
+def column_map(header, mapping=None):
+    """({column index: field}, [unmapped header names]) for a statement ``header``.
+
+    ``mapping`` maps statement column names to FIELDS and wins over the
+    automatic matching. Raises ValueError if a required field has no column.
+    """
+    overrides = {_normal_header(k): v for k, v in (mapping or {}).items()}
+    unknown = [v for v in overrides.values() if v not in FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields in mapping: {', '.join(unknown)}")
+    columns, unmapped = {}, []
+    for index, name in enumerate(header):
+        key = _normal_header(name)
+        field = overrides.get(key) or (key if key in FIELDS else ALIASES.get(key))
+        if field and field not in columns.values():
+            columns[index] = field
+        elif key:
+            unmapped.append(str(name))
+    missing = [f for f in REQUIRED if f not in columns.values()]
+    if missing:
+        raise ValueError(f"no column for: {', '.join(missing)}")
+    return columns, unmapped
+
+
+def parse_mapping(text):
+    """'Statement Col=field,Other=field' -> dict."""
+    mapping = {}
+    for part in filter(None, (p.strip() for p in (text or "").split(","))):
+        source, _, field = part.partition("=")
+        if not field:
+            raise ValueError(f"invalid mapping entry: {part!r}")
+        mapping[source.strip()] = field.strip()
+    return mapping
+
+
+def _amount(value):
+    if value is None or value == "":
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "").strip() or 0)
+    except ValueError:
+        raise ValueError(f"invalid amount: {value!r}")
+
+
+def _date(value):
+    if value in (None, ""):
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"invalid maturity date: {text!r}")
+
+
+def parse_row(values, columns, options):
+    """Statement row -> dict of FIELDS with months as a list, or ValueError."""
+    raw = {field: values[index] if index < len(values) else None for index, field in columns.items()}
+    text = {field: str(raw.get(field) if raw.get(field) is not None else "").strip()
+            for field in ("reference_name", "bank", "account_type", "saving_invested", "status", "notepad")}
+    for field in REQUIRED:
+        if field != "year" and not text[field]:
+            raise ValueError(f"missing {field}")
+    for field, allowed in records.ENUMERATIONS.items():
+        if text[field] and text[field] not in allowed:
+            raise ValueError(f"invalid {field}: {text[field]!r}")
+    for field in ("bank", "account_type"):
+        if options is not None and text[field] not in options[field]:
+            raise ValueError(f"unknown {field}: {text[field]!r}")
+    try:
+        year = int(float(raw.get("year")))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid year: {raw.get('year')!r}")
+    if not 1900 <= year <= 2200:
+        raise ValueError(f"invalid year: {year}")
+
+    rate = raw.get("interest_rate")
+    rate = None if rate in (None, "") else _amount(rate)
+    if rate is not None and rate < 0:
+        raise ValueError(f"invalid interest rate: {rate}")
+    compounding = raw.get("compounding")
+    compounding = None if compounding in (None, "") else int(_amount(compounding))
+    if compounding is not None and compounding not in dict(valuation.COMPOUNDING_CHOICES):
+        raise ValueError(f"invalid compounding: {compounding}")
+
+    return {
+        **text, "status": text["status"] or "Open", "year": year,
+        "maturity_date": _date(raw.get("maturity_date")),
+        "months": [_amount(raw.get(month)) for month in ledger.MONTHS],
+        "interest_rate": rate, "compounding": compounding,
+    }
+
+
+def row_hash(values, months):
+    """16-byte content hash of a year-row from its HASH_FIELDS ``values`` and twelve ``months``."""
+    parts = [str(v if v is not None else "").strip() for v in values]
+    parts += [f"{float(m or 0):.2f}" for m in months]
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).digest()
+
+
+def _parsed_hash(row):
+    return row_hash([row[f] for f in HASH_FIELDS], row["months"])
+
+
+def index_existing(conn, dry_run=False):
+    """Hash the stored year-rows of every instrument not in row_hashes yet. Returns rows hashed.
+
+    The ledger is read in chunks and the hashes staged in a temp table, so
+    the rows being scanned don't change under the cursor; they are then
+    copied into row_hashes, or with ``dry_run`` only into temp.import_seen
+    (see _Run), which is never saved.
+    """
+    sql, params = records.filtered_query(
+        {}, "NOT EXISTS (SELECT 1 FROM row_hashes h WHERE h.instrument_id = i.id)")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_index (hash BLOB, instrument_id INTEGER)")
+    conn.execute("DELETE FROM temp.import_index")
+    cursor = conn.execute(sql, params)
+    hashed = 0
+    # INVESTMENT_COLUMNS order: id, investment_id, reference_name, bank, account_type,
+    # saving_invested, status, year, maturity_date, jan..dec, notepad
+    while rows := cursor.fetchmany(INDEX_CHUNK):
+        conn.executemany("INSERT INTO temp.import_index (hash, instrument_id) VALUES (?, ?)",
+                         [(row_hash((r[2], r[3], r[4], r[5], r[7], r[8]), r[9:21]), r[0]) for r in rows])
+        hashed += len(rows)
+    target = ("temp.import_seen (hash) SELECT hash" if dry_run
+              else "row_hashes (hash, instrument_id) SELECT hash, instrument_id")
+    with conn:
+        conn.execute(f"INSERT OR IGNORE INTO {target} FROM temp.import_index")
+        conn.execute("DELETE FROM temp.import_index")
+    return hashed
+
+
+def read_rows(stream, filename):
+    """Yield the rows of a CSV or XLSX ``stream`` (binary), header first, one at a time."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        try:
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            workbook.close()
+        return
+    text = codecs.getreader("utf-8-sig")(stream, errors="replace")
+    yield from csv.reader(text)
+
+
+def load_options(conn):
+    options = {"bank": set(), "account_type": set()}
+    for kind, value in conn.execute("SELECT type, value FROM options WHERE type IN ('bank', 'account_type')"):
+        options[kind].add(value)
+    return options
+
+
+class _Run:
+    """State of one import: the report counters and the pending batch."""
+
+    def __init__(self, conn, dry_run):
+        self.conn = conn
+        self.dry_run = dry_run
+        self.report = {"dry_run": dry_run, "rows": 0, "imported_rows": 0, "duplicate_rows": 0,
+                       "invalid_rows": 0, "investments": 0, "new_options": [], "errors": [],
+                       "unmapped_columns": []}
+        self.pending = []          # [(entry, [hash, ...])] waiting to be written
+        self.pending_rows = 0
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_seen (hash BLOB PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM import_seen")
+
+    def error(self, line, message):
+        self.report["invalid_rows"] += 1
+        if len(self.report["errors"]) < MAX_ERRORS:
+            self.report["errors"].append({"line": line, "error": message})
+
+    def fresh(self, rows):
+        """The rows whose content is neither stored nor earlier in this file; marks them seen."""
+        hashes = [_parsed_hash(row) for row in rows]
+        known = set()
+        for start in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[start:start + LOOKUP_CHUNK]
+            marks = ", ".join("?" * len(chunk))
+            known.update(h for (h,) in self.conn.execute(
+                f"SELECT hash FROM row_hashes WHERE hash IN ({marks}) "
+                f"UNION SELECT hash FROM temp.import_seen WHERE hash IN ({marks})", chunk + chunk))
+        result = []
+        for row, h in zip(rows, hashes):
+            if h in known:
+                self.report["duplicate_rows"] += 1
+                continue
+            known.add(h)
+            result.append((row, h))
+        self.conn.executemany("INSERT OR IGNORE INTO temp.import_seen (hash) VALUES (?)",
+                              [(h,) for _, h in result])
+        return result
+
+    def add_group(self, rows):
+        rows = self.fresh(rows)
+        if not rows:
+            return
+        first = rows[0][0]
+        fields = {name: first[name] for name in ledger.INSTRUMENT_FIELDS}
+        fields["start_year"] = min(row["year"] for row, _ in rows)
+        year_rows = [(row["year"], row["months"]) for row, _ in rows]
+        self.pending.append((ledger.Entry(None, fields, year_rows), [h for _, h in rows]))
+        self.pending_rows += len(rows)
+        self.report["imported_rows"] += len(rows)
+        self.report["investments"] += 1
+        if self.pending_rows >= BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        self.conn.commit()         # the import_seen inserts; write_batch() opens its own transaction
+        if self.pending and not self.dry_run:
+            investment_ids = ledger.write_batch(self.conn, [entry for entry, _ in self.pending])
+            marks = ", ".join("?" * len(investment_ids))
+            ids = dict(self.conn.execute(
+                f"SELECT investment_id, id FROM instruments WHERE investment_id IN ({marks})", investment_ids))
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO row_hashes (hash, instrument_id) VALUES (?, ?)",
+                    [(h, ids[investment_id])
+                     for investment_id, (_, hashes) in zip(investment_ids, self.pending) for h in hashes])
+        self.pending, self.pending_rows = [], 0
+
+
+def _group_key(row):
+    # rows without a reference name cannot be told apart, so each is its own investment
+    if not row["reference_name"]:
+        return None
+    return tuple(row[f] for f in ("reference_name", "bank", "account_type", "saving_invested", "maturity_date"))
+
+
+def run(conn, stream, filename, dry_run=False, mapping=None, add_options=False):
+    """Import the statement in ``stream`` into ``conn``'s ledger and return a report dict.
+
+    Rows naming a bank or account type missing from the options table are
+    rejected unless ``add_options`` is set, in which case the options are
+    added. Raises ValueError if the header cannot be mapped.
+    """
+    state = _Run(conn, dry_run)
+    index_existing(conn, dry_run)
+    report = state.report
+    options = load_options(conn)
+    rows = read_rows(stream, filename)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError("the file is empty")
+    columns, report["unmapped_columns"] = column_map(header, mapping)
+
+    group, group_key = [], None
+    for line, values in enumerate(rows, start=2):
+        if not any(v not in (None, "") for v in values):
+            continue
+        report["rows"] += 1
+        try:
+            row = parse_row(values, columns, None if add_options else options)
+        except ValueError as e:
+            state.error(line, str(e))
+            continue
+        if add_options:
+            for kind in ("bank", "account_type"):
+                if row[kind] not in options[kind]:
+                    options[kind].add(row[kind])
+                    report["new_options"].append({"type": kind, "value": row[kind]})
+        key = _group_key(row)
+        if group and (key is None or key != group_key):
+            state.add_group(group)
+            group = []
+        group.append(row)
+        group_key = key
+    if group:
+        state.add_group(group)
+
+    if report["new_options"] and not dry_run:
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO options (type, value) VALUES (?, ?)",
+                             [(o["type"], o["value"]) for o in report["new_options"]])
+    state.flush()
+    return report
+
+
+def run_file(conn, path, **kwargs):
+    with open(path, "rb") as f:
+        return run(conn, f, path, **kwargs)
+
+
+def run_text(conn, text, filename="statement.csv", **kwargs):
+    return run(conn, io.BytesIO(text.encode("utf-8")), filename, **kwargs)
@@ -0,0 +1,338 @@
+"""Background jobs for exports and multi-year reports.
+
+A job is a row in the jobs table (migration 10) of the portfolio it was
+queued for; workers serve every portfolio. A route enqueues it and
+returns at once; a worker (threads started by the serving process, or a separate
+`flask run-jobs` process) claims the oldest queued row, runs its handler
+with progress updates, and stores the artifact under the artifacts
+directory until the job expires. Claiming is a single UPDATE ... RETURNING
+inside BEGIN IMMEDIATE, so any number of workers across processes can share
+one database without running a job twice.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+
+import db
+import exports
+import ledger
+import records
+import valuation
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL_HOURS = 24
+DEFAULT_ARTIFACTS_DIR = "job_artifacts"
+POLL_SECONDS = 2.0             # how often idle workers look for jobs queued by other processes
+PROGRESS_INTERVAL = 0.5        # seconds between progress writes
+STALE_MINUTES = 10             # a running job without a heartbeat this long is marked failed
+STATUSES = ("queued", "running", "done", "failed")
+
+COLUMNS = ("id", "kind", "params", "status", "progress", "message", "error", "filename", "mimetype",
+           "created_at", "started_at", "finished_at", "expires_at")
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_workers = []
+_stop = threading.Event()
+_wake = threading.Event()
+
+
+# --- job kinds ---
+# check(params) validates and normalizes the parameters at enqueue time;
+# run(conn, params, path, progress) writes the artifact to ``path`` and
+# returns (download filename, mimetype).
+Kind = namedtuple("Kind", "check run")
+
+
+def _check_export(params):
+    fmt = params.get("fmt", "csv")
+    if fmt not in ("csv", "excel"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    filters = records.read_filters(params.get("filters") or {})
+    records.export_query(filters)      # raises ValueError on bad filters
+    return {"fmt": fmt, "filters": {k: v for k, v in filters.items() if v},
+            "gzip": bool(params.get("gzip")) and fmt == "csv"}
+
+
+def _counted(rows, total, progress, message):
+    for n, row in enumerate(rows, start=1):
+        if n % 1000 == 0:
+            progress(n / total if total else 0.0, f"{message} {n}/{total}")
+        yield row
+
+
+def _run_export(conn, params, path, progress):
+    header, query, query_params = records.export_query(records.read_filters(params["filters"]))
+    total = conn.execute(f"SELECT COUNT(*) FROM ({query})", query_params).fetchone()[0]
+    rows = _counted(conn.execute(query, query_params), total, progress, "rows")
+    if params["fmt"] == "excel":
+        exports.write_xlsx(header, rows, output=path)
+        return "investments.xlsx", XLSX
+    with open(path, "wb") as f:
+        for chunk in exports.csv_chunks(header, rows, params["gzip"]):
+            f.write(chunk)
+    if params["gzip"]:
+        return "investments.csv.gz", "application/gzip"
+    return "investments.csv", "text/csv"
+
+
+def _check_report(params):
+    this_year = date.today().year
+    try:
+        first = int(params.get("from_year") or this_year - 9)
+        last = int(params.get("to_year") or this_year)
+    except (TypeError, ValueError):
+        raise ValueError("from_year and to_year must be years")
+    if first > last:
+        raise ValueError("from_year is after to_year")
+    return {"from_year": first, "to_year": last}
+
+
+def _run_report(conn, params, path, progress):
+    first, last = params["from_year"], params["to_year"]
+    span = (first * 12, last * 12 + 11)
+    years = list(range(first, last + 1))
+
+    progress(0.1, "monthly totals")
+    monthly = conn.execute(f"""
+        SELECT bank, account_type, saving_invested, month_ordinal / 12 AS year,
+               {", ".join(f"TOTAL(CASE WHEN month_ordinal % 12 = {i} THEN total END)"
+                          for i in range(12))},
+               TOTAL(total)
+        FROM summary_monthly
+        WHERE month_ordinal BETWEEN ? AND ?
+        GROUP BY bank, account_type, saving_invested, year
+        ORDER BY bank, account_type, saving_invested, year
+    """, span).fetchall()
+
+    progress(0.4, "totals by year")
+    by_year = {}
+    for bank, saving_invested, year, total in conn.execute("""
+        SELECT bank, saving_invested, month_ordinal / 12 AS year, TOTAL(total)
+        FROM summary_monthly
+        WHERE month_ordinal BETWEEN ? AND ?
+        GROUP BY bank, saving_invested, year
+    """, span):
+        by_year.setdefault((bank, saving_invested), {})[year] = total
+    yearly = [(bank, kind, *(totals.get(y, 0.0) for y in years), sum(totals.values()))
+              for (bank, kind), totals in sorted(by_year.items())]
+
+    progress(0.6, "valuation")
+    columns, book = valuation.value_book(conn)
+
+    progress(0.8, "writing workbook")
+    exports.write_xlsx_sheets([
+        ("by_year", ["bank", "saving_invested", *map(str, years), "total"], yearly),
+        ("monthly", ["bank", "account_type", "saving_invested", "year", *ledger.MONTHS, "total"], monthly),
+        ("valuation", columns, book),
+    ], output=path)
+    return f"report-{first}-{last}.xlsx", XLSX
+
+
+KINDS = {
+    "export": Kind(_check_export, _run_export),
+    "report": Kind(_check_report, _run_report),
+}
+
+
+# --- queue ---
+
+def _row(row):
+    job = dict(zip(COLUMNS, row))
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def enqueue(conn, kind, params=None):
+    """Validate ``params`` for ``kind`` and queue the job. Returns the job dict.
+
+    Raises ValueError for an unknown kind or bad parameters.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    params = KINDS[kind].check(params or {})
+    with conn:
+        job_id = conn.execute(
+            "INSERT INTO jobs (kind, params, created_at) VALUES (?, ?, datetime('now'))",
+            (kind, json.dumps(params))
+        ).lastrowid
+    _wake.set()
+    return get(conn, job_id)
+
+
+def get(conn, job_id):
+    row = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row(row) if row else None
+
+
+def recent(conn, limit=20):
+    rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+    return [_row(row) for row in rows]
+
+
+def artifact(conn, job_id):
+    """(path, filename, mimetype) of a finished, unexpired job, or None."""
+    row = conn.execute("""
+        SELECT artifact, filename, mimetype FROM jobs
+        WHERE id = ? AND status = 'done' AND expires_at > datetime('now')
+    """, (job_id,)).fetchone()
+    if row and row[0] and os.path.exists(row[0]):
+        return row
+    return None
+
+
+def claim(conn, worker):
+    """Mark the oldest queued job running for ``worker`` and return (id, kind, params), or None."""
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""
+            UPDATE jobs
+            SET status = 'running', worker = ?, started_at = datetime('now'), heartbeat_at = datetime('now')
+            WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+            RETURNING id, kind, params
+        """, (worker,)).fetchall()    # step to completion before the commit
+    if not row:
+        return None
+    job_id, kind, params = row[0]
+    return job_id, kind, json.loads(params)
+
+
+def _finish(conn, job_id, **values):
+    assignments = ", ".join(f"{key} = ?" for key in values)
+    with conn:
+        conn.execute(f"UPDATE jobs SET {assignments}, finished_at = datetime('now') WHERE id = ?",
+                     (*values.values(), job_id))
+
+
+def _expiry(conn, ttl_hours):
+    return conn.execute("SELECT datetime('now', ?)", (f"+{ttl_hours} hours",)).fetchone()[0]
+
+
+def run_one(conn, worker, artifacts_dir, ttl_hours=DEFAULT_TTL_HOURS, portfolio=db.DEFAULT_PORTFOLIO):
+    """Claim and run one job from ``portfolio``'s queue. Returns False if it was empty.
+
+    ``conn`` is a connection to that portfolio's database. Job data is read
+    on a connection of its own, so progress writes on ``conn`` never
+    interleave with the handler's open cursors.
+    """
+    claimed = claim(conn, worker)
+    if claimed is None:
+        return False
+    job_id, kind, params = claimed
+    os.makedirs(artifacts_dir, exist_ok=True)
+    path = os.path.abspath(os.path.join(artifacts_dir, f"job-{portfolio}-{job_id}"))
+    last_write = [0.0]
+
+    def progress(fraction, message=None):
+        now = time.monotonic()
+        if now - last_write[0] < PROGRESS_INTERVAL:
+            return
+        last_write[0] = now
+        with conn:
+            conn.execute("UPDATE jobs SET progress = ?, message = ?, heartbeat_at = datetime('now') WHERE id = ?",
+                         (round(min(max(fraction, 0.0), 1.0), 3), message, job_id))
+
+    started = time.perf_counter()
+    data = db.connect(db.portfolio_path(portfolio))
+    try:
+        filename, mimetype = KINDS[kind].run(data, params, path, progress)
+    except Exception as e:
+        log.exception("job %d (%s) failed", job_id, kind)
+        if os.path.exists(path):
+            os.remove(path)
+        _finish(conn, job_id, status="failed", error=f"{type(e).__name__}: {e}",
+                expires_at=_expiry(conn, ttl_hours))
+        return True
+    finally:
+        data.close()
+    _finish(conn, job_id, status="done", progress=1.0, message=None, artifact=path,
+            filename=filename, mimetype=mimetype, expires_at=_expiry(conn, ttl_hours))
+    log.info("job %d (%s) done in %.1f s", job_id, kind, time.perf_counter() - started)
+    return True
+
+
+def cleanup(conn, ttl_hours=DEFAULT_TTL_HOURS):
+    """Delete expired jobs with their artifacts, and fail jobs whose worker went away.
+
+    Failed jobs expire ``ttl_hours`` after they finished, like finished
+    ones. Returns (expired, stale) counts.
+    """
+    expired = conn.execute("""
+        SELECT id, artifact FROM jobs
+        WHERE expires_at <= datetime('now')
+           OR (status = 'failed' AND expires_at IS NULL AND finished_at <= datetime('now', ?))
+    """, (f"-{ttl_hours} hours",)).fetchall()
+    for _, path in expired:
+        if path and os.path.exists(path):
+            os.remove(path)
+    with conn:
+        conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id, _ in expired])
+        stale = conn.execute("""
+            UPDATE jobs SET status = 'failed', error = 'worker stopped', finished_at = datetime('now'),
+                            expires_at = datetime('now', ?)
+            WHERE status = 'running' AND heartbeat_at < datetime('now', ?)
+        """, (f"+{ttl_hours} hours", f"-{STALE_MINUTES} minutes")).rowcount
+    return len(expired), stale
+
+
+# --- workers ---
+
+def work(worker, artifacts_dir, ttl_hours=DEFAULT_TTL_HOURS, stop=None):
+    """Run jobs from every portfolio until ``stop`` is set.
+
+    Each pass takes at most one job per portfolio, so a long queue in one
+    portfolio does not starve the others; when every queue is empty the
+    worker sleeps up to POLL_SECONDS.
+    """
+    stop = stop or _stop
+    connections = {}
+    try:
+        next_cleanup = 0.0
+        while not stop.is_set():
+            ran = False
+            cleaning = time.monotonic() >= next_cleanup
+            for portfolio in db.portfolios():
+                try:
+                    conn = connections.get(portfolio)
+                    if conn is None:
+                        conn = connections[portfolio] = db.connect(db.portfolio_path(portfolio))
+                    if cleaning:
+                        cleanup(conn, ttl_hours)
+                    ran = run_one(conn, worker, artifacts_dir, ttl_hours, portfolio) or ran
+                except db.UnknownPortfolio:
+                    pass
+                except Exception:
+                    log.exception("job worker %s failed on portfolio %s", worker, portfolio)
+            if cleaning:
+                next_cleanup = time.monotonic() + 60
+            if ran:
+                continue
+            _wake.wait(POLL_SECONDS)
+            _wake.clear()
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+
+def start_workers(count, artifacts_dir, ttl_hours=DEFAULT_TTL_HOURS):
+    """Start ``count`` daemon worker threads in this process. Safe to call more than once."""
+    global _workers
+    _workers = [t for t in _workers if t.is_alive()]
+    _stop.clear()
+    for n in range(len(_workers), count):
+        name = f"jobs-{os.getpid()}-{n}"
+        thread = threading.Thread(target=work, args=(name, artifacts_dir, ttl_hours), name=name, daemon=True)
+        thread.start()
+        _workers.append(thread)
+    return _workers
+
+
+def stop_workers():
+    _stop.set()
+    _wake.set()
@@ -0,0 +1,167 @@
+"""Upcoming maturities, the maturity ladder and the .ics feed.
+
+All three read maturity_calendar (migration 9), whose primary key is
+(maturity_date, instrument_id): the next k maturities after a date are a
+range scan of k rows, however large the book is.
+"""
+from datetime import date, datetime, timedelta
+
+
+BUCKETS = {
+    "week": "DATE(m.maturity_date, 'weekday 0', '-6 days')",     # Monday of the week
+    "month": "SUBSTR(m.maturity_date, 1, 7) || '-01'",
+    "quarter": ("SUBSTR(m.maturity_date, 1, 4) || '-' || "
+                "PRINTF('%02d', (CAST(SUBSTR(m.maturity_date, 6, 2) AS INTEGER) - 1) / 3 * 3 + 1) || '-01'"),
+}
+DEFAULT_HORIZON_DAYS = 365
+
+# Principal behind a calendar row: an RD's deposits add up, while an FD/NSC
+# (and anything else) stores the same principal in every month.
+PRINCIPAL = """
+    (SELECT CASE WHEN m.account_type = 'RD' THEN TOTAL(c.amount) ELSE IFNULL(MAX(c.amount), 0) END
+     FROM cashflows c WHERE c.instrument_id = m.instrument_id)
+"""
+FILTERS = ("bank", "account_type")
+
+
+def _filter_where(filters):
+    where, params = [], []
+    for field in FILTERS:
+        if filters.get(field):
+            where.append(f"m.{field} = ?")
+            params.append(filters[field])
+    return "".join(f" AND {w}" for w in where), params
+
+
+def date_arg(value, default):
+    """ISO date string -> date; blank -> ``default``. Raises ValueError otherwise."""
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"invalid date: {value!r}")
+
+
+def read_args(args):
+    """(bucket, start, end, filters) from a ladder query string."""
+    start = date_arg(args.get("start"), date.today())
+    end = date_arg(args.get("end"), start + timedelta(days=DEFAULT_HORIZON_DAYS))
+    filters = {field: args.get(field, "") for field in FILTERS}
+    return args.get("bucket") or "month", start, end, filters
+
+
+def upcoming(conn, limit=4, start=None):
+    """Earliest maturity on or after ``start`` (default today) per reference name, soonest first.
+
+    Returns up to ``limit`` (reference_name, bank, account_type, maturity_date)
+    tuples. Rows are read in date order and stop as soon as ``limit``
+    distinct references are seen.
+    """
+    start = (start or date.today()).isoformat()
+    seen, result = set(), []
+    for row in conn.execute("""
+        SELECT reference_name, bank, account_type, maturity_date
+        FROM maturity_calendar
+        WHERE maturity_date >= ?
+        ORDER BY maturity_date
+    """, (start,)):
+        if row[0] in seen:
+            continue
+        seen.add(row[0])
+        result.append(row)
+        if len(result) >= limit:
+            break
+    return result
+
+
+def entries(conn, start, end, filters=None, limit=None):
+    """Calendar rows maturing between ``start`` and ``end`` inclusive, with their principal."""
+    where, params = _filter_where(filters or {})
+    sql = f"""
+        SELECT m.maturity_date, m.investment_id, m.reference_name, m.bank, m.account_type,
+               {PRINCIPAL} AS principal
+        FROM maturity_calendar m
+        WHERE m.maturity_date BETWEEN ? AND ?{where}
+        ORDER BY m.maturity_date, m.instrument_id
+    """
+    params = [start.isoformat(), end.isoformat()] + params
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params)
+
+
+def ladder(conn, bucket="month", start=None, end=None, filters=None):
+    """Maturities between ``start`` and ``end`` grouped by ``bucket`` and bank.
+
+    Returns rows of (bucket_start, bank, count, principal) in bucket order.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"invalid bucket: {bucket!r}")
+    start = start or date.today()
+    end = end or start + timedelta(days=DEFAULT_HORIZON_DAYS)
+    where, params = _filter_where(filters or {})
+    return conn.execute(f"""
+        SELECT {BUCKETS[bucket]} AS bucket, m.bank, COUNT(*) AS count, TOTAL({PRINCIPAL}) AS principal
+        FROM maturity_calendar m
+        WHERE m.maturity_date BETWEEN ? AND ?{where}
+        GROUP BY bucket, m.bank
+        ORDER BY bucket, m.bank
+    """, [start.isoformat(), end.isoformat()] + params).fetchall()
+
+
+def pivot(rows):
+    """ladder() rows -> (banks, [(bucket, {bank: (count, principal)}, total)]) for the table view."""
+    banks = sorted({row[1] or "" for row in rows})
+    buckets = {}
+    for bucket, bank, count, principal in rows:
+        buckets.setdefault(bucket, {})[bank or ""] = (count, principal)
+    table = [(bucket, cells, sum(p for _, p in cells.values())) for bucket, cells in buckets.items()]
+    return banks, table
+
+
+def _ics_text(value):
+    return (str(value or "").replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+
+def _fold(line):
+    # RFC 5545: lines longer than 75 octets continue on lines starting with a space
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts, current = [], b""
+    for char in line:
+        encoded = char.encode("utf-8")
+        if len(current) + len(encoded) > (75 if not parts else 74):
+            parts.append(current.decode("utf-8"))
+            current = b""
+        current += encoded
+    parts.append(current.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def ics_lines(rows, host="investment-tracker"):
+    """Yield an iCalendar feed with one all-day event per entries() row."""
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Investment Tracker//Maturities//EN\r\n"
+    yield "CALSCALE:GREGORIAN\r\nX-WR-CALNAME:Investment maturities\r\n"
+    for maturity_date, investment_id, reference_name, bank, account_type, principal in rows:
+        try:
+            day = date.fromisoformat(maturity_date)
+        except ValueError:
+            continue
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{investment_id}-{day:%Y%m%d}@{host}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+            f"DTEND;VALUE=DATE:{day + timedelta(days=1):%Y%m%d}",
+            f"SUMMARY:{_ics_text(f'{reference_name} matures')}",
+            f"DESCRIPTION:{_ics_text(f'{account_type} at {bank}, principal {principal:,.2f}')}",
+            "TRANSP:TRANSPARENT",
+            "END:VEVENT",
+        ]
+        yield "".join(_fold(line) for line in lines)
+    yield "END:VCALENDAR\r\n"
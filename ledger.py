@@ -0,0 +1,121 @@
+from collections import namedtuple
+from datetime import datetime
+
+
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+          'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# Column order of the wide "investments" view; templates index rows positionally.
+INVESTMENT_COLUMNS = (
+    "id, investment_id, reference_name, bank, account_type, saving_invested, status, "
+    "year, maturity_date, " + ", ".join(MONTHS) + ", notepad"
+)
+
+INSTRUMENT_FIELDS = ("reference_name", "bank", "account_type", "saving_invested",
+                     "status", "maturity_date", "notepad", "interest_rate", "compounding")
+
+# One investment to write: investment_id None means a new investment; with
+# replaces_reference set, earlier instruments under the same reference name
+# are deleted first (how FD/NSC entries have always behaved).
+Entry = namedtuple("Entry", "investment_id fields year_rows replaces_reference",
+                   defaults=(False,))
+
+
+def month_ordinal(year, month_index):
+    return year * 12 + month_index
+
+
+def month_pivot(alias="c", column="amount"):
+    """SQL select-list fragment turning grouped monthly rows back into jan..dec columns."""
+    return ",\n".join(
+        f"TOTAL(CASE WHEN {alias}.month_ordinal % 12 = {index} THEN {alias}.{column} END) AS {month}"
+        for index, month in enumerate(MONTHS)
+    )
+
+
+def next_investment_id(conn):
+    # investment ids have always been creation timestamps; bump past the
+    # newest one so two investments created in the same second don't collide
+    now = int(datetime.now().timestamp())
+    latest = conn.execute("SELECT MAX(investment_id) FROM instruments").fetchone()[0]
+    return max(now, (latest or 0) + 1)
+
+
+def write_instrument(conn, investment_id, fields, year_rows):
+    """Insert or replace one instrument and all of its cashflows.
+
+    ``fields`` holds the INSTRUMENT_FIELDS plus ``start_year``; ``year_rows``
+    is a list of (year, [jan..dec]) pairs, the rows the old wide table held.
+    Zero months are not stored. Returns the instrument id.
+    """
+    start_year = min((year for year, _ in year_rows), default=fields.get("start_year"))
+    values = [fields.get(name) for name in INSTRUMENT_FIELDS] + [start_year]
+
+    row = conn.execute("SELECT id FROM instruments WHERE investment_id=?", (investment_id,)).fetchone()
+    if row:
+        instrument_id = row[0]
+        assignments = ", ".join(f"{name}=?" for name in INSTRUMENT_FIELDS + ("start_year",))
+        conn.execute(f"UPDATE instruments SET {assignments} WHERE id=?", (*values, instrument_id))
+        conn.execute("DELETE FROM cashflows WHERE instrument_id=?", (instrument_id,))
+    else:
+        columns = INSTRUMENT_FIELDS + ("start_year", "investment_id")
+        instrument_id = conn.execute(
+            f"INSERT INTO instruments ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            (*values, investment_id)
+        ).lastrowid
+
+    conn.executemany(
+        "INSERT INTO cashflows (instrument_id, month_ordinal, amount) VALUES (?, ?, ?)",
+        [
+            (instrument_id, month_ordinal(year, index), amount)
+            for year, amounts in year_rows
+            for index, amount in enumerate(amounts)
+            if amount
+        ]
+    )
+    return instrument_id
+
+
+def write_batch(conn, entries):
+    """Write ``entries`` in one IMMEDIATE transaction. Returns their investment ids.
+
+    Every year-row is built before the transaction starts, and the deletes and
+    inserts for all entries commit together, so a failure part-way through
+    leaves nothing behind.
+    """
+    entries = list(entries)
+    investment_ids = []
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for entry in entries:
+            investment_id = entry.investment_id or next_investment_id(conn)
+            fields = dict(entry.fields)
+            fields["reference_name"] = fields.get("reference_name") or f"INV-{investment_id}"
+            if entry.replaces_reference:
+                delete_by_reference(conn, fields["reference_name"])
+            write_instrument(conn, investment_id, fields, entry.year_rows)
+            investment_ids.append(investment_id)
+    return investment_ids
+
+
+def delete_instruments(conn, where, params):
+    conn.execute(
+        f"DELETE FROM cashflows WHERE instrument_id IN (SELECT id FROM instruments WHERE {where})",
+        params
+    )
+    conn.execute(f"DELETE FROM instruments WHERE {where}", params)
+
+
+def delete_by_reference(conn, reference_name):
+    delete_instruments(conn, "reference_name = ?", (reference_name,))
+
+
+def read_investment(conn, investment_id):
+    """The investment's year-rows (INVESTMENT_COLUMNS) and its (interest_rate, compounding)."""
+    rows = conn.execute(
+        f"SELECT {INVESTMENT_COLUMNS} FROM investments WHERE investment_id=? ORDER BY year", (investment_id,)
+    ).fetchall()
+    terms = conn.execute(
+        "SELECT interest_rate, compounding FROM instruments WHERE investment_id=?", (investment_id,)
+    ).fetchone() or (None, None)
+    return rows, terms
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import db
+import history
+import metrics
+
+
+log = logging.getLogger(__name__)
+
+STATE_PREFIX = "maturity_sweep."
+MAX_SLEEP_SECONDS = 3600
+
+# earliest maturity still Open; the sweep skips its UPDATE until it has passed
+NEXT_MATURITY = """
+    SELECT MIN(maturity_date) FROM instruments
+    WHERE status = 'Open' AND maturity_date IS NOT NULL AND maturity_date != ''
+"""
+# closes everything that matured before the given day
+CLOSE_MATURED = """
+    UPDATE instruments
+    SET status = 'Closed'
+    WHERE maturity_date IS NOT NULL
+      AND maturity_date != ''
+      AND maturity_date < ?
+      AND status = 'Open'
+"""
+
+_scheduler = None
+_stop = threading.Event()
+
+
+def read_state(conn):
+    rows = conn.execute(
+        "SELECT key, value FROM app_state WHERE key LIKE ?", (STATE_PREFIX + "%",)
+    ).fetchall()
+    return {key[len(STATE_PREFIX):]: value for key, value in rows}
+
+
+def _write_state(conn, **values):
+    conn.executemany(
+        "INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)",
+        [(STATE_PREFIX + key, str(value)) for key, value in values.items()]
+    )
+
+
+def sweep(conn, force=False):
+    """Close Open investments whose maturity date is before today.
+
+    Runs at most once per (UTC) day unless ``force`` is set, and only issues
+    the UPDATE when the earliest open maturity has actually passed. Returns
+    the updated sweep state, or None if today's sweep had already run.
+    """
+    started = time.perf_counter()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        today = conn.execute("SELECT DATE('now')").fetchone()[0]
+        state = read_state(conn)
+        if not force and state.get("last_swept") == today:
+            return None
+
+        next_maturity = conn.execute(NEXT_MATURITY).fetchone()[0]
+
+        rows = 0
+        if next_maturity and next_maturity < today:
+            rows = conn.execute(CLOSE_MATURED, (today,)).rowcount
+            next_maturity = conn.execute(NEXT_MATURITY).fetchone()[0]
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        _write_state(
+            conn,
+            last_swept=today,
+            last_run_at=datetime.utcnow().isoformat(timespec="seconds"),
+            last_rows=rows,
+            last_duration_ms=duration_ms,
+            next_maturity=next_maturity or "",
+            runs=int(state.get("runs", 0)) + 1,
+            total_rows=int(state.get("total_rows", 0)) + rows,
+        )
+        state = read_state(conn)
+    log.info("maturity sweep closed %d rows in %.1f ms", rows, duration_ms)
+    metrics.record_sweep(duration_ms / 1000, rows)
+    return state
+
+
+def seconds_until_due(conn):
+    """Seconds until the next sweep is due: the next UTC midnight, or now if today is unswept."""
+    today = conn.execute("SELECT DATE('now')").fetchone()[0]
+    if read_state(conn).get("last_swept") != today:
+        return 0
+    now = datetime.utcnow()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds() + 1
+
+
+def _run_forever():
+    while not _stop.is_set():
+        wait = MAX_SLEEP_SECONDS
+        for portfolio in db.portfolios():
+            try:
+                conn = db.connect(db.portfolio_path(portfolio))
+                try:
+                    sweep(conn)
+                    history.snapshot_if_due(conn)
+                    wait = min(wait, seconds_until_due(conn))
+                finally:
+                    conn.close()
+            except Exception:
+                log.exception("maturity sweep failed for portfolio %s", portfolio)
+                wait = min(wait, 60)
+        _stop.wait(wait)
+
+
+def start_scheduler():
+    """Start the daemon thread that sweeps every portfolio once per day. Safe to call more than once."""
+    global _scheduler
+    if _scheduler is not None and _scheduler.is_alive():
+        return _scheduler
+    _stop.clear()
+    _scheduler = threading.Thread(target=_run_forever, name="maturity-sweep", daemon=True)
+    _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    _stop.set()
@@ -0,0 +1,253 @@
+"""Request, SQL and template timings, exported in Prometheus text format.
+
+Off unless METRICS is set; when off nothing below is installed and requests
+take the same path as before. When on:
+
+* every request is timed per endpoint and method, and gets a Server-Timing
+  header (total, db, template);
+* connections are opened with InstrumentedConnection, whose cursors time each
+  execute()/executemany() (prepare and first step, i.e. time to first row)
+  and count statements per request;
+* template render time is measured through Flask's render signals;
+* the maturity sweeps this process ran are timed, and the rows they
+  closed counted;
+* statements slower than SLOW_QUERY_MS are kept, with their query plan, in a
+  bounded log served at /metrics/slow_queries.
+
+Metrics are per worker process, like any in-process Prometheus client.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import g, jsonify, request, template_rendered, before_render_template
+
+import db
+
+
+log = logging.getLogger(__name__)
+
+PREFIX = "investment_tracker"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+SLOW_QUERY_MS = 100
+SLOW_LOG_SIZE = 100
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, (counts, total, count) in series:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            le = label_text + "," if label_text else ""
+            braces = f"{{{label_text}}}" if label_text else ""
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{le}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{le}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{braces} {total}")
+            lines.append(f"{self.name}_count{braces} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(f"{PREFIX}_request_duration_seconds",
+                            "Request latency by endpoint, method and status.",
+                            ("endpoint", "method", "status"), LATENCY_BUCKETS)
+QUERIES_PER_REQUEST = Histogram(f"{PREFIX}_sql_queries_per_request",
+                                "SQL statements executed per request, by endpoint.",
+                                ("endpoint",), QUERY_COUNT_BUCKETS)
+SQL_SECONDS = Histogram(f"{PREFIX}_sql_duration_seconds",
+                        "Statement time to first row, by endpoint and statement kind.",
+                        ("endpoint", "kind"), LATENCY_BUCKETS)
+TEMPLATE_SECONDS = Histogram(f"{PREFIX}_template_render_seconds",
+                             "Template render time by template.",
+                             ("template",), LATENCY_BUCKETS)
+SWEEP_SECONDS = Histogram(f"{PREFIX}_maturity_sweep_duration_seconds",
+                          "Maturity sweep duration, for sweeps that ran.",
+                          (), LATENCY_BUCKETS)
+HISTOGRAMS = (REQUEST_SECONDS, QUERIES_PER_REQUEST, SQL_SECONDS, TEMPLATE_SECONDS, SWEEP_SECONDS)
+
+slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+_slow_total = 0
+_sweep_rows_total = 0
+# per-thread request context for the cursors: [endpoint, statements, sql seconds]
+_local = threading.local()
+
+
+def _statement_kind(sql):
+    word = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+def _record(cursor, sql, params, seconds):
+    global _slow_total
+    current = getattr(_local, "request", None)
+    endpoint = current[0] if current else "(background)"
+    if current:
+        current[1] += 1
+        current[2] += seconds
+    SQL_SECONDS.observe((endpoint, _statement_kind(sql)), seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _slow_total += 1
+        plan = None
+        if _statement_kind(sql) in ("SELECT", "WITH"):
+            try:
+                plan = [row[-1] for row in sqlite3.Cursor.execute(
+                    cursor.connection.cursor(sqlite3.Cursor), f"EXPLAIN QUERY PLAN {sql}", params)]
+            except sqlite3.Error:
+                pass
+        entry = {"at": time.strftime("%Y-%m-%dT%H:%M:%S"), "endpoint": endpoint,
+                 "ms": round(seconds * 1000, 2), "sql": " ".join(sql.split()), "plan": plan}
+        slow_queries.append(entry)
+        log.warning("slow query %.1f ms on %s: %s", entry["ms"], endpoint, entry["sql"][:500])
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(self, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(self, sql, (), time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute() builds its cursor through self.cursor() but then
+    # calls the C-level Cursor.execute, so the shortcuts are routed explicitly.
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_template_seconds = 0.0
+    _local.request = [request.endpoint or "(unmatched)", 0, 0.0]
+
+
+def _after_request(response):
+    current = getattr(_local, "request", None)
+    started = g.pop("metrics_started", None)
+    if current is None or started is None:
+        return response
+    total = time.perf_counter() - started
+    endpoint, statements, sql_seconds = current
+    REQUEST_SECONDS.observe((endpoint, request.method, str(response.status_code)), total)
+    QUERIES_PER_REQUEST.observe((endpoint,), statements)
+    add_server_timing(response, (
+        f"total;dur={total * 1000:.1f}, db;dur={sql_seconds * 1000:.1f};desc=\"{statements} queries\", "
+        f"tpl;dur={g.get('metrics_template_seconds', 0.0) * 1000:.1f}"
+    ))
+    return response
+
+
+def add_server_timing(response, entries):
+    """Append ``entries`` to the response's one Server-Timing header."""
+    existing = response.headers.get("Server-Timing")
+    response.headers["Server-Timing"] = f"{existing}, {entries}" if existing else entries
+
+
+def _teardown_request(exc=None):
+    _local.request = None
+
+
+def _template_started(sender, template, context, **extra):
+    g.metrics_template_started = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    started = g.pop("metrics_template_started", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    g.metrics_template_seconds = g.get("metrics_template_seconds", 0.0) + seconds
+    TEMPLATE_SECONDS.observe((template.name or "(string)",), seconds)
+
+
+def record_sweep(seconds, rows):
+    """Count a maturity sweep that ran; maturity.sweep() calls this whether or not METRICS is on."""
+    global _sweep_rows_total
+    SWEEP_SECONDS.observe((), seconds)
+    _sweep_rows_total += rows
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    lines += [f"# HELP {PREFIX}_slow_queries_total Statements slower than {SLOW_QUERY_MS} ms.",
+              f"# TYPE {PREFIX}_slow_queries_total counter",
+              f"{PREFIX}_slow_queries_total {_slow_total}",
+              f"# HELP {PREFIX}_maturity_sweep_rows_closed_total Investments closed by the maturity sweep.",
+              f"# TYPE {PREFIX}_maturity_sweep_rows_closed_total counter",
+              f"{PREFIX}_maturity_sweep_rows_closed_total {_sweep_rows_total}"]
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    """Install the hooks if app.config["METRICS"] is set; register /metrics either way."""
+    enabled = app.config.get("METRICS", False)
+    global SLOW_QUERY_MS
+    SLOW_QUERY_MS = app.config.get("SLOW_QUERY_MS", SLOW_QUERY_MS)
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        if not enabled:
+            return "Metrics are disabled; set METRICS=on", 404
+        return render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    @app.route("/metrics/slow_queries")
+    def slow_queries_endpoint():
+        if not enabled:
+            return "Metrics are disabled; set METRICS=on", 404
+        return jsonify(threshold_ms=SLOW_QUERY_MS, queries=list(reversed(slow_queries)))
+
+    if not enabled:
+        return
+    db.set_connection_factory(InstrumentedConnection)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
@@ -0,0 +1,681 @@
+import sqlite3
+from datetime import datetime
+
+
+# Each migration is (version, description, function(cursor)). Versions must be
+# strictly increasing; never edit a migration once it has shipped, add a new one.
+
+def _create_base_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS investments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            investment_id INTEGER,
+            reference_name TEXT,
+            bank TEXT,
+            account_type TEXT,
+            saving_invested TEXT,
+            status TEXT,
+            year INTEGER,
+            maturity_date TEXT,
+            jan REAL, feb REAL, mar REAL, apr REAL, may REAL, jun REAL,
+            jul REAL, aug REAL, sep REAL, oct REAL, nov REAL, dec REAL,
+            notepad TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS options (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT,
+            value TEXT UNIQUE
+        )
+    ''')
+
+
+def _add_investment_indexes(cursor):
+    # update() / index() POST look rows up by investment_id
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_investments_investment_id "
+                   "ON investments (investment_id)")
+    # delete_by_ref, the FD/NSC re-insert and the records list ORDER BY reference_name, year
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_investments_reference_name "
+                   "ON investments (reference_name, year)")
+    # maturity sweep and upcoming maturities
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_investments_status_maturity "
+                   "ON investments (status, maturity_date)")
+    # bank filter and bank_summary grouping
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_investments_bank_year "
+                   "ON investments (bank, year)")
+    # saving/invested filter and the dashboard/bank_summary totals
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_investments_saving_invested_year "
+                   "ON investments (saving_invested, year)")
+
+
+def _create_app_state(cursor):
+    # small key/value store for background job watermarks and counters
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+          'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+def _normalize_cashflows(cursor):
+    # One row per investment instead of one per investment per year ...
+    cursor.execute('''
+        CREATE TABLE instruments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            investment_id INTEGER NOT NULL UNIQUE,
+            reference_name TEXT,
+            bank TEXT,
+            account_type TEXT,
+            saving_invested TEXT,
+            status TEXT,
+            maturity_date TEXT,
+            notepad TEXT,
+            start_year INTEGER
+        )
+    ''')
+    # ... and one row per non-zero month, keyed by month_ordinal = year * 12 + month index
+    cursor.execute('''
+        CREATE TABLE cashflows (
+            instrument_id INTEGER NOT NULL REFERENCES instruments (id) ON DELETE CASCADE,
+            month_ordinal INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (instrument_id, month_ordinal)
+        ) WITHOUT ROWID
+    ''')
+
+    # Attributes come from each investment's first row (SQLite takes bare
+    # columns from the row that supplied MIN(id)).
+    cursor.execute('''
+        INSERT INTO instruments (id, investment_id, reference_name, bank, account_type,
+                                 saving_invested, status, maturity_date, notepad, start_year)
+        SELECT MIN(id), COALESCE(investment_id, id), reference_name, bank, account_type,
+               saving_invested, status, maturity_date, notepad, MIN(year)
+        FROM investments
+        GROUP BY COALESCE(investment_id, id)
+    ''')
+    for index, month in enumerate(MONTHS):
+        cursor.execute(f'''
+            INSERT INTO cashflows (instrument_id, month_ordinal, amount)
+            SELECT i.id, v.year * 12 + {index}, SUM(v.{month})
+            FROM investments v
+            JOIN instruments i ON i.investment_id = COALESCE(v.investment_id, v.id)
+            WHERE v.year IS NOT NULL AND v.{month} IS NOT NULL AND v.{month} != 0
+            GROUP BY i.id, v.year
+        ''')
+
+    cursor.execute("DROP TABLE investments")
+
+    cursor.execute("CREATE INDEX idx_instruments_reference_name ON instruments (reference_name)")
+    cursor.execute("CREATE INDEX idx_instruments_status_maturity ON instruments (status, maturity_date)")
+    cursor.execute("CREATE INDEX idx_instruments_bank ON instruments (bank, account_type)")
+    cursor.execute("CREATE INDEX idx_instruments_saving_invested ON instruments (saving_invested)")
+    cursor.execute("CREATE INDEX idx_instruments_account_type ON instruments (account_type, status)")
+    # covering index for date-range scans across all instruments
+    cursor.execute("CREATE INDEX idx_cashflows_month ON cashflows (month_ordinal, instrument_id, amount)")
+
+    # The old wide shape, one row per investment per year, for templates and
+    # read queries that still select from "investments". Instruments without
+    # any cashflow keep a single all-zero row in their start year.
+    pivot = ",\n".join(
+        f"TOTAL(CASE WHEN c.month_ordinal % 12 = {index} THEN c.amount END) AS {month}"
+        for index, month in enumerate(MONTHS)
+    )
+    zeros = ", ".join(f"0.0 AS {month}" for month in MONTHS)
+    cursor.execute(f'''
+        CREATE VIEW investments AS
+        SELECT i.id, i.investment_id, i.reference_name, i.bank, i.account_type,
+               i.saving_invested, i.status, c.month_ordinal / 12 AS year, i.maturity_date,
+               {pivot},
+               i.notepad
+        FROM instruments i
+        JOIN cashflows c ON c.instrument_id = i.id
+        GROUP BY i.id, c.month_ordinal / 12, i.investment_id, i.reference_name, i.bank,
+                 i.account_type, i.saving_invested, i.status, i.maturity_date, i.notepad
+        UNION ALL
+        SELECT i.id, i.investment_id, i.reference_name, i.bank, i.account_type,
+               i.saving_invested, i.status, i.start_year AS year, i.maturity_date,
+               {zeros},
+               i.notepad
+        FROM instruments i
+        WHERE NOT EXISTS (SELECT 1 FROM cashflows c WHERE c.instrument_id = i.id)
+    ''')
+
+
+SUMMARY_MONTHLY_GROUP = "bank, account_type, saving_invested"
+
+
+def _create_summary_tables(cursor):
+    # Cashflow totals per bank / account type / saving-invested / month; every
+    # dashboard and bank summary figure is a small GROUP BY over this.
+    cursor.execute('''
+        CREATE TABLE summary_monthly (
+            bank TEXT NOT NULL,
+            account_type TEXT NOT NULL,
+            saving_invested TEXT NOT NULL,
+            month_ordinal INTEGER NOT NULL,
+            total REAL NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (bank, account_type, saving_invested, month_ordinal)
+        ) WITHOUT ROWID
+    ''')
+    # Instruments per distinct reference name, for the COUNT(DISTINCT reference_name) figures.
+    cursor.execute('''
+        CREATE TABLE summary_refs (
+            status TEXT NOT NULL,
+            account_type TEXT NOT NULL,
+            bank TEXT NOT NULL,
+            reference_name TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (status, account_type, bank, reference_name)
+        ) WITHOUT ROWID
+    ''')
+
+    def add_monthly(sign, row, where):
+        # row is OLD or NEW of a cashflows trigger; attributes come from its instrument
+        return f'''
+            INSERT INTO summary_monthly ({SUMMARY_MONTHLY_GROUP}, month_ordinal, total, n)
+            SELECT IFNULL(bank, ''), IFNULL(account_type, ''), IFNULL(saving_invested, ''),
+                   {row}.month_ordinal, {sign}{row}.amount, {sign}1
+            FROM instruments WHERE {where}
+            ON CONFLICT ({SUMMARY_MONTHLY_GROUP}, month_ordinal)
+            DO UPDATE SET total = total + excluded.total, n = n + excluded.n;
+        '''
+
+    def prune_monthly(row):
+        return f'''
+            DELETE FROM summary_monthly
+            WHERE n = 0 AND month_ordinal = {row}.month_ordinal
+              AND ({SUMMARY_MONTHLY_GROUP}) = (
+                  SELECT IFNULL(bank, ''), IFNULL(account_type, ''), IFNULL(saving_invested, '')
+                  FROM instruments WHERE id = {row}.instrument_id
+              );
+        '''
+
+    def move_instrument(sign, row):
+        # row is OLD or NEW of an instruments trigger; applies all of its cashflows at once
+        return f'''
+            INSERT INTO summary_monthly ({SUMMARY_MONTHLY_GROUP}, month_ordinal, total, n)
+            SELECT IFNULL({row}.bank, ''), IFNULL({row}.account_type, ''), IFNULL({row}.saving_invested, ''),
+                   month_ordinal, {sign}amount, {sign}1
+            FROM cashflows WHERE instrument_id = {row}.id
+            ON CONFLICT ({SUMMARY_MONTHLY_GROUP}, month_ordinal)
+            DO UPDATE SET total = total + excluded.total, n = n + excluded.n;
+        '''
+
+    def add_ref(sign, row):
+        return f'''
+            INSERT INTO summary_refs (status, account_type, bank, reference_name, n)
+            VALUES (IFNULL({row}.status, ''), IFNULL({row}.account_type, ''),
+                    IFNULL({row}.bank, ''), IFNULL({row}.reference_name, ''), {sign}1)
+            ON CONFLICT (status, account_type, bank, reference_name)
+            DO UPDATE SET n = n + excluded.n;
+        '''
+
+    def prune_ref(row):
+        return f'''
+            DELETE FROM summary_refs
+            WHERE n = 0 AND status = IFNULL({row}.status, '') AND account_type = IFNULL({row}.account_type, '')
+              AND bank = IFNULL({row}.bank, '') AND reference_name = IFNULL({row}.reference_name, '');
+        '''
+
+    cursor.execute(f'''
+        CREATE TRIGGER trg_cashflows_insert AFTER INSERT ON cashflows BEGIN
+            {add_monthly("", "NEW", "id = NEW.instrument_id")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_cashflows_delete AFTER DELETE ON cashflows BEGIN
+            {add_monthly("-", "OLD", "id = OLD.instrument_id")}
+            {prune_monthly("OLD")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_cashflows_update AFTER UPDATE ON cashflows BEGIN
+            {add_monthly("-", "OLD", "id = OLD.instrument_id")}
+            {prune_monthly("OLD")}
+            {add_monthly("", "NEW", "id = NEW.instrument_id")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_instruments_insert AFTER INSERT ON instruments BEGIN
+            {add_ref("", "NEW")}
+        END
+    ''')
+    # Drop the cashflows first, while their instrument still exists to attribute them.
+    cursor.execute('''
+        CREATE TRIGGER trg_instruments_delete_cashflows BEFORE DELETE ON instruments BEGIN
+            DELETE FROM cashflows WHERE instrument_id = OLD.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_instruments_delete AFTER DELETE ON instruments BEGIN
+            {add_ref("-", "OLD")}
+            {prune_ref("OLD")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_instruments_move_cashflows
+        AFTER UPDATE OF bank, account_type, saving_invested ON instruments
+        WHEN OLD.bank IS NOT NEW.bank OR OLD.account_type IS NOT NEW.account_type
+          OR OLD.saving_invested IS NOT NEW.saving_invested
+        BEGIN
+            {move_instrument("-", "OLD")}
+            DELETE FROM summary_monthly
+            WHERE n = 0 AND bank = IFNULL(OLD.bank, '') AND account_type = IFNULL(OLD.account_type, '')
+              AND saving_invested = IFNULL(OLD.saving_invested, '');
+            {move_instrument("", "NEW")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_instruments_move_ref
+        AFTER UPDATE OF status, account_type, bank, reference_name ON instruments
+        WHEN OLD.status IS NOT NEW.status OR OLD.account_type IS NOT NEW.account_type
+          OR OLD.bank IS NOT NEW.bank OR OLD.reference_name IS NOT NEW.reference_name
+        BEGIN
+            {add_ref("-", "OLD")}
+            {prune_ref("OLD")}
+            {add_ref("", "NEW")}
+        END
+    ''')
+
+    cursor.execute(f'''
+        INSERT INTO summary_monthly ({SUMMARY_MONTHLY_GROUP}, month_ordinal, total, n)
+        SELECT IFNULL(i.bank, ''), IFNULL(i.account_type, ''), IFNULL(i.saving_invested, ''),
+               c.month_ordinal, TOTAL(c.amount), COUNT(*)
+        FROM cashflows c JOIN instruments i ON i.id = c.instrument_id
+        GROUP BY 1, 2, 3, 4
+    ''')
+    cursor.execute('''
+        INSERT INTO summary_refs (status, account_type, bank, reference_name, n)
+        SELECT IFNULL(status, ''), IFNULL(account_type, ''), IFNULL(bank, ''), IFNULL(reference_name, ''), COUNT(*)
+        FROM instruments
+        GROUP BY 1, 2, 3, 4
+    ''')
+
+
+def _create_text_search(cursor):
+    # External-content FTS5 index over the free-text instrument fields; the
+    # triggers below keep it in step with instruments.
+    cursor.execute('''
+        CREATE VIRTUAL TABLE instruments_fts USING fts5(
+            reference_name, notepad,
+            content='instruments', content_rowid='id',
+            tokenize="unicode61 remove_diacritics 2", prefix='2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_instruments_fts_insert AFTER INSERT ON instruments BEGIN
+            INSERT INTO instruments_fts (rowid, reference_name, notepad)
+            VALUES (NEW.id, NEW.reference_name, NEW.notepad);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_instruments_fts_delete AFTER DELETE ON instruments BEGIN
+            INSERT INTO instruments_fts (instruments_fts, rowid, reference_name, notepad)
+            VALUES ('delete', OLD.id, OLD.reference_name, OLD.notepad);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER trg_instruments_fts_update AFTER UPDATE OF reference_name, notepad ON instruments
+        WHEN OLD.reference_name IS NOT NEW.reference_name OR OLD.notepad IS NOT NEW.notepad
+        BEGIN
+            INSERT INTO instruments_fts (instruments_fts, rowid, reference_name, notepad)
+            VALUES ('delete', OLD.id, OLD.reference_name, OLD.notepad);
+            INSERT INTO instruments_fts (rowid, reference_name, notepad)
+            VALUES (NEW.id, NEW.reference_name, NEW.notepad);
+        END
+    ''')
+    cursor.execute("INSERT INTO instruments_fts (instruments_fts) VALUES ('rebuild')")
+    # the records list filters start/end on maturity date without a status
+    cursor.execute("CREATE INDEX idx_instruments_maturity ON instruments (maturity_date)")
+
+
+def _create_data_version(cursor):
+    # Counter the response cache keys on: any change to instruments or options
+    # bumps it, whichever worker or job made the change. Cashflows are only
+    # ever written together with their instrument row, so they need no trigger.
+    cursor.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES ('data_version', 0)")
+    for table in ("instruments", "options"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER trg_{table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE app_state SET value = value + 1 WHERE key = 'data_version';
+                END
+            ''')
+
+
+def _add_interest_terms(cursor):
+    # interest_rate is the annual rate in percent; compounding is periods per
+    # year (1, 2, 4, 12), 0 for simple interest, NULL for the account type's default
+    cursor.execute("ALTER TABLE instruments ADD COLUMN interest_rate REAL")
+    cursor.execute("ALTER TABLE instruments ADD COLUMN compounding INTEGER")
+
+
+def _create_maturity_calendar(cursor):
+    # One row per open instrument with a maturity date, keyed by that date, so
+    # "the next k maturities" is a range scan on the primary key. Kept in step
+    # with instruments by the triggers below.
+    cursor.execute('''
+        CREATE TABLE maturity_calendar (
+            maturity_date TEXT NOT NULL,
+            instrument_id INTEGER NOT NULL REFERENCES instruments(id) ON DELETE CASCADE,
+            investment_id INTEGER,
+            reference_name TEXT,
+            bank TEXT,
+            account_type TEXT,
+            PRIMARY KEY (maturity_date, instrument_id)
+        ) WITHOUT ROWID
+    ''')
+    insert = '''
+        INSERT OR REPLACE INTO maturity_calendar
+            (maturity_date, instrument_id, investment_id, reference_name, bank, account_type)
+        SELECT NEW.maturity_date, NEW.id, NEW.investment_id, NEW.reference_name, NEW.bank, NEW.account_type
+        WHERE NEW.status = 'Open' AND NEW.maturity_date IS NOT NULL AND NEW.maturity_date != '';
+    '''
+    delete = '''
+        DELETE FROM maturity_calendar WHERE maturity_date = OLD.maturity_date AND instrument_id = OLD.id;
+    '''
+    cursor.execute(f"CREATE TRIGGER trg_instruments_calendar_insert AFTER INSERT ON instruments BEGIN {insert} END")
+    cursor.execute(f"CREATE TRIGGER trg_instruments_calendar_delete AFTER DELETE ON instruments BEGIN {delete} END")
+    cursor.execute(f'''
+        CREATE TRIGGER trg_instruments_calendar_update
+        AFTER UPDATE OF status, maturity_date, investment_id, reference_name, bank, account_type ON instruments
+        BEGIN {delete} {insert} END
+    ''')
+    cursor.execute('''
+        INSERT INTO maturity_calendar
+            (maturity_date, instrument_id, investment_id, reference_name, bank, account_type)
+        SELECT maturity_date, id, investment_id, reference_name, bank, account_type
+        FROM instruments
+        WHERE status = 'Open' AND maturity_date IS NOT NULL AND maturity_date != ''
+    ''')
+
+
+def _create_jobs(cursor):
+    # Background job queue (jobs.py). Workers claim the oldest queued row, so
+    # (status, id) is the lookup; expires_at drives the artifact cleanup.
+    cursor.execute('''
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            error TEXT,
+            artifact TEXT,
+            filename TEXT,
+            mimetype TEXT,
+            worker TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            heartbeat_at TEXT,
+            finished_at TEXT,
+            expires_at TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX idx_jobs_status ON jobs(status, id)")
+    cursor.execute("CREATE INDEX idx_jobs_expires ON jobs(expires_at) WHERE expires_at IS NOT NULL")
+
+
+def _create_row_hashes(cursor):
+    # Content hashes of stored year-rows, for de-duplicating imports
+    # (imports.py). Hashes are computed in Python, so rows are added by the
+    # importer, which also hashes any instrument that has none yet; the
+    # triggers only drop the hashes of deleted or re-keyed instruments.
+    cursor.execute('''
+        CREATE TABLE row_hashes (
+            hash BLOB NOT NULL,
+            instrument_id INTEGER NOT NULL,
+            PRIMARY KEY (hash, instrument_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX idx_row_hashes_instrument ON row_hashes(instrument_id)")
+    drop = "DELETE FROM row_hashes WHERE instrument_id = OLD.id;"
+    cursor.execute(f"CREATE TRIGGER trg_instruments_row_hashes_delete AFTER DELETE ON instruments BEGIN {drop} END")
+    cursor.execute(f'''
+        CREATE TRIGGER trg_instruments_row_hashes_update
+        AFTER UPDATE OF reference_name, bank, account_type, saving_invested, maturity_date ON instruments
+        BEGIN {drop} END
+    ''')
+
+
+# Instrument columns recorded in the change log, in table order.
+CHANGE_LOG_COLUMNS = ("id", "investment_id", "reference_name", "bank", "account_type", "saving_invested",
+                      "status", "maturity_date", "notepad", "start_year", "interest_rate", "compounding")
+
+
+def _create_change_log(cursor):
+    # Append-only history of instruments and cashflows (history.py). A row
+    # with month_ordinal NULL holds an instrument's attributes after the
+    # change as JSON (attrs NULL: deleted); any other row holds one
+    # cashflow's amount after the change (amount NULL: deleted).
+    cursor.execute('''
+        CREATE TABLE change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            changed_at TEXT NOT NULL,
+            instrument_id INTEGER NOT NULL,
+            month_ordinal INTEGER,
+            amount REAL,
+            attrs TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX idx_change_log_changed_at ON change_log(changed_at)")
+    # Compressed copies of the ledger as of change_log row ``seq``; a
+    # point-in-time read starts from the newest one before it.
+    cursor.execute('''
+        CREATE TABLE snapshots (
+            id INTEGER PRIMARY KEY,
+            taken_at TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            encoding TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX idx_snapshots_seq ON snapshots(seq)")
+
+    def log_instrument(row):
+        attrs = ", ".join(f"'{c}', {row}.{c}" for c in CHANGE_LOG_COLUMNS)
+        return f"""
+            INSERT INTO change_log (changed_at, instrument_id, attrs)
+            VALUES (datetime('now'), {row}.id, json_object({attrs}));
+        """
+
+    def log_cashflow(row, amount):
+        return f"""
+            INSERT INTO change_log (changed_at, instrument_id, month_ordinal, amount)
+            VALUES (datetime('now'), {row}.instrument_id, {row}.month_ordinal, {amount});
+        """
+
+    changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in CHANGE_LOG_COLUMNS)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_instruments_log_insert AFTER INSERT ON instruments
+        BEGIN {log_instrument('NEW')} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_instruments_log_update AFTER UPDATE ON instruments WHEN {changed}
+        BEGIN {log_instrument('NEW')} END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER trg_instruments_log_delete AFTER DELETE ON instruments BEGIN
+            INSERT INTO change_log (changed_at, instrument_id) VALUES (datetime('now'), OLD.id);
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cashflows_log_insert AFTER INSERT ON cashflows
+        BEGIN {log_cashflow('NEW', 'NEW.amount')} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cashflows_log_update AFTER UPDATE ON cashflows
+        WHEN OLD.amount IS NOT NEW.amount OR OLD.instrument_id IS NOT NEW.instrument_id
+          OR OLD.month_ordinal IS NOT NEW.month_ordinal
+        BEGIN {log_cashflow('OLD', 'NULL')} {log_cashflow('NEW', 'NEW.amount')} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cashflows_log_delete AFTER DELETE ON cashflows
+        BEGIN {log_cashflow('OLD', 'NULL')} END
+    """)
+
+
+CUBE_DIMENSIONS = "bank, account_type, saving_invested, status"
+
+
+def _create_analytics_cube(cursor):
+    # Cashflow totals per bank / account type / saving-invested / status /
+    # month for the analytics page (analytics.py): summary_monthly plus the
+    # status, kept current the same way.
+    cursor.execute(f'''
+        CREATE TABLE analytics_cube (
+            bank TEXT NOT NULL,
+            account_type TEXT NOT NULL,
+            saving_invested TEXT NOT NULL,
+            status TEXT NOT NULL,
+            month_ordinal INTEGER NOT NULL,
+            total REAL NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY ({CUBE_DIMENSIONS}, month_ordinal)
+        ) WITHOUT ROWID
+    ''')
+
+    def dimensions(row):
+        return ", ".join(f"IFNULL({row}{column.strip()}, '')" for column in CUBE_DIMENSIONS.split(","))
+
+    def add_cashflow(sign, row):
+        # row is OLD or NEW of a cashflows trigger; dimensions come from its instrument
+        return f'''
+            INSERT INTO analytics_cube ({CUBE_DIMENSIONS}, month_ordinal, total, n)
+            SELECT {dimensions("")}, {row}.month_ordinal, {sign}{row}.amount, {sign}1
+            FROM instruments WHERE id = {row}.instrument_id
+            ON CONFLICT ({CUBE_DIMENSIONS}, month_ordinal)
+            DO UPDATE SET total = total + excluded.total, n = n + excluded.n;
+        '''
+
+    def prune_cashflow(row):
+        return f'''
+            DELETE FROM analytics_cube
+            WHERE n = 0 AND month_ordinal = {row}.month_ordinal
+              AND ({CUBE_DIMENSIONS}) = (SELECT {dimensions("")} FROM instruments WHERE id = {row}.instrument_id);
+        '''
+
+    def move_instrument(sign, row):
+        # row is OLD or NEW of an instruments trigger; applies all of its cashflows at once
+        return f'''
+            INSERT INTO analytics_cube ({CUBE_DIMENSIONS}, month_ordinal, total, n)
+            SELECT {dimensions(row + ".")}, month_ordinal, {sign}amount, {sign}1
+            FROM cashflows WHERE instrument_id = {row}.id
+            ON CONFLICT ({CUBE_DIMENSIONS}, month_ordinal)
+            DO UPDATE SET total = total + excluded.total, n = n + excluded.n;
+        '''
+
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cashflows_cube_insert AFTER INSERT ON cashflows
+        BEGIN {add_cashflow("", "NEW")} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cashflows_cube_delete AFTER DELETE ON cashflows
+        BEGIN {add_cashflow("-", "OLD")} {prune_cashflow("OLD")} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER trg_cashflows_cube_update AFTER UPDATE ON cashflows
+        BEGIN {add_cashflow("-", "OLD")} {prune_cashflow("OLD")} {add_cashflow("", "NEW")} END
+    """)
+    changed = " OR ".join(f"OLD.{c.strip()} IS NOT NEW.{c.strip()}" for c in CUBE_DIMENSIONS.split(","))
+    cursor.execute(f"""
+        CREATE TRIGGER trg_instruments_cube_move
+        AFTER UPDATE OF {CUBE_DIMENSIONS} ON instruments WHEN {changed}
+        BEGIN
+            {move_instrument("-", "OLD")}
+            DELETE FROM analytics_cube
+            WHERE n = 0 AND ({CUBE_DIMENSIONS}) = ({dimensions("OLD.")});
+            {move_instrument("", "NEW")}
+        END
+    """)
+
+    cursor.execute(f'''
+        INSERT INTO analytics_cube ({CUBE_DIMENSIONS}, month_ordinal, total, n)
+        SELECT {dimensions("i.")}, c.month_ordinal, TOTAL(c.amount), COUNT(*)
+        FROM cashflows c JOIN instruments i ON i.id = c.instrument_id
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+
+
+def _add_summary_monthly_index(cursor):
+    # the dashboard's invested-by-month and bank_summary's saving/invested
+    # totals filter on saving_invested, the primary key's third column; total
+    # is included so they never go back to the table
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_summary_monthly_saving_invested "
+                   "ON summary_monthly (saving_invested, month_ordinal, total)")
+
+
+MIGRATIONS = [
+    (1, "base investments and options tables", _create_base_tables),
+    (2, "secondary indexes on investments", _add_investment_indexes),
+    (3, "app_state key/value table", _create_app_state),
+    (4, "normalize investments into instruments + cashflows", _normalize_cashflows),
+    (5, "trigger-maintained summary tables", _create_summary_tables),
+    (6, "FTS5 index over reference_name and notepad", _create_text_search),
+    (7, "data_version counter for the response cache", _create_data_version),
+    (8, "interest rate and compounding per instrument", _add_interest_terms),
+    (9, "trigger-maintained maturity calendar", _create_maturity_calendar),
+    (10, "background job queue", _create_jobs),
+    (11, "content hashes of year-rows for import de-duplication", _create_row_hashes),
+    (12, "append-only change log and ledger snapshots", _create_change_log),
+    (13, "trigger-maintained analytics cube", _create_analytics_cube),
+    (14, "saving/invested index on summary_monthly", _add_summary_monthly_index),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """Apply every migration newer than the database's schema_version.
+
+    Each migration runs in its own transaction together with its
+    schema_version row, so a failure leaves the database at the last good
+    version. Returns the list of versions applied.
+    """
+    applied = []
+    version = current_version(conn)
+    conn.commit()
+    for number, description, func in MIGRATIONS:
+        if number <= version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # another worker may have migrated while we waited for the lock
+            cursor.execute("SELECT 1 FROM schema_version WHERE version=?", (number,))
+            if cursor.fetchone():
+                conn.rollback()
+                continue
+            func(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (number, description, datetime.now().isoformat(timespec="seconds"))
+            )
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(number)
+    if applied:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return applied
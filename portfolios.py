@@ -0,0 +1,89 @@
+"""Reports across every portfolio, computed in parallel and merged.
+
+Each portfolio is its own SQLite database, so per-portfolio queries share
+nothing and contend on no lock: fan_out() runs one function per database on
+a thread pool (sqlite3 releases the GIL while a statement runs), using the
+per-portfolio connection pools, and the merge helpers combine the results.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import db
+import summaries
+import valuation
+
+
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+YEARLY_TOTALS = """
+    SELECT saving_invested, month_ordinal / 12 AS year, TOTAL(total) AS total
+    FROM summary_monthly
+    GROUP BY saving_invested, year
+    ORDER BY saving_invested, year
+"""
+VALUATION_FIELDS = ("count", "principal", "accrued_value", "interest_earned", "maturity_value")
+
+
+def selected(value):
+    """Portfolio names from a comma-separated ?portfolios= value; all of them if blank.
+
+    Raises ValueError / db.UnknownPortfolio for names that do not resolve.
+    """
+    names = [name.strip() for name in (value or "").split(",") if name.strip()]
+    for name in names:
+        db.portfolio_path(name)
+    return names or db.portfolios()
+
+
+def fan_out(fn, names=None, max_workers=MAX_WORKERS):
+    """{portfolio: fn(conn)} for each portfolio in ``names`` (default all), run in parallel."""
+    names = list(names or db.portfolios())
+
+    def run(name):
+        path = db.portfolio_path(name)
+        conn = db.acquire(path)
+        try:
+            return fn(conn)
+        finally:
+            db.release(conn, path)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names)))) as pool:
+        return dict(zip(names, pool.map(run, names)))
+
+
+def merge_rows(row_lists, keys, fields):
+    """Sum ``fields`` of the dict rows that agree on ``keys``, across ``row_lists``, sorted by key."""
+    merged = {}
+    for rows in row_lists:
+        for row in rows:
+            entry = merged.setdefault(tuple(row[k] for k in keys),
+                                      {**{k: row[k] for k in keys}, **{f: 0 for f in fields}})
+            for field in fields:
+                if row[field] is not None:
+                    entry[field] += row[field]
+    return [{name: round(value, 2) if isinstance(value, float) else value for name, value in entry.items()}
+            for _, entry in sorted(merged.items(), key=lambda item: tuple(map(str, item[0])))]
+
+
+def summary(conn, as_of=None):
+    """One portfolio's open counts, yearly saving/invested totals and valuation by account type."""
+    _, book = valuation.value_book(conn, as_of)
+    return {
+        "open_counts": summaries.dict_rows(conn, summaries.DASHBOARD["totals"]),
+        "yearly_totals": summaries.dict_rows(conn, YEARLY_TOTALS),
+        "valuation": valuation.totals_by(book),
+    }
+
+
+def combined_summary(names=None, as_of=None):
+    """(per-portfolio summaries, their merge) across ``names`` (default all)."""
+    as_of = as_of or date.today()
+    results = fan_out(lambda conn: summary(conn, as_of), names)
+    parts = results.values()
+    combined = {
+        "open_counts": merge_rows([r["open_counts"] for r in parts], ("account_type",), ("total_count",)),
+        "yearly_totals": merge_rows([r["yearly_totals"] for r in parts], ("saving_invested", "year"), ("total",)),
+        "valuation": merge_rows([r["valuation"] for r in parts], ("account_type",), VALUATION_FIELDS),
+    }
+    return results, combined
@@ -0,0 +1,125 @@
+"""EXPLAIN QUERY PLAN checks for the records list and the other hot paths.
+
+check() runs records.fetch_page() and records.monthly_totals() for each of
+CASES, and each of PATHS (the update form, delete by reference, the
+dashboard, upcoming maturities), records the statements they execute
+(with their parameters bound) and reports every step of their plans that
+reads a ledger or summary table with a full table scan; the maturity
+sweep's statements, which commit, are explained without running them.
+Walking an index in order (SCAN ... USING INDEX, as the page bound does to
+stop after one page) is fine. `flask check-query-plans` runs it against a
+portfolio; plans depend on the statistics ANALYZE left, so check a
+database of realistic size.
+"""
+import re
+from datetime import date
+
+import ladder
+import ledger
+import maturity
+import records
+import summaries
+
+
+# filter values are filled in from the database's own rows: {field} -> a stored value
+CASES = {
+    "bank": {"bank": "{bank}"},
+    "account type": {"account_type": "{account_type}"},
+    "bank and account type": {"bank": "{bank}", "account_type": "{account_type}"},
+    "saving/invested": {"saving_invested": "Saving"},
+    "status": {"status": "Open"},
+    "maturity range": {"start_date": "{maturity_date}", "end_date": "{maturity_date}"},
+    "year": {"year": "{year}"},
+    "year range": {"year": "{year}-{year}"},
+    "search": {"q": "{reference_name}"},
+    "unique references": {"unique_only": "1", "bank": "{bank}"},
+}
+
+
+
+def _rolled_back(call):
+    """Run a write path's call and roll its changes back."""
+    def run(conn, values):
+        try:
+            call(conn, values)
+        finally:
+            conn.rollback()
+    return run
+
+
+# code paths outside the records list: name -> call(conn, sample values)
+PATHS = {
+    "update form": lambda conn, v: ledger.read_investment(conn, v["investment_id"]),
+    "delete by reference": _rolled_back(lambda conn, v: ledger.delete_by_reference(conn, v["reference"])),
+    "dashboard": lambda conn, v: [summaries.dict_rows(conn, sql) for sql in summaries.DASHBOARD.values()],
+    "upcoming maturities": lambda conn, v: ladder.upcoming(conn),
+}
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+# the tables, and the aliases the queries give them, that must not be scanned
+_TABLES = {"i", "c", "s", "m", "instruments", "cashflows",
+           "summary_monthly", "summary_refs", "maturity_calendar"}
+
+
+def sample_values(conn):
+    """{field: value} of one stored instrument, to fill CASES in with; None for an empty ledger."""
+    row = conn.execute("""
+        SELECT i.bank, i.account_type, IFNULL(i.maturity_date, ''), i.reference_name, c.month_ordinal / 12,
+               i.investment_id
+        FROM instruments i JOIN cashflows c ON c.instrument_id = i.id
+        WHERE i.maturity_date != '' AND i.reference_name != ''
+        LIMIT 1
+    """).fetchone()
+    if row is None:
+        return None
+    bank, account_type, maturity_date, reference_name, year, investment_id = row
+    return {"bank": bank, "account_type": account_type, "maturity_date": maturity_date,
+            "reference_name": reference_name.split()[0], "year": year,
+            "reference": reference_name, "investment_id": investment_id}
+
+
+def traced(conn, call):
+    """SELECT, UPDATE and DELETE statements, with parameters bound, that ``call()`` runs on ``conn``."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    # trigger steps are traced with their outer statement's text; keep it once
+    return [s for s in dict.fromkeys(statements) if s.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE"))]
+
+
+def full_scans(conn, sql, params=()):
+    """The plan steps of ``sql`` that scan a ledger or summary table without an index."""
+    steps = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    return [step for step in steps
+            if (match := _FULL_SCAN.match(step)) and match.group(1) in _TABLES]
+
+
+def check(conn, page_size=records.DEFAULT_PAGE_SIZE):
+    """[(case, statement, plan step)] for every full scan in the checked queries."""
+    values = sample_values(conn)
+    if values is None:
+        return []
+    problems = []
+
+    def report(case, statements):
+        for sql, params in statements:
+            problems.extend((case, " ".join(sql.split()), step) for step in full_scans(conn, sql, params))
+
+    for case, template in CASES.items():
+        filters = {field: value.format(**values) for field, value in template.items()}
+
+        def run():
+            _, cursor = records.fetch_page(conn, filters, None, page_size)
+            if cursor:
+                records.fetch_page(conn, filters, cursor, page_size)
+            records.monthly_totals(conn, filters)
+
+        report(case, [(sql, ()) for sql in traced(conn, run)])
+    for case, call in PATHS.items():
+        report(case, [(sql, ()) for sql in traced(conn, lambda: call(conn, values))])
+    report("maturity sweep", [(maturity.NEXT_MATURITY, ()),
+                              (maturity.CLOSE_MATURED, (date.today().isoformat(),))])
+    return problems
@@ -0,0 +1,230 @@
+import base64
+import json
+
+import ledger
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+FILTER_FIELDS = ("bank", "account_type", "saving_invested", "status", "year",
+                 "start_date", "end_date", "unique_only", "q")
+
+# Dropdown-backed fields are matched exactly so the instruments indexes apply;
+# the fixed enumerations are validated up front.
+EQUALITY_FIELDS = ("bank", "account_type", "saving_invested", "status")
+ENUMERATIONS = {
+    "saving_invested": ("Saving", "Invested"),
+    "status": ("Open", "Closed"),
+}
+
+INSTRUMENT_COLUMNS = ("i.id, i.investment_id, i.reference_name, i.bank, i.account_type, "
+                      "i.saving_invested, i.status")
+
+
+def read_filters(args):
+    return {field: args.get(field, "") for field in FILTER_FIELDS}
+
+
+def parse_year_range(value):
+    """'2025' -> (2025, 2025); '2024-2026' -> (2024, 2026); '' -> None."""
+    value = value.strip()
+    if not value:
+        return None
+    first, _, last = value.partition("-")
+    try:
+        first = int(first)
+        last = int(last) if last.strip() else first
+    except ValueError:
+        raise ValueError(f"invalid year: {value!r}")
+    return min(first, last), max(first, last)
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    words = [w.replace('"', '""') for w in text.split()]
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def _conditions(filters):
+    """WHERE fragments for ``filters``: (instrument_where, instrument_params,
+    cashflow_where, cashflow_params, years)."""
+    where, params = [], []
+    for field in EQUALITY_FIELDS:
+        value = filters.get(field)
+        if not value:
+            continue
+        if field in ENUMERATIONS and value not in ENUMERATIONS[field]:
+            raise ValueError(f"invalid {field}: {value!r}")
+        where.append(f"i.{field} = ?")
+        params.append(value)
+    if filters.get("start_date"):
+        where.append("i.maturity_date >= ?")
+        params.append(filters["start_date"])
+    if filters.get("end_date"):
+        where.append("i.maturity_date <= ?")
+        params.append(filters["end_date"])
+    if filters.get("q") and filters["q"].strip():
+        where.append("i.id IN (SELECT rowid FROM instruments_fts WHERE instruments_fts MATCH ?)")
+        params.append(match_expression(filters["q"]))
+    if filters.get("unique_only"):
+        # first year-row of the first instrument for each reference name
+        where.append("i.id IN (SELECT MIN(id) FROM instruments GROUP BY reference_name)")
+
+    years = parse_year_range(filters.get("year", ""))
+    cashflow_where, cashflow_params = ["1=1"], []
+    if filters.get("unique_only"):
+        cashflow_where.append("c.month_ordinal BETWEEN i.start_year * 12 AND i.start_year * 12 + 11")
+    if years:
+        # a month_ordinal range, so the cashflows primary key bounds the scan
+        cashflow_where.append("c.month_ordinal BETWEEN ? AND ?")
+        cashflow_params += [years[0] * 12, years[1] * 12 + 11]
+
+    return " AND ".join(where) or "1=1", params, " AND ".join(cashflow_where), cashflow_params, years
+
+
+def instrument_conditions(filters):
+    """(where, params) restricting instruments alias ``i`` to ``filters``; ignores the year filter."""
+    where, params, _, _, _ = _conditions(filters)
+    return where, params
+
+
+def filtered_query(filters, extra_where="", extra_params=()):
+    """SELECT of the records-list rows matching ``filters``, unordered. Returns (sql, params).
+
+    Produces the same columns as the investments view but filters instruments
+    and cashflows directly, so each condition can use an index. ``extra_where``
+    is an additional condition on the instruments alias ``i``.
+    """
+    instrument_where, params, cashflow_where, cashflow_params, years = _conditions(filters)
+    if extra_where:
+        instrument_where += f" AND {extra_where}"
+        params = params + list(extra_params)
+    start_year_where, start_year_params = "", []
+    if years:
+        start_year_where = " AND i.start_year BETWEEN ? AND ?"
+        start_year_params = list(years)
+
+    zeros = ", ".join(f"0.0 AS {month}" for month in ledger.MONTHS)
+    query = f"""
+        SELECT {INSTRUMENT_COLUMNS}, c.month_ordinal / 12 AS year, i.maturity_date,
+               {ledger.month_pivot("c")},
+               i.notepad
+        FROM instruments i
+        JOIN cashflows c ON c.instrument_id = i.id
+        WHERE {instrument_where} AND {cashflow_where}
+        GROUP BY i.id, c.month_ordinal / 12
+        UNION ALL
+        SELECT {INSTRUMENT_COLUMNS}, i.start_year AS year, i.maturity_date,
+               {zeros},
+               i.notepad
+        FROM instruments i
+        WHERE {instrument_where}{start_year_where}
+          AND NOT EXISTS (SELECT 1 FROM cashflows c WHERE c.instrument_id = i.id)
+    """
+    return query, params + cashflow_params + params + start_year_params
+
+
+def export_query(filters):
+    """(header, sql, params) for exporting the rows matching ``filters`` in records-list order."""
+    query, params = filtered_query(filters)
+    header = [c.strip() for c in ledger.INVESTMENT_COLUMNS.split(",")]
+    return header, f"SELECT * FROM ({query}) ORDER BY reference_name, year, id", params
+
+def encode_cursor(row):
+    key = [row[2], row[7], row[0]]   # reference_name, year, id
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        reference_name, year, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return reference_name, year, record_id
+
+
+def page_size_arg(value, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def fetch_page(conn, filters, after=None, page_size=DEFAULT_PAGE_SIZE):
+    """One page of the filtered records in (reference_name, year, id) order.
+
+    ``after`` is the cursor of the last row of the previous page. Returns
+    (rows, next_cursor), where next_cursor is None on the last page.
+
+    Rebuilding year-rows from cashflows is the expensive part, so the page is
+    first bounded on instruments alone: only instruments whose reference name
+    is no later than the (page_size + 1)-th one after the cursor are pivoted.
+    If the year filter leaves that short of a full page, the bound is widened.
+    """
+    instrument_where, instrument_params, cashflow_where, cashflow_params, years = _conditions(filters)
+    if cashflow_where != "1=1":
+        # only count instruments that will produce at least one row
+        instrument_where += f"""
+            AND (EXISTS (SELECT 1 FROM cashflows c WHERE c.instrument_id = i.id AND {cashflow_where})
+                 OR (NOT EXISTS (SELECT 1 FROM cashflows c WHERE c.instrument_id = i.id)
+                     AND i.start_year BETWEEN ? AND ?))
+        """
+        instrument_params = instrument_params + cashflow_params + list(years or (-10**6, 10**6))
+    key = decode_cursor(after) if after else None
+    span = page_size + 1
+
+    while True:
+        bound_where, bound_params = instrument_where, list(instrument_params)
+        if key:
+            bound_where += " AND i.reference_name >= ?"
+            bound_params.append(key[0])
+        names = [row[0] for row in conn.execute(
+            f"SELECT i.reference_name FROM instruments i WHERE {bound_where} "
+            f"ORDER BY i.reference_name LIMIT ?",
+            bound_params + [span + 1]
+        )]
+        boundary = names[span] if len(names) > span else None
+
+        # bounding the names on both sides lets the planner pick the
+        # reference_name index over a scan, whatever the other filters are
+        extra, extra_params = ["1=1"], []
+        if names and names[0] is not None:
+            extra.append("i.reference_name >= ?")
+            extra_params.append(names[0])
+        if names and names[-1] is not None:
+            extra.append("i.reference_name <= ?")
+            extra_params.append(names[-1])
+        query, params = filtered_query(filters, " AND ".join(extra), extra_params)
+        query = f"SELECT * FROM ({query}) WHERE 1=1"
+        if key:
+            query += " AND (reference_name, year, id) > (?, ?, ?)"
+            params += list(key)
+        query += " ORDER BY reference_name, year, id LIMIT ?"
+        params.append(page_size + 1)
+        rows = conn.execute(query, params).fetchall()
+
+        if len(rows) > page_size or boundary is None:
+            break
+        span *= 4
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def monthly_totals(conn, filters):
+    """jan..dec totals over every row matching the filters, not just the current page."""
+    instrument_where, params, cashflow_where, cashflow_params, _ = _conditions(filters)
+    totals = [0.0] * 12
+    for month_index, total in conn.execute(f"""
+        SELECT c.month_ordinal % 12, TOTAL(c.amount)
+        FROM instruments i
+        JOIN cashflows c ON c.instrument_id = i.id
+        WHERE {instrument_where} AND {cashflow_where}
+        GROUP BY 1
+    """, params + cashflow_params):
+        totals[month_index] = total
+    return totals
@@ -0,0 +1,112 @@
+"""Production page rendering: compiled-template cache, fragment cache,
+response compression, versioned static assets and a render-time budget.
+
+With RENDER_MODE=production (the default unless FLASK_DEBUG is set)
+templates are compiled once into a bytecode cache shared by every worker
+and never re-checked on disk, and static files requested through
+static_url(), which appends a hash of the file so a changed file gets a
+new URL, are sent with a year-long max-age. fragment() caches pieces of a
+page that are the same for many requests, such as the option dropdowns,
+in the response cache until the data changes. Every HTML or JSON response
+is compressed, and a template that renders slower than TEMPLATE_BUDGET_MS
+is logged; each template's time is in the Server-Timing header.
+"""
+import functools
+import hashlib
+import logging
+import os
+import time
+
+from flask import current_app, g, request, url_for
+from flask.signals import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache, pass_context
+from markupsafe import Markup
+
+import cache
+import compression
+import metrics
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_MS = 50.0
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+@pass_context
+def fragment(context, name, *parts, caller):
+    """Jinja call block rendering its body once per template, ``parts`` and data version:
+
+        {% call fragment("bank_options", filters.bank) %}...{% endcall %}
+
+    The body sees the page's variables but must depend only on ``parts``
+    and on data that bumps the data version (options, instruments).
+    """
+    return Markup(cache.memoize(f"fragment:{context.name}:{name}", lambda: str(caller()), *parts))
+
+
+@functools.lru_cache(maxsize=256)
+def _file_hash(path, mtime):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:10]
+
+
+def static_url(filename):
+    """url_for('static') with a content hash, so the file can be cached for good."""
+    path = os.path.join(current_app.static_folder, filename)
+    return url_for("static", filename=filename, v=_file_hash(path, os.stat(path).st_mtime))
+
+
+# --- render-time budget ---
+
+def _template_started(sender, template, context, **extra):
+    g.setdefault("render_started", []).append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    started = g.get("render_started")
+    if not started:
+        return
+    ms = (time.perf_counter() - started.pop()) * 1000
+    name = template.name or "(string)"
+    g.setdefault("render_times", []).append((name, ms))
+    budget = sender.config["TEMPLATE_BUDGET_MS"]
+    if budget and ms > budget:
+        log.warning("%s rendered in %.1f ms for %s (budget %.0f ms)", name, ms, request.path, budget)
+
+
+def _after_request(response):
+    timings = g.pop("render_times", [])
+    if timings:
+        metrics.add_server_timing(response, ", ".join(
+            f"tpl-{name.replace('.', '-')};dur={ms:.1f}" for name, ms in timings))
+    if (request.endpoint == "static" and request.args.get("v")
+            and current_app.config.get("RENDER_MODE") == "production"):
+        # static_url() gives every version of a file its own URL
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    if current_app.config["COMPRESS"]:
+        compression.compress_response(response, request.accept_encodings)
+    return response
+
+
+def init_app(app):
+    """Apply RENDER_MODE, TEMPLATE_BUDGET_MS and COMPRESS from app.config."""
+    app.config.setdefault("TEMPLATE_BUDGET_MS", DEFAULT_BUDGET_MS)
+    app.config.setdefault("COMPRESS", True)
+    if app.config.get("RENDER_MODE") == "production":
+        app.config["TEMPLATES_AUTO_RELOAD"] = False
+        directory = app.config.get("TEMPLATE_CACHE_DIR")
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+        else:
+            # jinja's own per-user directory, created 0700 and checked for owner
+            # and mode, so another local user can't plant compiled templates
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+    app.jinja_env.globals.update(fragment=fragment, static_url=static_url)
+    app.after_request(_after_request)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_rendered, app)
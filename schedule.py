@@ -0,0 +1,91 @@
+"""Month-by-month deposit schedules for RD, FD and NSC investments.
+
+A schedule is the run of monthly amounts from the first deposit month up to
+and including the maturity month, laid out on a (year x 12) grid in a single
+NumPy pass. to_year_rows() gives the (year, [jan..dec]) rows that
+ledger.write_instrument() stores. NumPy is imported on first use so that
+workers which never write a schedule don't pay for it at startup.
+"""
+import logging
+from datetime import date
+
+import ledger
+
+
+log = logging.getLogger(__name__)
+
+SCHEDULED_TYPES = ("RD", "FD", "NSC")
+
+
+def first_deposit(month_values):
+    """(month_index, amount) of the first positive month, or None."""
+    for index, value in enumerate(month_values):
+        if value > 0:
+            return index, value
+    return None
+
+
+def _maturity_ordinal(maturity_date):
+    if isinstance(maturity_date, str):
+        maturity_date = date.fromisoformat(maturity_date)
+    return ledger.month_ordinal(maturity_date.year, maturity_date.month - 1)
+
+
+def rd_amounts(start_ordinal, end_ordinal, start_value, increment=0.0):
+    """Recurring deposit: start_value, then increment more each month."""
+    import numpy as np
+
+    months = max(end_ordinal - start_ordinal + 1, 0)
+    return start_value + increment * np.arange(months, dtype=float)
+
+
+def fixed_amounts(start_ordinal, end_ordinal, amount):
+    """FD / NSC: the same principal held every month until maturity."""
+    import numpy as np
+
+    months = max(end_ordinal - start_ordinal + 1, 0)
+    return np.full(months, amount, dtype=float)
+
+
+def to_grid(start_ordinal, amounts):
+    """Place ``amounts`` from ``start_ordinal`` on a (years x 12) grid. Returns (first_year, grid)."""
+    import numpy as np
+
+    first_year = start_ordinal // 12
+    if len(amounts) == 0:
+        return first_year, np.zeros((0, 12))
+    last_year = (start_ordinal + len(amounts) - 1) // 12
+    grid = np.zeros((last_year - first_year + 1) * 12)
+    offset = start_ordinal - first_year * 12
+    grid[offset:offset + len(amounts)] = amounts
+    return first_year, grid.reshape(-1, 12)
+
+
+def to_year_rows(start_ordinal, amounts):
+    first_year, grid = to_grid(start_ordinal, amounts)
+    return [(first_year + i, row) for i, row in enumerate(grid.tolist())]
+
+
+def build(account_type, start_year, month_values, maturity_date, increment=0.0):
+    """Year rows for an RD/FD/NSC entered from the form, or None if it has no deposit.
+
+    ``month_values`` are the twelve form amounts for ``start_year``; the first
+    positive one is the opening deposit. The schedule runs through the month of
+    ``maturity_date`` (a date or ISO string).
+    """
+    deposit = first_deposit(month_values)
+    if deposit is None:
+        return None
+    month_index, value = deposit
+    start = ledger.month_ordinal(start_year, month_index)
+    end = _maturity_ordinal(maturity_date)
+
+    if account_type == "RD":
+        amounts = rd_amounts(start, end, value, increment)
+    else:
+        amounts = fixed_amounts(start, end, value)
+
+    rows = to_year_rows(start, amounts)
+    log.debug("%s schedule %d-%02d to %s: %d months, %d year rows",
+              account_type, start_year, month_index + 1, maturity_date, len(amounts), len(rows))
+    return rows
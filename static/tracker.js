@@ -0,0 +1,27 @@
+// Add/update investment form: hide the maturity date for savings accounts and
+// show the monthly increment only for RDs (on pages that have it).
+function toggleMaturityField() {
+  const accountType = document.querySelector('[name="account_type"]');
+  const maturityGroup = document.getElementById("maturity-group");
+  const maturityInput = document.querySelector('[name="maturity_date"]');
+  const savingInvested = document.querySelector('[name="saving_invested"]');
+  const rdIncrementGroup = document.getElementById("rd-increment-group");
+
+  if (accountType.value.toLowerCase() === "savings") {
+    maturityGroup.style.display = "none";
+    maturityInput.required = false;
+    savingInvested.value = "Saving";
+  } else {
+    maturityGroup.style.display = "block";
+    maturityInput.required = true;
+    savingInvested.value = "Invested";
+  }
+  if (rdIncrementGroup) {
+    rdIncrementGroup.style.display = accountType.value === "RD" ? "block" : "none";
+  }
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+  toggleMaturityField();
+  document.querySelector('[name="account_type"]').addEventListener("change", toggleMaturityField);
+});
@@ -0,0 +1,87 @@
+"""Read queries behind the dashboard and bank summary.
+
+Shared by the HTML pages and the /api/v1 endpoints so both always report
+the same numbers. Each query reads the summary tables or instruments only.
+"""
+import ledger
+
+
+DASHBOARD = {
+    # Open unique FD/RD/NSC count per bank
+    "open_unique": """
+        SELECT bank, account_type, COUNT(*) AS open_unique_count
+        FROM summary_refs
+        WHERE account_type IN ('FD', 'RD', 'NSC')
+          AND status = 'Open'
+        GROUP BY bank, account_type
+        ORDER BY bank, account_type
+    """,
+    # totals across all banks
+    "totals": """
+        SELECT account_type, COUNT(DISTINCT reference_name) AS total_count
+        FROM summary_refs
+        WHERE status = 'Open'
+        GROUP BY account_type
+    """,
+    # Savings totals by month, aggregated across all banks, grouped by year
+    "savings_monthly": f"""
+        SELECT s.month_ordinal / 12 AS year,
+               {ledger.month_pivot("s", "total")}
+        FROM summary_monthly s
+        WHERE s.account_type = 'Savings'
+        GROUP BY year
+        ORDER BY year
+    """,
+    # Invested totals by month, aggregated across all banks, grouped by year
+    "invested_monthly": f"""
+        SELECT s.month_ordinal / 12 AS year,
+               {ledger.month_pivot("s", "total")}
+        FROM summary_monthly s
+        WHERE s.saving_invested = 'Invested'
+        GROUP BY year
+        ORDER BY year
+    """,
+}
+
+BANK_SUMMARY = {
+    # Total saving by bank and year
+    "saving": """
+        SELECT bank, month_ordinal / 12 AS year,
+               SUM(total) AS total_saving
+        FROM summary_monthly
+        WHERE saving_invested = 'Saving'
+        GROUP BY bank, year
+    """,
+    # Total investment by bank and year
+    "invested": """
+        SELECT bank, month_ordinal / 12 AS year,
+               SUM(total) AS total_investment
+        FROM summary_monthly
+        WHERE saving_invested = 'Invested'
+        GROUP BY bank, year
+    """,
+    # Totals for one calendar month (0 = jan) of every year; takes the month index
+    "current": """
+        SELECT bank, month_ordinal / 12 AS year,
+               SUM(total) AS current_month_total
+        FROM summary_monthly
+        WHERE month_ordinal % 12 = ?
+        GROUP BY bank, year
+    """,
+}
+
+def _dict_factory(cursor, row):
+    return {d[0]: value for d, value in zip(cursor.description, row)}
+
+
+def dict_rows(conn, sql, params=()):
+    """Execute ``sql`` and return its rows as dicts, for the templates."""
+    cursor = conn.cursor()
+    cursor.row_factory = _dict_factory
+    return cursor.execute(sql, params).fetchall()
+
+
+def run(conn, sql, params=()):
+    """Execute ``sql`` and return (column_names, rows)."""
+    cursor = conn.execute(sql, params)
+    return [d[0] for d in cursor.description], cursor.fetchall()
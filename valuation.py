@@ -0,0 +1,153 @@
+"""Accrued and projected maturity values for the open RD/FD/NSC book.
+
+Every deposit is treated as made on the 1st of its month. For an RD each
+stored month is a deposit; for an FD/NSC the stored months repeat the same
+principal, so only the first month is deposited. A deposit grows as
+
+    amount * (1 + rate / n) ** (n * years)        n compounding periods a year
+    amount * (1 + rate * years)                   simple interest (n = 0)
+
+with ``years`` counted in days / 365 up to the as-of date (accrued value) or
+the maturity date (maturity value). value_book() evaluates the whole book in
+one NumPy pass over all deposits. NumPy is imported on first use, as in
+schedule.py.
+"""
+from datetime import date
+from itertools import chain
+
+from schedule import SCHEDULED_TYPES
+
+
+DAYS_PER_YEAR = 365.0
+# periods per year used when an instrument has no compounding set
+DEFAULT_COMPOUNDING = {"FD": 4, "RD": 4, "NSC": 1}
+COMPOUNDING_CHOICES = [(0, "Simple"), (1, "Yearly"), (2, "Half-yearly"), (4, "Quarterly"), (12, "Monthly")]
+
+COLUMNS = ["investment_id", "reference_name", "bank", "account_type", "interest_rate", "compounding",
+           "maturity_date", "principal", "accrued_value", "interest_earned", "maturity_value"]
+
+SCHEDULED_IN = ", ".join(f"'{t}'" for t in SCHEDULED_TYPES)
+
+INSTRUMENTS_QUERY = f"""
+    SELECT id, investment_id, reference_name, bank, account_type,
+           IFNULL(interest_rate, 0), compounding, maturity_date
+    FROM instruments
+    WHERE status = 'Open' AND account_type IN ({SCHEDULED_IN})
+    ORDER BY id
+"""
+# RD: every stored month is a deposit. FD/NSC: only the first month is; the
+# MIN() lookup and the join both resolve on the cashflows primary key.
+DEPOSITS_QUERY = f"""
+    SELECT c.instrument_id, c.month_ordinal, c.amount
+    FROM instruments i
+    JOIN cashflows c ON c.instrument_id = i.id
+    WHERE i.status = 'Open' AND i.account_type = 'RD'
+    UNION ALL
+    SELECT c.instrument_id, c.month_ordinal, c.amount
+    FROM instruments i
+    JOIN cashflows c ON c.instrument_id = i.id
+     AND c.month_ordinal = (SELECT MIN(month_ordinal) FROM cashflows WHERE instrument_id = i.id)
+    WHERE i.status = 'Open' AND i.account_type IN ({SCHEDULED_IN}) AND i.account_type != 'RD'
+"""
+
+
+def growth(amounts, rates, periods, years):
+    """Value of ``amounts`` after ``years`` at annual ``rates`` (fractions)."""
+    import numpy as np
+
+    years = np.maximum(years, 0.0)
+    compound = periods > 0
+    n = np.where(compound, periods, 1)
+    factor = np.where(compound, (1.0 + rates / n) ** (n * years), 1.0 + rates * years)
+    return amounts * factor
+
+
+def _parse_dates(values):
+    import numpy as np
+
+    parsed = []
+    for value in values:
+        try:
+            parsed.append(date.fromisoformat(value))
+        except (TypeError, ValueError):
+            parsed.append(None)
+    return np.array(parsed, dtype="datetime64[D]")
+
+
+def value_book(conn, as_of=None):
+    """Value every open RD/FD/NSC as of ``as_of`` (a date, default today).
+
+    Returns (COLUMNS, rows), one row per instrument. Deposits after ``as_of``
+    count towards the maturity value only; an instrument without a usable
+    maturity date has no maturity value.
+    """
+    instruments = conn.execute(INSTRUMENTS_QUERY).fetchall()
+    deposits = conn.execute(DEPOSITS_QUERY).fetchall()
+    return value_deposits(instruments, deposits, as_of)
+
+
+def value_deposits(instruments, deposits, as_of=None):
+    """value_book() over already-fetched INSTRUMENTS_QUERY and DEPOSITS_QUERY rows."""
+    import numpy as np
+
+    as_of = np.datetime64(as_of or date.today(), "D")
+    if not instruments:
+        return COLUMNS, []
+
+    ids, investment_ids, names, banks, types, rates, compounding, maturities = zip(*instruments)
+    ids = np.array(ids)
+    periods = np.array([c if c is not None else DEFAULT_COMPOUNDING.get(t, 1)
+                        for c, t in zip(compounding, types)], dtype=float)
+    rates = np.array(rates, dtype=float) / 100.0
+    maturity = _parse_dates(maturities)
+
+    deposits = np.fromiter(chain.from_iterable(deposits), dtype=float, count=3 * len(deposits)).reshape(-1, 3)
+    # map each deposit to its instrument row; drop any written in between the two queries
+    owner = np.minimum(np.searchsorted(ids, deposits[:, 0]), len(ids) - 1)
+    deposits, owner = deposits[ids[owner] == deposits[:, 0]], owner[ids[owner] == deposits[:, 0]]
+    ordinals = deposits[:, 1].astype(np.int64)
+    amounts = deposits[:, 2]
+    deposited_on = (((ordinals // 12 - 1970) * 12 + ordinals % 12)
+                    .astype("datetime64[M]").astype("datetime64[D]"))
+    matures_on = maturity[owner]
+
+    made = deposited_on <= as_of
+    accrue_until = np.where(np.isnat(matures_on), as_of, np.minimum(as_of, matures_on))
+    years_accrued = (accrue_until - deposited_on).astype(float) / DAYS_PER_YEAR
+    years_to_maturity = np.nan_to_num((matures_on - deposited_on).astype(float) / DAYS_PER_YEAR)
+    deposit_rates, deposit_periods = rates[owner], periods[owner]
+
+    size = len(ids)
+    principal = np.bincount(owner, weights=np.where(made, amounts, 0.0), minlength=size)
+    accrued = np.bincount(owner, minlength=size, weights=np.where(
+        made, growth(amounts, deposit_rates, deposit_periods, years_accrued), 0.0))
+    at_maturity = np.bincount(owner, minlength=size, weights=growth(
+        amounts, deposit_rates, deposit_periods, years_to_maturity))
+    at_maturity[np.isnat(maturity)] = np.nan
+    interest = np.round(accrued - principal, 2)
+    principal, accrued, at_maturity = (np.round(a, 2) for a in (principal, accrued, at_maturity))
+
+    rows = [
+        (investment_id, name, bank, account_type, rate, int(n), matures, p, a, earned, None if m != m else m)
+        for investment_id, name, bank, account_type, rate, n, matures, p, a, earned, m in zip(
+            investment_ids, names, banks, types, (rates * 100).round(4).tolist(), periods.tolist(),
+            maturities, principal.tolist(), accrued.tolist(), interest.tolist(), at_maturity.tolist())
+    ]
+    return COLUMNS, rows
+
+
+def totals_by(rows, key="account_type"):
+    """Sum principal, accrued, interest and maturity value per ``key``, sorted by key."""
+    index = COLUMNS.index(key)
+    totals = {}
+    for row in rows:
+        entry = totals.setdefault(row[index], {key: row[index], "count": 0, "principal": 0.0,
+                                               "accrued_value": 0.0, "interest_earned": 0.0,
+                                               "maturity_value": 0.0})
+        entry["count"] += 1
+        entry["principal"] += row[7]
+        entry["accrued_value"] += row[8]
+        entry["interest_earned"] += row[9]
+        entry["maturity_value"] += row[10] or 0.0
+    return [{k: round(v, 2) if isinstance(v, float) else v for k, v in entry.items()}
+            for _, entry in sorted(totals.items(), key=lambda item: str(item[0]))]